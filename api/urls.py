@@ -13,4 +13,3 @@ urlpatterns = [
     path('reports/create/', MonthlyReportCreateView.as_view(), name='report-create'),
 ]
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
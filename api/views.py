@@ -69,7 +69,7 @@ class MonthlyReportListView(generics.ListAPIView):
         queryset = MonthlyReport.objects.select_related('user')
         if user.is_superuser:
             return queryset
-        elif user.groups.filter(name='Managers').exists():
+        elif user.has_manager_access:
             return queryset.filter(
                 Q(user=user) | Q(user__teams__in=user.managed_teams.all())
             )
@@ -1,14 +1,21 @@
 from django.contrib import admin
-from .models import Activity, Species, Habitat, MonitoringRecord
+from .models import Activity, ClosureDay, Species, Habitat, MonitoringRecord
 
 
 class ActivityAdmin(admin.ModelAdmin):
-    list_display = ('group', 'subgroup', 'name', 'code')
-    list_filter = ('code',)
+    list_display = ('group', 'subgroup', 'name', 'code', 'leave_category')
+    list_filter = ('code', 'leave_category')
     search_fields = ('group', 'subgroup', 'code', 'name')
+    ordering = ('sort_key',)
+
+
+class ClosureDayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name')
+    date_hierarchy = 'date'
 
 
 admin.site.register(Activity, ActivityAdmin)
+admin.site.register(ClosureDay, ClosureDayAdmin)
 admin.site.register(Species)
 admin.site.register(Habitat)
 admin.site.register(MonitoringRecord)
\ No newline at end of file
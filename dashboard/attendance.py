@@ -0,0 +1,151 @@
+"""
+Monthly attendance matrix (pontaj) shared by the HTML table, the PDF and the XLSX export.
+
+Each employee's month is folded from the UserDayTotal rollup into a stored
+MonthlyAttendance row the first time it is requested. Rows are deleted again by
+invalidate_attendance() once a change to one of their days commits, so a request
+only recomputes the employees and months that were edited since the last view.
+
+A request computing rows races with those changes: it may read the totals just
+before one commits and store its rows just after they were invalidated. Every
+invalidation therefore first moves a generation number in the cache, and a
+request deletes the rows it stored when the generation moved while it computed
+them.
+"""
+import calendar
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.core.cache import cache
+
+from dashboard.models import LeaveCategory, MonthlyAttendance
+from timesheet.models import UserDayTotal
+from timesheet.periods import month_filter
+from timesheet.workcalendar import work_year
+
+GENERATION_KEY = 'attendance:generation'
+LEAVE_CODES = {LeaveCategory.CO: 'CO', LeaveCategory.CM: 'CM', LeaveCategory.EF: 'EF'}
+RO_DAYS_SHORT = ["L", "M", "M", "J", "V", "S", "D"]
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        seed = time.time_ns()
+        cache.add(GENERATION_KEY, seed, None)
+        generation = cache.get(GENERATION_KEY, seed)
+    return generation
+
+
+def month_days(year, month):
+    """
+    Column headers of the matrix and the number of working days (weekdays that
+    are neither public holidays nor closure days) used for the norm.
+    """
+    calendar_year = work_year(year)
+    days = []
+    for d in range(1, calendar.monthrange(year, month)[1] + 1):
+        current_date = date(year, month, d)
+        days.append({
+            'day_num': d,
+            'day_letter': RO_DAYS_SHORT[current_date.weekday()],
+            'is_weekend': current_date.weekday() >= 5,
+            'is_holiday': calendar_year.is_day_off(current_date),
+            'holiday_name': calendar_year.day_name(current_date),
+        })
+    return days, calendar_year.working_days(month)
+
+
+def build_attendance(day_totals):
+    """Folds one employee's UserDayTotal rows of a month into MonthlyAttendance field values"""
+    days = {}
+    total_minutes = 0
+    worked_days = set()
+    leave_days = {code: set() for code in LEAVE_CODES.values()}
+
+    for day_total in day_totals:
+        day_number = day_total.date.day
+        if day_total.worked_minutes:
+            total_minutes += day_total.worked_minutes
+            # Track this day as a worked day for meal ticket eligibility
+            worked_days.add(day_number)
+            days[str(day_number)] = {'type': 'work', 'hours': day_total.worked_minutes}
+        if day_total.is_leave:
+            code = LEAVE_CODES[day_total.leave_category]
+            days[str(day_number)] = {'type': code, 'hours': code}
+            leave_days[code].add(day_number)
+
+    return {
+        'days': days,
+        'total_minutes': total_minutes,
+        'co_days': len(leave_days['CO']),
+        'cm_days': len(leave_days['CM']),
+        'ef_days': len(leave_days['EF']),
+        'meal_tickets': len(worked_days - leave_days['CO'] - leave_days['CM']),
+    }
+
+
+def get_attendance_matrix(year, month, employees, working_days):
+    """
+    Rows of the pontaj for the given employees, in the order received. Stored rows
+    are reused; missing ones are computed from the daily totals in one query and saved.
+    """
+    employees = list(employees)
+    stored = {
+        a.user_id: a
+        for a in MonthlyAttendance.objects.filter(year=year, month=month, user__in=employees)
+    }
+
+    missing = [emp.pk for emp in employees if emp.pk not in stored]
+    if missing:
+        generation = current_generation()
+        totals_by_user = defaultdict(list)
+        for day_total in UserDayTotal.objects.filter(user_id__in=missing, **month_filter(year, month)):
+            totals_by_user[day_total.user_id].append(day_total)
+        computed = [
+            MonthlyAttendance(user_id=user_id, year=year, month=month, **build_attendance(totals_by_user[user_id]))
+            for user_id in missing
+        ]
+        MonthlyAttendance.objects.bulk_create(computed, ignore_conflicts=True)
+        if current_generation() != generation:
+            # A change committed meanwhile may predate the totals read: recomputed next time
+            MonthlyAttendance.objects.filter(year=year, month=month, user_id__in=missing).delete()
+        stored.update((a.user_id, a) for a in computed)
+
+    # Standard Romanian Norm setup subtracting statutory bank holidays
+    norma_hours = working_days * 8
+    rows = []
+    for emp in employees:
+        attendance = stored[emp.pk]
+        rows.append({
+            'employee': emp,
+            'norma_hours': norma_hours,
+            'norma_minutes': norma_hours * 60,
+            'days_matrix': attendance.days,
+            'total_hours_worked': round(attendance.total_minutes / 60, 1),
+            'total_minutes_worked': attendance.total_minutes,
+            'total_co_days': attendance.co_days,
+            'total_cm_days': attendance.cm_days,
+            'total_ef_days': attendance.ef_days,
+            'meal_tickets_count': attendance.meal_tickets,
+        })
+    return rows
+
+
+def invalidate_attendance(days):
+    """Drops the stored months containing the given (user_id, date) pairs; None drops everything"""
+    # First, so a request storing rows concurrently sees that they may be stale
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+    if days is None:
+        MonthlyAttendance.objects.all().delete()
+        return
+
+    users_by_month = defaultdict(set)
+    for user_id, day in days:
+        users_by_month[(day.year, day.month)].add(user_id)
+    for (year, month), user_ids in users_by_month.items():
+        MonthlyAttendance.objects.filter(year=year, month=month, user_id__in=user_ids).delete()
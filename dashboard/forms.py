@@ -15,8 +15,9 @@ class PALActivitiesUploadForm(forms.Form):
 class PALActivityForm(forms.ModelForm):
     class Meta:
         model = Activity
-        fields = ['code', 'name']
+        fields = ['code', 'name', 'leave_category']
         widgets = {
+            'leave_category': forms.Select(attrs={'class': 'form-control'}),
             'code': forms.TextInput(
                 attrs={'class': 'form-control', 'placeholder': _('Insert activity code')}
             ),
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.models import Activity, natural_sort_key
+from timesheet.reference import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Fills Activity.sort_key (the natural-sort form of the code) for activities saved before it existed'
+
+    def handle(self, *args, **options):
+        changed = []
+        for activity in Activity.objects.only('pk', 'code', 'sort_key'):
+            key = natural_sort_key(activity.code)
+            if activity.sort_key != key:
+                activity.sort_key = key
+                changed.append(activity)
+
+        Activity.objects.bulk_update(changed, ['sort_key'], batch_size=500)
+        if changed:
+            # bulk_update() sends no signals
+            bump_version()
+        self.stdout.write(self.style.SUCCESS(f"Updated the sort key of {len(changed)} activities."))
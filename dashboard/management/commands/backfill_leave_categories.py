@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboard.models import Activity, LeaveCategory, classify_leave
+from timesheet.reference import bump_version
+from timesheet.rollups import refresh_activity_days
+
+
+class Command(BaseCommand):
+    help = 'Fills Activity.leave_category from the activity code/name and refreshes the affected day totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the activities that would change')
+
+    def handle(self, *args, **options):
+        changed = defaultdict(list)
+        for pk, code, name, current in Activity.objects.values_list('pk', 'code', 'name', 'leave_category'):
+            category = classify_leave(code, name)
+            if category != current:
+                changed[category].append(pk)
+                self.stdout.write(f"{code} - {name}: {LeaveCategory(category).label}")
+
+        total = sum(len(pks) for pks in changed.values())
+        if options['dry_run'] or not total:
+            self.stdout.write(self.style.SUCCESS(f"{total} activities need a new leave category."))
+            return
+
+        with transaction.atomic():
+            for category, pks in changed.items():
+                Activity.objects.filter(pk__in=pks).update(leave_category=category)
+            refresh_activity_days([pk for pks in changed.values() for pk in pks])
+        # update() sends no signals
+        bump_version()
+
+        self.stdout.write(self.style.SUCCESS(f"Updated the leave category of {total} activities."))
@@ -1,3 +1,5 @@
+import re
+
 from django.db import models
 import datetime as dt
 from django.utils import timezone
@@ -32,6 +34,46 @@ class ActivityProgram(models.Model):
 #     def __str__(self):
 #         return f"{self.group.name} - {self.name}"
 
+class LeaveCategory(models.IntegerChoices):
+    """What kind of day an activity books: regular work or one of the leave types"""
+    WORK = 0, 'Activitate'
+    CO = 1, 'Concediu de odihnă'
+    CM = 2, 'Concediu medical'
+    EF = 3, 'Eveniment familial'
+
+
+# When a day holds several leave types, the first one listed wins
+LEAVE_PRECEDENCE = (LeaveCategory.CO, LeaveCategory.CM, LeaveCategory.EF)
+
+
+def classify_leave(code, name):
+    """
+    Maps an activity code/name to a LeaveCategory using the pontaj naming rules.
+    Only used to fill Activity.leave_category; everything else reads the stored field.
+    """
+    code = (code or "").upper()
+    name = (name or "").upper()
+    if code == "CO" or any(x in name for x in ("ODIHNA", "ODIHNĂ", "CONCEDIU ANUAL")):
+        return LeaveCategory.CO
+    if code == "CM" or any(x in name for x in ("MEDICAL", "BOALA")):
+        return LeaveCategory.CM
+    if code == "EF" or "FAMILIAL" in name:
+        return LeaveCategory.EF
+    return LeaveCategory.WORK
+
+
+# Width numbers are padded to in Activity.sort_key
+SORT_KEY_DIGITS = 8
+_NUMBERS = re.compile(r'(\d+)')
+
+
+def natural_sort_key(code):
+    """Code with its numbers zero-padded, so SQL orders '1.2' before '1.10' (like natsort)"""
+    return ''.join(
+        part.zfill(SORT_KEY_DIGITS) if part.isdigit() else part for part in _NUMBERS.split((code or '').strip())
+    )
+
+
 class Activity(models.Model):
     group = models.CharField(max_length=200, verbose_name="Program")
     subgroup = models.CharField(max_length=200, verbose_name="Subprogram")
@@ -45,6 +87,11 @@ class Activity(models.Model):
                                      ('RC', 'Responsabil Comunități'),
                                      ('SP', 'Șef Pază'),
                                  ])
+    leave_category = models.PositiveSmallIntegerField(
+        choices=LeaveCategory.choices, default=LeaveCategory.WORK, db_index=True, verbose_name="Tip zi"
+    )
+    # natural_sort_key(code), maintained by save()
+    sort_key = models.CharField(max_length=200, blank=True, db_index=True, editable=False)
 
     class Meta:
         verbose_name = "Activity"
@@ -53,6 +100,69 @@ class Activity(models.Model):
     def __str__(self):
         return f"{self.code} - {self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the timesheet signals refresh the day totals when the category changes
+        instance._loaded_leave_category = instance.__dict__.get('leave_category')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # New activities without an explicit category are classified by name, like the backfill
+        if self._state.adding and self.leave_category == LeaveCategory.WORK:
+            self.leave_category = classify_leave(self.code, self.name)
+        self.sort_key = natural_sort_key(self.code)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'code' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'sort_key'}
+        super().save(*args, **kwargs)
+
+    @property
+    def is_leave(self):
+        return self.leave_category != LeaveCategory.WORK
+
+class MonthlyAttendance(models.Model):
+    """
+    Materialized pontaj row: one employee's attendance for one month, computed by
+    dashboard.attendance from the daily totals and dropped whenever one of those days changes.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_attendance')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    # {"<day>": {"type": "work" | "CO" | "CM" | "EF", "hours": <minutes> | "<type>"}}, only for days with entries
+    days = models.JSONField(default=dict)
+    total_minutes = models.PositiveIntegerField(default=0)
+    co_days = models.PositiveSmallIntegerField(default=0)
+    cm_days = models.PositiveSmallIntegerField(default=0)
+    ef_days = models.PositiveSmallIntegerField(default=0)
+    meal_tickets = models.PositiveSmallIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Monthly attendance"
+        verbose_name_plural = "Monthly attendance"
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month', 'user'], name='unique_monthly_attendance'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.year}-{self.month:02d}"
+
+
+class ClosureDay(models.Model):
+    """Day off decided by the organisation (bridge days, internal holidays) on top of the legal holidays"""
+    date = models.DateField(unique=True, verbose_name="Data")
+    name = models.CharField(max_length=200, verbose_name="Motiv")
+
+    class Meta:
+        verbose_name = "Closure day"
+        verbose_name_plural = "Closure days"
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date:%d.%m.%Y} - {self.name}"
+
+
 class Indicator(models.Model):
     activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='indicators')
     name = models.CharField(max_length=100, verbose_name="Indicator")
@@ -0,0 +1,13 @@
+from functools import partial
+
+from django.db import transaction
+from django.dispatch import receiver
+
+from timesheet.rollups import day_totals_changed
+from .attendance import invalidate_attendance
+
+
+@receiver(day_totals_changed)
+def drop_stale_attendance(sender, days, **kwargs):
+    # Once committed: before, a concurrent request would store the old totals again
+    transaction.on_commit(partial(invalidate_attendance, days))
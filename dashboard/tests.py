@@ -1,3 +1,144 @@
+from datetime import date, time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import translation
+
+from timesheet.models import FundsSource, Timesheet
+from . import attendance
+from .attendance import get_attendance_matrix, month_days
+from timesheet.workcalendar import DayType, standard_day_hours, work_year
+from .models import Activity, ClosureDay, MonthlyAttendance, natural_sort_key
+
+User = get_user_model()
+
+
+class MonthlyAttendanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='ranger@example.com', password='password', is_active=True)
+        self.work = Activity.objects.create(group='G1', subgroup='S1', code='A1', name='Patrulare', responsible='SP')
+        self.leave = Activity.objects.create(group='G1', subgroup='S1', code='CO', name='CONCEDIU ANUAL', responsible='SP')
+        self.funds = FundsSource.objects.create(name='RNP ROMSILVA', description='')
+
+    def make_timesheet(self, day, activity, start=time(8, 0), end=time(16, 0)):
+        return Timesheet.objects.create(user=self.user, date=day, start_time=start, end_time=end,
+                                        activity=activity, fundssource=self.funds)
+
+    def matrix(self):
+        _, working_days = month_days(2025, 3)
+        return get_attendance_matrix(2025, 3, [self.user], working_days)[0]
+
+    def test_matrix_is_stored_and_reused(self):
+        self.make_timesheet(date(2025, 3, 3), self.work)
+        self.make_timesheet(date(2025, 3, 4), self.leave)
+
+        row = self.matrix()
+        self.assertEqual(row['days_matrix']['3'], {'type': 'work', 'hours': 480})
+        self.assertEqual(row['days_matrix']['4']['type'], 'CO')
+        self.assertEqual((row['total_minutes_worked'], row['total_co_days'], row['meal_tickets_count']), (480, 1, 1))
+        self.assertEqual(row['norma_hours'], 21 * 8)
+
+        with self.assertNumQueries(1):
+            self.matrix()
+
+    def test_timesheet_change_invalidates_only_its_month(self):
+        ts = self.make_timesheet(date(2025, 3, 3), self.work)
+        self.matrix()
+        other = MonthlyAttendance.objects.create(user=self.user, year=2025, month=4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ts.end_time = time(12, 0)
+            ts.save()
+        self.assertFalse(MonthlyAttendance.objects.filter(year=2025, month=3).exists())
+        self.assertTrue(MonthlyAttendance.objects.filter(pk=other.pk).exists())
+        self.assertEqual(self.matrix()['total_minutes_worked'], 240)
+
+    def test_rows_computed_across_a_change_are_not_kept(self):
+        ts = self.make_timesheet(date(2025, 3, 3), self.work)
+        build = attendance.build_attendance
+
+        def build_then_change(day_totals):
+            values = build(day_totals)
+            # The change commits between the totals read and the insert
+            with self.captureOnCommitCallbacks(execute=True):
+                Timesheet.objects.filter(pk=ts.pk).update(end_time=time(12, 0), duration_minutes=240)
+            return values
+
+        with mock.patch.object(attendance, 'build_attendance', build_then_change):
+            self.assertEqual(self.matrix()['total_minutes_worked'], 480)
+        self.assertFalse(MonthlyAttendance.objects.exists())
+        self.assertEqual(self.matrix()['total_minutes_worked'], 240)
+
+
+class ActivitySortKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='sef@example.com', password='password', is_active=True, is_staff=True)
+        self.client.force_login(self.user)
+        for code, name, group in [('1.10', 'Inventar', 'Monitorizare'), ('CO', 'Concediu anual', 'Concedii'),
+                                  ('1.2', 'Patrulare', 'Paza'), ('2.1', 'Educatie', 'Comunicare')]:
+            Activity.objects.create(group=group, subgroup='S1', code=code, name=name, responsible='SP')
+
+    def test_sql_order_matches_natural_order(self):
+        self.assertEqual(list(Activity.objects.order_by('sort_key').values_list('code', flat=True)),
+                         ['1.2', '1.10', '2.1', 'CO'])
+        activity = Activity.objects.get(code='2.1')
+        activity.code = '1.9'
+        activity.save(update_fields=['code'])
+        self.assertEqual(Activity.objects.get(pk=activity.pk).sort_key, natural_sort_key('1.9'))
+
+    def test_backfill_command(self):
+        Activity.objects.update(sort_key='')
+        call_command('backfill_activity_sort_keys', stdout=StringIO())
+        self.assertEqual(Activity.objects.get(code='1.10').sort_key, natural_sort_key('1.10'))
+
+    def search(self, query):
+        with translation.override('en'):
+            url = reverse('activity_autocomplete')
+        return [result['text'] for result in self.client.get(url, {'q': query}).json()['results']]
+
+    def test_autocomplete_searches_code_name_and_group(self):
+        self.assertEqual(self.search('1.'), ['1.2 - Patrulare', '1.10 - Inventar'])
+        self.assertEqual(self.search('monitor'), ['1.10 - Inventar'])
+        self.assertEqual(self.search('1 patr'), ['1.2 - Patrulare'])
+
+    def test_pal_list_pages_in_sql(self):
+        with translation.override('en'):
+            url = reverse('pal')
+        response = self.client.get(url)
+        self.assertEqual([a.code for a in response.context['activities']], ['1.2', '1.10', '2.1', 'CO'])
+
+
+class WorkCalendarTests(TestCase):
+    def test_day_types_and_limits(self):
+        year = work_year(2025)
+        self.assertEqual(year.day_type(date(2025, 3, 3)), DayType.WORKING)
+        self.assertEqual(year.day_type(date(2025, 3, 8)), DayType.WEEKEND)
+        self.assertEqual(year.day_type(date(2025, 12, 25)), DayType.HOLIDAY)
+        self.assertTrue(year.day_name(date(2025, 12, 25)))
+        self.assertEqual((year.limit_minutes(date(2025, 3, 7)), year.limit_minutes(date(2025, 3, 6))), (360, 510))
+        self.assertEqual(year.working_days(3), 21)
+        with self.assertNumQueries(0):
+            work_year(2025)
+
+    def test_closure_days_change_the_calendar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            closure = ClosureDay.objects.create(date=date(2025, 3, 14), name='Zi de punte')
+        self.addCleanup(ClosureDay.objects.filter(pk=closure.pk).delete)
+
+        self.assertEqual(work_year(2025).day_type(date(2025, 3, 14)), DayType.CLOSURE)
+        days, working_days = month_days(2025, 3)
+        self.assertEqual(working_days, 20)
+        self.assertEqual((days[13]['is_holiday'], days[13]['holiday_name']), (True, 'Zi de punte'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            closure.delete()
+        self.assertEqual(work_year(2025).working_days(3), 21)
 
-# Create your tests here.
+    def test_standard_day_follows_the_daily_limits(self):
+        # Monday to Friday of one week: four 8h30 days and a 6h Friday
+        self.assertEqual(standard_day_hours(date(2025, 3, 3), date(2025, 3, 9)), (4 * 8.5 + 6) / 5)
+        self.assertEqual(standard_day_hours(date(2025, 3, 8), date(2025, 3, 9)), 8.5)
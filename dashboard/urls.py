@@ -2,11 +2,11 @@ from django.urls import path, include
 from django.conf import settings
 from .views import automated_task_runner, ActivityProgramCreateView, ActivityProgramListView, ActivityProgramUpdateView, ActivityProgramDeleteView, PALActivityCreateView, dashboard, AnalyticsView, \
     worked_hours_per_member, yearly_statistics, activity_program, PALActivitiesListView, PALActivityUpdateView, PALActivityDeleteView, PALActivitiesUploadView, \
-    FundsSourceListView, NewFundsSourceView, HoursSummaryTableView
+    FundsSourceListView, NewFundsSourceView, HoursSummaryTableView, ActivityAutocompleteView
 from .utils import upload_activities
 from django.conf.urls.static import static
 from django.utils.translation import gettext_lazy as _
-from .views import TimesheetPDFView
+from .views import TimesheetPDFView, TimesheetXLSXView
 
 
 urlpatterns = [
@@ -14,6 +14,7 @@ urlpatterns = [
     path('dashboard/', dashboard, name="dashboard"),
     path('analytics/', AnalyticsView.as_view(), name="analytics"),
     path('plan-de-lucru-anual/', PALActivitiesListView.as_view(), name="pal"),
+    path('activities/autocomplete/', ActivityAutocompleteView.as_view(), name='activity_autocomplete'),
     path('pal_activity/create/', PALActivityCreateView.as_view(), name='pal_activity_create'),
     path('pal_activity/upload/', PALActivitiesUploadView.as_view(), name='pal_activity_upload'),
     path('pal_activity/<int:pk>/edit/', PALActivityUpdateView.as_view(), name='pal_activity_edit'),
@@ -29,8 +30,8 @@ urlpatterns = [
     path('new_funds_source/', NewFundsSourceView.as_view(), name='new_funds_source'),
     path('tasks/run-reminders/', automated_task_runner, name='task_runner'),
     path('timesheet/pdf/', TimesheetPDFView.as_view(), name='timesheet_pdf'),
+    path('timesheet/xlsx/', TimesheetXLSXView.as_view(), name='timesheet_xlsx'),
     path('hours_summary/', HoursSummaryTableView.as_view(), name='hours_summary'),
 
 ]
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -9,7 +9,7 @@ from django.core.mail import send_mail
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Count
-from timesheet.models import Timesheet
+from timesheet.models import UserDayTotal
 
 
 def upload_activities(request):
@@ -58,10 +58,10 @@ class Command(BaseCommand):
         start_date = today - timedelta(days=7)
         
         # Query: Count distinct dates per user
-        summary = Timesheet.objects.filter(
+        summary = UserDayTotal.objects.filter(
             date__range=[start_date, today - timedelta(days=1)]
         ).values('user__first_name', 'user__last_name', 'user__username').annotate(
-            days_count=Count('date', distinct=True)
+            days_count=Count('id')
         ).order_by('-days_count')
 
         # Build Email Content
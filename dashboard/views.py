@@ -8,19 +8,21 @@ from django.utils import timezone
 
 from timesheets_main import settings
 from .forms import PALActivitiesUploadForm, FundsSourceForm, PALActivityForm
-from django.db.models import Count, Prefetch, Sum, F, ExpressionWrapper, fields, FloatField, Q
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import ExtractMonth
 from django.contrib.auth import get_user_model
 from dashboard.forms import ActivityProgramForm
 from dashboard.models import ActivityProgram
+from dashboard.attendance import get_attendance_matrix, month_days
+from dashboard.templatetags.pontaj_tags import format_minutes_short
 from timesheet.models import Activity, FundsSource
 from users.models import CustomUser
-from timesheet.models import Timesheet
+from timesheet.models import Timesheet, UserDayTotal
 from io import BytesIO
 from django.views import View
 from django.views.generic import CreateView, ListView, TemplateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
-from natsort import natsorted
 import openpyxl
 from django.views.generic import TemplateView
 from django.http import HttpResponse, HttpResponseForbidden
@@ -29,7 +31,6 @@ from datetime import date, datetime, timedelta
 from django.core.mail import send_mail
 from django.db.models import Count
 from timesheet.models import Timesheet
-import holidays
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
@@ -64,8 +65,8 @@ def automated_task_runner(request):
 # Helper functions to keep it clean
 def send_office_weekly_summary(today):
     last_week = today - timedelta(days=7)
-    summary = Timesheet.objects.filter(date__range=[last_week, today - timedelta(days=1)])\
-        .values('user__username').annotate(days=Count('date', distinct=True))
+    summary = UserDayTotal.objects.filter(date__range=[last_week, today - timedelta(days=1)])\
+        .values('user__username').annotate(days=Count('id'))
     
     body = "Weekly Audit:\n" + "\n".join([f"{s['user__username']}: {s['days']} days" for s in summary])
     send_mail("Weekly Summary", body, "system@company.com", ["office@company.com"])
@@ -123,211 +124,146 @@ class PALActivitiesListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         return self.request.user.is_staff or self.request.user.is_superuser
 
     def get_queryset(self):
-        qs = Activity.objects.all()
-        return natsorted(qs, key=lambda x: x.code)
+        # Natural order comes from the stored sort key, so only the current page is fetched
+        return Activity.objects.only('id', 'code', 'name').order_by('sort_key', 'pk')
+
+    def paginate_queryset(self, queryset, page_size):
+        # get_page() falls back to the last page instead of a 404
+        paginator = self.get_paginator(queryset, page_size)
+        page_obj = paginator.get_page(self.request.GET.get('page'))
+        return paginator, page_obj, page_obj.object_list, page_obj.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        queryset = self.get_queryset()
-        
-        paginator = Paginator(queryset, self.paginate_by)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-
-        context['activities'] = page_obj
-        context['object_list'] = page_obj
-        context['page_obj'] = page_obj
-        context['is_paginated'] = page_obj.has_other_pages()
-        
+        context['activities'] = context['page_obj']
         return context
 
 
+class ActivityAutocompleteView(LoginRequiredMixin, View):
+    """
+    Typeahead over the PAL activities: every word of ?q= must prefix the code or
+    appear in the name or group. Returns {"results": [{"id", "text"}]} in natural code order.
+    """
+    limit = 20
+
+    def get(self, request, *args, **kwargs):
+        activities = Activity.objects.order_by('sort_key', 'pk')
+        for word in request.GET.get('q', '').split():
+            activities = activities.filter(
+                Q(code__istartswith=word) | Q(name__icontains=word) | Q(group__icontains=word)
+            )
+        results = [
+            {'id': pk, 'text': f"{code} - {name}"}
+            for pk, code, name in activities.values_list('pk', 'code', 'name')[:self.limit]
+        ]
+        return JsonResponse({'results': results})
+
+
 User = get_user_model()
 
-class HoursSummaryTableView(LoginRequiredMixin, TemplateView):
+RO_MONTHS = {
+    1: "Ianuarie", 2: "Februarie", 3: "Martie", 4: "Aprilie",
+    5: "Mai", 6: "Iunie", 7: "Iulie", 8: "August",
+    9: "Septembrie", 10: "Octombrie", 11: "Noiembrie", 12: "Decembrie"
+}
+
+
+class AttendanceMatrixMixin:
+    """Period parsing and employee scoping shared by the HTML, PDF and XLSX pontaj"""
+
+    def get_period(self):
+        # Parse selected period or default to current month
+        selected_period = self.request.GET.get('selected_period') or datetime.now().strftime('%Y-%m')
+        try:
+            year, month = map(int, selected_period.split('-'))
+            date(year, month, 1)
+        except ValueError:
+            now = datetime.now()
+            year, month = now.year, now.month
+        return year, month
+
+    def get_employees(self):
+        user = self.request.user
+        if user.has_manager_access:
+            employees = User.objects.filter(is_active=True)
+        else:
+            employees = User.objects.filter(pk=user.pk)
+        return employees.order_by('last_name', 'first_name')
+
+    def get_attendance(self):
+        year, month = self.get_period()
+        days, working_days = month_days(year, month)
+        rows = get_attendance_matrix(year, month, self.get_employees(), working_days)
+        return year, month, days, rows
+
+
+class HoursSummaryTableView(LoginRequiredMixin, AttendanceMatrixMixin, TemplateView):
     template_name = "dashboard/hours_summary.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        request = self.request
-        
-        # Parse selected period or default to current month
-        period_query = request.GET.get('selected_period')
-        if not period_query:
-            current_date = datetime.now()
-            period_query = current_date.strftime('%Y-%m')
-
-        # Split into numerical items
-        year, month = map(int, period_query.split('-'))
-
-        # Instantiate Romanian Public Holidays rules engine for this target year
-        ro_holidays = holidays.Romania(years=year)
-
-        # Month names for display
-        ro_months = {
-            1: "Ianuarie", 2: "Februarie", 3: "Martie", 4: "Aprilie",
-            5: "Mai", 6: "Iunie", 7: "Iulie", 8: "August",
-            9: "Septembrie", 10: "Octombrie", 11: "Noiembrie", 12: "Decembrie"
-        }
-        ro_days_short = ["L", "M", "M", "J", "V", "S", "D"]
-
-        # Compute structural day lists for selected calendar space
-        num_days = calendar.monthrange(year, month)[1]
-        month_days_list = []
-        
-        # Track valid baseline legal working days for the contract type norm math
-        actual_working_days_count = 0
-        
-        for d in range(1, num_days + 1):
-            current_date = date(year, month, d)
-            weekday_index = calendar.weekday(year, month, d)
-            
-            is_weekend = weekday_index in [5, 6]
-            is_holiday = current_date in ro_holidays
-            holiday_name = ro_holidays.get(current_date, "") if is_holiday else ""
-
-            if not is_weekend and not is_holiday:
-                actual_working_days_count += 1
-
-            month_days_list.append({
-                'day_num': d,
-                'day_letter': ro_days_short[weekday_index],
-                'is_weekend': is_weekend,
-                'is_holiday': is_holiday,
-                'holiday_name': holiday_name
-            })
-
-        context['current_period'] = period_query
-        context['current_month_year'] = f"{ro_months[month]} {year}"
-        context['month_days'] = month_days_list
-
-        if request.user.is_staff or request.user.groups.filter(name='Managers').exists():
-            employees = User.objects.filter(is_active=True).order_by('first_name', 'last_name')
-        else:
-            pass
+        year, month, days, rows = self.get_attendance()
 
-        monthly_timesheets = Timesheet.objects.filter(
-            date__year=year, 
-            date__month=month
-        ).select_related('activity')
+        context['current_period'] = f"{year}-{month:02d}"
+        context['current_month_year'] = f"{RO_MONTHS[month]} {year}"
+        context['month_days'] = days
+        context['employee_data'] = rows
+        return context
 
-        employees = employees.prefetch_related(
-            Prefetch('timesheet_set', queryset=monthly_timesheets, to_attr='cached_month_timesheets')
-        )
 
-        employee_data = []
-        
-        for emp in employees:
-            # Initialize every single day with a default structure
-            days_matrix = {d: {'type': 'none', 'hours': ''} for d in range(1, num_days + 1)}
-            
-            total_hours_worked = 0.0
-            total_minutes_worked = 0
-            total_co_days = 0
-            total_cm_days = 0
-            worked_days_set = set() 
-            co_days_set = set()
-            cm_days_set = set()
-            ef_days_set = set()
-            # Loop through pre-fetched records smoothly
-            cached_sheets = getattr(emp, 'cached_month_timesheets', [])
-            for ts in cached_sheets:
-                day_number = ts.date.day
-                
-                activity_code = ts.activity.code.upper() if (ts.activity and ts.activity.code) else ""
-                activity_name = ts.activity.name.upper() if (ts.activity and ts.activity.name) else ""
-                
-                is_co = (
-                    "CO" == activity_code or 
-                    "ODIHNA" in activity_name or 
-                    "ODIHNĂ" in activity_name or
-                    "CONCEDIU DE ODIHNĂ" in activity_name or
-                    "CONCEDIU ANUAL" in activity_name
-                )
-                
-                is_cm = (
-                    "CM" == activity_code or 
-                    "MEDICAL" in activity_name or
-                    "CONCEDIU MEDICAL" in activity_name or
-                    "BOALA" in activity_name
-                )
-                
-                is_ef = (
-                    "EF" == activity_code or 
-                    "EVENIMENT FAMILIAL" in activity_name or
-                    "FAMILIAL" in activity_name
-                )
-                if is_co:
-                    days_matrix[day_number] = {'type': 'CO', 'hours': 'CO'}
-                    co_days_set.add(day_number)
-                elif is_cm:
-                    days_matrix[day_number] = {'type': 'CM', 'hours': 'CM'}
-                    cm_days_set.add(day_number)
-                elif is_ef:
-                    days_matrix[day_number] = {'type': 'EF', 'hours': 'EF'}
-                    ef_days_set.add(day_number)
+class TimesheetXLSXView(LoginRequiredMixin, AttendanceMatrixMixin, View):
+    """Pontaj export as a spreadsheet, built from the same stored matrix as the HTML table"""
+
+    def get(self, request, *args, **kwargs):
+        year, month, days, rows = self.get_attendance()
+
+        wb = openpyxl.Workbook(write_only=True)
+        sheet = wb.create_sheet(title=f"Pontaj {year}-{month:02d}")
+        sheet.append([f"FOAIE COLECTIVA DE PREZENTA — {RO_MONTHS[month]} {year}"])
+        sheet.append(
+            ["Nr. crt.", "Nume Prenume", "Norma"]
+            + [day['day_num'] for day in days]
+            + ["Total ore", "Zile CO", "Zile CM", "Zile EF", "Tichete Masa"]
+        )
+        sheet.append(["", "", ""] + [day['day_letter'] for day in days])
+
+        for idx, row in enumerate(rows, start=1):
+            emp = row['employee']
+            cells = [idx, f"{emp.last_name} {emp.first_name or emp.username}".strip(), row['norma_hours']]
+            for day in days:
+                cell = row['days_matrix'].get(str(day['day_num']))
+                if not cell:
+                    cells.append("L" if day['is_holiday'] else "")
+                elif cell['type'] == 'work':
+                    cells.append(format_minutes_short(cell['hours']))
                 else:
-                    # Calculate worked hours for this timesheet entry
-                    if hasattr(ts, 'duration_decimal') and ts.duration_decimal is not None:
-                        hours = float(ts.duration_decimal)
-                    elif ts.start_time and ts.end_time:
-                        today_dummy = datetime.today()
-                        dt1 = datetime.combine(today_dummy, ts.start_time)
-                        dt2 = datetime.combine(today_dummy, ts.end_time)
-                        hours = max(0.0, (dt2 - dt1).total_seconds() / 3600.0)
-                    else:
-                        hours = 8.0
-                    minutes = round(hours * 60)  
-                    current_entry = days_matrix[day_number]
-                    if current_entry['type'] == 'work':
-                        existing_minutes = int(current_entry['hours']) if current_entry['hours'] else 0
-                        new_total_minutes = existing_minutes + minutes
-                        days_matrix[day_number]['hours'] = new_total_minutes  # Store as minutes
-                    else:
-                        days_matrix[day_number] = {'type': 'work', 'hours': minutes}
+                    cells.append(cell['type'])
+            cells.extend([
+                format_minutes_short(row['total_minutes_worked']),
+                row['total_co_days'],
+                row['total_cm_days'],
+                row['total_ef_days'],
+                row['meal_tickets_count'],
+            ])
+            sheet.append(cells)
 
-                    total_minutes_worked += minutes
-                    total_hours_worked += hours
-                    # Track this day as a worked day for meal ticket eligibility
-                    worked_days_set.add(day_number)
-            
-            eligible_meal_ticket_days = worked_days_set - co_days_set - cm_days_set
-            # Standard Romanian Norm setup subtracting statutory bank holidays 
-            norma_hours = actual_working_days_count * 8
-            norma_minutes = norma_hours * 60
-            employee_data.append({
-                'employee': emp,
-                'norma_hours': norma_hours,
-                'norma_minutes': norma_minutes,
-                'days_matrix': days_matrix,  
-                'total_hours_worked': round(total_hours_worked, 1),
-                'total_minutes_worked': total_minutes_worked,
-                'total_co_days': len(co_days_set),
-                'total_cm_days': len(cm_days_set),
-                'total_ef_days': len(ef_days_set),
-                'meal_tickets_count': len(eligible_meal_ticket_days)
-            })
-
-        context['employee_data'] = sorted(employee_data, key=lambda x: x['employee'].last_name)
-        return context
+        buffer = BytesIO()
+        wb.save(buffer)
+        response = HttpResponse(
+            buffer.getvalue(),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="Pontaj_{year}_{month:02d}.xlsx"'
+        return response
 
-class TimesheetPDFView(View):
+class TimesheetPDFView(LoginRequiredMixin, AttendanceMatrixMixin, View):
     def get(self, request, *args, **kwargs):
-        # 1. Parse target period (YYYY-MM)
-        selected_period = request.GET.get('selected_period', datetime.now().strftime('%Y-%m'))
-        try:
-            year, month = map(int, selected_period.split('-'))
-        except ValueError:
-            now = datetime.now()
-            year, month = now.year, now.month
+        # 1. Parse target period (YYYY-MM) and load the stored attendance matrix
+        year, month, days, raw_employee_data = self.get_attendance()
 
         # Get total number of days in selected month as STRICT INTEGERS [1, 2, ... 31]
-        _, num_days = calendar.monthrange(year, month)
-        month_days = list(range(1, num_days + 1))
-
-        # 2. Fetch employee rows & matrix data from view context/method
-        raw_employee_data = getattr(self, 'get_mock_or_real_data', lambda y, m: [])(year, month)
+        num_days = len(days)
+        month_days = [day['day_num'] for day in days]
 
         # 3. Setup PDF Document (A4 Landscape)
         buffer = BytesIO()
@@ -440,7 +376,7 @@ class TimesheetPDFView(View):
                 first_name = getattr(emp_obj, 'first_name', row.get('first_name', ''))
                 norma = row.get('norma', row.get('norma_hours', 168))
                 days_matrix = row.get('days_matrix', {})
-                total_hours = row.get('total_hours', row.get('total_minutes_worked', '0:00'))
+                total_hours = row.get('total_hours', format_minutes_short(row.get('total_minutes_worked')))
                 co_days = row.get('co_days', row.get('total_co_days', 0))
                 cm_days = row.get('cm_days', row.get('total_cm_days', 0))
                 ef_days = row.get('ef_days', row.get('total_ef_days', 0))
@@ -470,7 +406,9 @@ class TimesheetPDFView(View):
                 if isinstance(days_matrix, dict):
                     # Try looking up by integer day, string key, or object attribute
                     raw_val = days_matrix.get(day_int, days_matrix.get(str(day_int), ''))
-                    if isinstance(raw_val, dict):
+                    if isinstance(raw_val, dict) and raw_val.get('type') == 'work':
+                        cell_val = format_minutes_short(raw_val.get('hours'))
+                    elif isinstance(raw_val, dict):
                         cell_val = raw_val.get('hours', raw_val.get('type', ''))
                     elif hasattr(raw_val, 'hours'):
                         cell_val = getattr(raw_val, 'hours', '')
@@ -575,7 +513,7 @@ class PALActivitiesUploadView(LoginRequiredMixin, UserPassesTestMixin, CreateVie
         context = super().get_context_data(**kwargs)
         
         # Get all activities ordered by code
-        activities_list = Activity.objects.all().order_by('code')
+        activities_list = Activity.objects.all().order_by('sort_key')
         
         # Setup pagination
         paginator = Paginator(activities_list, self.paginate_by)
@@ -690,32 +628,22 @@ def activity_program(request):
 
 def get_total_hours_qs(queryset):
     """
-    Helper to calculate total hours from start_time and end_time at DB level.
-    This assumes end_time and start_time are on the same day.
+    Helper to calculate total hours at DB level from the stored shift durations.
     """
-    return queryset.annotate(
-        duration=ExpressionWrapper(
-            (F('end_time') - F('start_time')),
-            output_field=FloatField()
-        )
-    ).aggregate(
-        # Duration is returned in microseconds, 
-        # so we divide by 3,600,000,000 to get hours.
-        total=Sum(F('duration')) / 3600000000.0
-    )['total'] or 0
+    return queryset.total_minutes() / 60
 
 def worked_hours_per_member(request):
     today = timezone.now()
     team_members = CustomUser.objects.filter(is_active=True)
-    data = []
 
+    # Single grouped query instead of one aggregate per member
+    minutes_per_member = dict(
+        Timesheet.objects.in_month(today.year, today.month).values('user_id').annotate(minutes=Sum('duration_minutes')).values_list('user_id', 'minutes')
+    )
+
+    data = []
     for member in team_members:
-        qs = Timesheet.objects.filter(
-            user=member, 
-            date__year=today.year, 
-            date__month=today.month
-        )
-        total_hours = get_total_hours_qs(qs)
+        total_hours = minutes_per_member.get(member.pk, 0) / 60
 
         data.append({
             'name': member.get_full_name() or member.username,
@@ -729,21 +657,24 @@ def yearly_statistics(request):
     months_data = []
     month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
-    for month in range(1, 13):
-        month_qs = Timesheet.objects.filter(date__year=current_year, date__month=month)
-        
-        # Calculate totals
-        total_worked = get_total_hours_qs(month_qs)
-        
-        # For counts, we can still use Count
-        stats = month_qs.aggregate(
+    # One grouped query for the whole year, keyed by month number
+    stats_per_month = {
+        row['month']: row
+        for row in Timesheet.objects.in_year(current_year).annotate(
+            month=ExtractMonth('date')
+        ).values('month').annotate(
+            minutes=Sum('duration_minutes'),
             holidays=Count('id', filter=Q(description__icontains="holiday")), # Adjust filter if needed
             sick_leaves=Count('id', filter=Q(description__icontains="sick")), # Adjust filter if needed
-        )
+        ).order_by()
+    }
+
+    for month in range(1, 13):
+        stats = stats_per_month.get(month, {'minutes': 0, 'holidays': 0, 'sick_leaves': 0})
 
         months_data.append({
             'month': month_names[month-1],
-            'worked_hours': round(float(total_worked), 1),
+            'worked_hours': round((stats['minutes'] or 0) / 60, 1),
             'holidays': stats['holidays'],
             'sick_leaves': stats['sick_leaves'],
             'weekend_hours': 0 
@@ -0,0 +1,150 @@
+"""
+Permission-checked serving of uploaded media.
+
+Every /media/ request goes through protected_media, which decides from the path
+who may see the file: timesheet photos and their renditions only their owner
+(and managers, as on the timesheet pages), CVs only their user, avatars any
+signed-in user, anything else managers only. A refused file answers 404.
+
+Once allowed, the transfer is handed to the front-end server when
+MEDIA_SERVE_HEADER says how: 'X-Accel-Redirect' (nginx, with an internal location
+at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'X-Sendfile' (Apache, lighttpd).
+Without a proxy Django streams the file itself, with ETag, Last-Modified and
+single byte-range support.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+from timesheet.models import TimesheetImage
+from timesheet.renditions import RENDITION_DIR
+from timesheet.storage import is_hashed
+
+TIMESHEET_IMAGE_DIR = 'timesheet_images/'
+CHUNK_SIZE = 64 * 1024
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def may_view(user, path):
+    """Whether the signed-in user may see the media file at path"""
+    if user.has_manager_access:
+        return True
+    if path.startswith(f"{RENDITION_DIR}/"):
+        image_pk = path[len(RENDITION_DIR) + 1:].split('/', 1)[0]
+        if not image_pk.isdigit():
+            return False
+        images = TimesheetImage.objects.filter(pk=image_pk)
+    elif path.startswith(TIMESHEET_IMAGE_DIR):
+        # A file shared by identical uploads is visible to the owner of any of them
+        images = TimesheetImage.objects.filter(image=path)
+    elif path.startswith('cv/'):
+        return user.resume.name == path
+    elif path.startswith('avatars/'):
+        return True
+    else:
+        return False
+    return images.filter(Q(timesheet__user=user) | Q(archived_timesheet__user=user)).exists()
+
+
+def byte_range(header, size):
+    """(start, end) of a single-range Range header, None to send everything, or False when unsatisfiable"""
+    match = RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(full_path, start, length):
+    with open(full_path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def stream_file(request, full_path):
+    """The file streamed by Django: conditional GET and Range requests are answered here"""
+    stat = os.stat(full_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        requested = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if requested and if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+            # The client's copy is stale: send the whole file
+            requested = None
+        span = byte_range(requested, stat.st_size) if requested else None
+
+        if span is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+        elif span:
+            start, end = span
+            response = StreamingHttpResponse(read_range(full_path, start, end - start + 1), status=206,
+                                             content_type=mimetypes.guess_type(full_path)[0])
+            response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(full_path, 'rb'))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def offload_file(full_path, path):
+    """Empty response telling the front-end server which file to send"""
+    header = settings.MEDIA_SERVE_HEADER
+    response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0])
+    if header == 'X-Accel-Redirect':
+        response[header] = f"{settings.MEDIA_ACCEL_PREFIX.rstrip('/')}/{path}"
+    else:
+        response[header] = full_path
+    return response
+
+
+@login_required
+def protected_media(request, path):
+    if posixpath.normpath(path) != path or path.startswith(('/', '..')):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path) or not may_view(request.user, path):
+        raise Http404
+
+    if settings.MEDIA_SERVE_HEADER:
+        response = offload_file(full_path, path)
+    else:
+        response = stream_file(request, full_path)
+    if is_hashed(path):
+        # Content-addressed: the bytes behind this name never change
+        patch_cache_control(response, private=True, max_age=365 * 24 * 3600, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
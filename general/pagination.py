@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination for long, append-mostly lists.
+
+OFFSET pagination reads and discards every row before the requested page and
+needs a COUNT(*) of the whole result, so deep pages get slower and slower. A
+keyset page continues from the sort key of the last row shown instead
+(WHERE key beyond cursor ORDER BY key LIMIT n), which costs the same on every
+page. The ordering must end with a unique field so the key identifies one row.
+Cursors are opaque url-safe strings holding that key.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours (None at either end)"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _field_name(term):
+    return term.lstrip('-')
+
+
+def _flip(term):
+    return term[1:] if term.startswith('-') else f'-{term}'
+
+
+def encode_cursor(values):
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(model, ordering, cursor):
+    """Key values of a cursor converted by the model fields, or None when it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        return [
+            model._meta.get_field(_field_name(term)).to_python(value)
+            for term, value in zip(ordering, values)
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def beyond(ordering, values):
+    """Rows sorting strictly after the key values under the ordering"""
+    condition = Q()
+    for index, term in enumerate(ordering):
+        lookup = 'lt' if term.startswith('-') else 'gt'
+        step = Q(**{f'{_field_name(term)}__{lookup}': values[index]})
+        for previous, value in zip(ordering[:index], values):
+            step &= Q(**{_field_name(previous): value})
+        condition |= step
+    # Redundant bound on the leading field, so the database can range-scan its index
+    first = ordering[0]
+    lead = Q(**{f"{_field_name(first)}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+    return lead & condition
+
+
+def keyset_page(queryset, ordering, per_page, after=None, before=None):
+    """
+    Page of queryset under ordering: the rows following the `after` cursor, the
+    rows preceding the `before` cursor, or the first page without a valid cursor.
+    """
+    ordering = tuple(ordering)
+    model = queryset.model
+    backwards = not after and before is not None
+    cursor = decode_cursor(model, ordering, before if backwards else after)
+    if cursor is None:
+        backwards = False
+
+    order = tuple(_flip(term) for term in ordering) if backwards else ordering
+    queryset = queryset.order_by(*order)
+    if cursor is not None:
+        queryset = queryset.filter(beyond(order, cursor))
+    # One extra row tells whether there is more in the reading direction
+    rows = list(queryset[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    attnames = [model._meta.get_field(_field_name(term)).attname for term in ordering]
+
+    def key(obj):
+        return encode_cursor([getattr(obj, attname) for attname in attnames])
+
+    if backwards:
+        return KeysetPage(rows, next_cursor=key(rows[-1]), previous_cursor=key(rows[0]) if more else None)
+    return KeysetPage(
+        rows,
+        next_cursor=key(rows[-1]) if more else None,
+        previous_cursor=key(rows[0]) if cursor is not None else None,
+    )
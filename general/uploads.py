@@ -0,0 +1,89 @@
+"""
+Limits on multipart uploads, enforced while the request body streams in.
+
+A view wrapped in limit_uploads() gets an UploadLimitHandler in front of its
+upload handlers. The handler counts the files and bytes of the request and
+stops reading at the first limit broken, so an oversized upload never reaches
+memory, the temporary upload directory or an image decoder. Files above
+FILE_UPLOAD_MAX_MEMORY_SIZE go to temporary files on disk through Django's
+TemporaryFileUploadHandler, next in the chain. The limits are a named entry of
+settings.UPLOAD_LIMITS. A view that has limits must report upload_error() to the
+user, because the file it stopped is missing from request.FILES. Other forms keep
+Django's default handlers.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.template.defaultfilters import filesizeformat
+from django.utils.translation import gettext as _
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+
+def upload_error(request):
+    """Why the request's uploads were stopped, or None when none was"""
+    request.FILES  # the limits are checked while the body is parsed
+    return getattr(request, '_upload_error', None)
+
+
+def limit_uploads(limits):
+    """
+    View decorator applying settings.UPLOAD_LIMITS[limits] to the request. The
+    handler must be in place before anything reads the body. The CSRF
+    middleware reads it, so the CSRF check moves inside the wrapper.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            request.upload_handlers.insert(0, UploadLimitHandler(request, **settings.UPLOAD_LIMITS[limits]))
+            return csrf_protect(view)(request, *args, **kwargs)
+        return csrf_exempt(wrapped)
+    return decorator
+
+
+class UploadLimitMixin:
+    """Class-based views: limit_uploads() with the limits named by upload_limits"""
+    upload_limits = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return limit_uploads(cls.upload_limits)(super().as_view(**initkwargs))
+
+
+class UploadLimitHandler(FileUploadHandler):
+
+    def __init__(self, request=None, max_files=None, max_file_size=None, max_request_size=None):
+        super().__init__(request)
+        self.max_files = max_files
+        self.max_file_size = max_file_size
+        self.max_request_size = max_request_size
+        self.file_count = 0
+        self.total_size = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_count += 1
+        if self.file_count > self.max_files:
+            self.stop(_('At most %(count)d files can be uploaded at once.') % {'count': self.max_files})
+
+    def receive_data_chunk(self, raw_data, start):
+        self.total_size += len(raw_data)
+        if start + len(raw_data) > self.max_file_size:
+            self.stop(_('%(name)s is larger than %(size)s.') % {
+                'name': self.file_name, 'size': filesizeformat(self.max_file_size),
+            })
+        if self.total_size > self.max_request_size:
+            self.stop(_('The files together are larger than %(size)s.') % {
+                'size': filesizeformat(self.max_request_size),
+            })
+        return raw_data
+
+    def file_complete(self, file_size):
+        # The next handler builds the file
+        return None
+
+    def stop(self, message):
+        if self.request is not None:
+            self.request._upload_error = message
+        # The rest of the body is read and discarded, so the client still gets the response
+        raise StopUpload(connection_reset=False)
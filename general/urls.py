@@ -12,4 +12,3 @@ urlpatterns = [
     path('contact', contact, name="contact"),
 ]
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
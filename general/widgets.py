@@ -0,0 +1,41 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from django.urls import reverse
+from django.utils.choices import flatten_choices
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Select that only renders its selected option. static/js/autocomplete.js adds a
+    search box and loads the other options from the JSON endpoint named by url_name
+    ({"results": [{"id", "text"}]}) as the user types.
+
+    label_for() names the selected option from the field's choices, reading only
+    that row of a model field's queryset. Subclasses with a cheaper source (the
+    in-memory registries) override it.
+    """
+    url_name = None
+
+    def label_for(self, value):
+        """Text of the selected option; the value itself when no choice matches"""
+        choices = self.choices
+        if isinstance(choices, ModelChoiceIterator):
+            field = choices.field
+            try:
+                obj = choices.queryset.filter(**{field.to_field_name or 'pk': value}).first()
+            except (TypeError, ValueError, ValidationError):
+                obj = None
+            return field.label_from_instance(obj) if obj else str(value)
+        return next((str(label) for key, label in flatten_choices(choices) if str(key) == str(value)), str(value))
+
+    def get_context(self, name, value, attrs):
+        attrs = {**(attrs or {}), 'data-autocomplete-url': reverse(self.url_name)}
+        return super().get_context(name, value, attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        chosen = [(v, self.label_for(v)) for v in value if v not in (None, '')]
+        return [
+            (None, [self.create_option(name, option_value, label, bool(option_value), index, attrs=attrs)], index)
+            for index, (option_value, label) in enumerate([('', '---------')] + chosen)
+        ]
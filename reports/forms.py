@@ -1,6 +1,7 @@
 from django import forms
 from django.utils.translation import gettext_lazy as _
 
+from users.forms import EmployeeAutocompleteSelect, EmployeeChoiceField
 from users.models import CustomUser
 
 class ReportPeriodForm(forms.Form):
@@ -15,12 +16,11 @@ class ReportPeriodForm(forms.Form):
         ('custom', _('Custom Range')),
     ]
     
-    # Define the field with an empty queryset initially to prevent leaks
-    user = forms.ModelChoiceField(
-        queryset=CustomUser.objects.none(), 
-        required=False, 
+    # Options are loaded on demand from the employee autocomplete
+    user = EmployeeChoiceField(
+        required=False,
         label=_("Employee"),
-        widget=forms.Select(attrs={'class': 'form-control', 'placeholder': _("Selectează un angajat")})
+        widget=EmployeeAutocompleteSelect(attrs={'class': 'form-control', 'placeholder': _("Selectează un angajat")})
     )
     period = forms.ChoiceField(choices=PERIOD_CHOICES, widget=forms.Select(attrs={'class': 'form-control'}))
     custom_start_date = forms.DateField(
@@ -36,16 +36,15 @@ class ReportPeriodForm(forms.Form):
         # Pop the requesting user passed from the View
         request_user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        
-        if request_user:
+
+        if not request_user:
+            # No requesting user, no employees to leak
+            self.fields['user'].queryset = CustomUser.objects.none()
+        else:
             # 2. Check if the user is a Manager or Admin
-            is_manager = request_user.is_staff or request_user.groups.filter(name='Managers').exists()
+            is_manager = request_user.has_manager_access
             
-            if is_manager:
-                # Fill the dropdown with all active employees for Managers
-                self.fields['user'].queryset = CustomUser.objects.filter(is_active=True).order_by('last_name')
-                self.fields['user'].widget.attrs['placeholder'] = _("Selectează un angajat")
-            else:
+            if not is_manager:
                 # Regular users only see themselves
                 self.fields['user'].queryset = CustomUser.objects.filter(id=request_user.id)
                 self.fields['user'].initial = request_user.id
@@ -1,10 +1,12 @@
+from collections import defaultdict
 from django.views.generic import FormView, TemplateView
 from django.db.models import Sum, Count, Avg
 from django.utils import timezone
 from django.urls import reverse_lazy
 from matplotlib.ticker import FuncFormatter
 from urllib3 import request
-from timesheet.models import Timesheet
+from timesheet.archive import period_querysets
+from timesheet.workcalendar import standard_day_hours
 from .forms import ReportPeriodForm
 from datetime import timedelta, datetime
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -36,6 +38,28 @@ from reportlab.lib.fonts import addMapping
 
 User = CustomUser
 
+
+def period_timesheets(user_id, start_date, end_date):
+    """
+    Entries of one user between two dates (inclusive), read from the archive too
+    when the period reaches into closed years. Returns the entries (with activity,
+    funds source and image count), the hours per activity code and the total minutes.
+    """
+    parts = period_querysets(start_date, end_date + timedelta(days=1), user_id=user_id)
+    entries = [
+        part.select_related('activity', 'fundssource').annotate(img_nr=Count('timesheet_images'))
+        for part in parts
+    ]
+    timesheets = entries[0] if len(entries) == 1 else entries[1].union(entries[0], all=True)
+
+    activity_minutes = defaultdict(int)
+    # Aggregated on the unannotated querysets, the image join would multiply the sums
+    for part in parts:
+        for row in part.values('activity__code').annotate(minutes=Sum('duration_minutes')).order_by():
+            activity_minutes[row['activity__code']] += row['minutes']
+    activity_totals = {code: minutes / 60 for code, minutes in activity_minutes.items()}
+    return timesheets.order_by('date', 'start_time'), activity_totals, sum(activity_minutes.values())
+
 class ReportGeneratorView(LoginRequiredMixin, FormView):
     template_name = 'reports/generate_report.html'
     form_class = ReportPeriodForm
@@ -144,20 +168,13 @@ class ReportResultsView(LoginRequiredMixin, TemplateView):
             context['report_user'] = self.request.user
             user_id = self.request.user.pk
 
-        timesheets = Timesheet.objects.filter(
-            user_id=user_id,
-            date__range=[start_date, end_date]
-        ).select_related('activity', 'fundssource').annotate(
-            img_nr=Count('timesheet_images')
-        ).order_by('date', 'start_time')
+        timesheets, activity_totals, total_minutes = period_timesheets(user_id, start_date, end_date)
 
         detailed_data = []
-        activity_totals = {}
-        grand_total_decimal = 0
+        grand_total_decimal = total_minutes / 60
         
         for ts in timesheets:
             hours_dec, hours_str = self._get_hour_data(ts)
-            grand_total_decimal += hours_dec
             
             detailed_data.append({
                 'id': ts.pk,
@@ -170,9 +187,6 @@ class ReportResultsView(LoginRequiredMixin, TemplateView):
                 'hours': hours_str,
                 'image_count': getattr(ts, 'img_nr', 0),
             })
-
-            code = ts.activity.code
-            activity_totals[code] = activity_totals.get(code, 0) + hours_dec
         
         total_h = int(grand_total_decimal)
         total_m = int(round((grand_total_decimal - total_h) * 60))
@@ -193,29 +207,7 @@ class ReportResultsView(LoginRequiredMixin, TemplateView):
         Calculates duration and returns a tuple: (decimal_hours, display_string)
         Example: (8.5, "8h 30m")
         """
-        if timesheet.start_time and timesheet.end_time:
-            start = datetime.combine(datetime.today(), timesheet.start_time)
-            end = datetime.combine(datetime.today(), timesheet.end_time)
-            
-            if end < start:
-                end += timedelta(days=1)
-            
-            duration_seconds = (end - start).total_seconds()
-            decimal_hours = duration_seconds / 3600
-            day_of_week = timesheet.date.weekday() # Monday=0, Sunday=6
-
-            if day_of_week <= 3:  # Monday-Thursday
-                capped_decimal = min(decimal_hours, 8.5)
-            elif day_of_week == 4:  # Friday
-                friday_deadline = datetime.combine(timesheet.date, datetime.strptime("14:00", "%H:%M").time())     
-                   
-            h = int(decimal_hours)
-            m = int(round((decimal_hours - h) * 60))
-            display_string = f"{h}h {m:02d}m"
-            
-            return decimal_hours, display_string
-        
-        return 0, "0h 00m"
+        return timesheet.duration_decimal, timesheet.duration_display
     
     def _generate_detailed_report(self, timesheets):
         detailed_data = []
@@ -307,20 +299,8 @@ class ExportPDFView(LoginRequiredMixin, TemplateView):
         styles['Heading3'].fontName = BOLD_FONT
 
         # --- 2. PRE-CALCULATE TOTALS (One Loop Only) ---
-        timesheets = Timesheet.objects.filter(
-            user_id=user_id,
-            date__range=[start_date, end_date]
-        ).select_related('activity', 'fundssource').annotate(
-            img_nr=Count('timesheet_images')
-        ).order_by('date', 'start_time')
-
-        total_hours_decimal = 0
-        activity_totals = {}
-        for ts in timesheets:
-            h = self._calculate_hours(ts)
-            total_hours_decimal += h
-            code = ts.activity.code
-            activity_totals[code] = activity_totals.get(code, 0) + h
+        timesheets, activity_totals, total_minutes = period_timesheets(user_id, start_date, end_date)
+        total_hours_decimal = total_minutes / 60
 
         # Pull registration variables cleanly from session/request parsing upstream
         reg_num = report_data.get('reg_number', '_______')
@@ -350,7 +330,7 @@ class ExportPDFView(LoginRequiredMixin, TemplateView):
         elements.append(Paragraph(f"<b>Perioada raportării:</b> {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}", styles['Normal']))
         elements.append(Spacer(1, 0.25 * inch))
 
-        standard_day = 8.5
+        standard_day = standard_day_hours(start_date, end_date)
         total_days = total_hours_decimal / standard_day
         
         summary_table_data = [
@@ -435,8 +415,8 @@ class ExportPDFView(LoginRequiredMixin, TemplateView):
                 
                 for img_obj in ts_images:
                     try:
-                        # Load image
-                        img = Image(img_obj.image.path)
+                        # Load the print rendition rather than the full-size JPEG
+                        img = Image(img_obj.rendition_path('print'))
                         
                         # Get original dimensions
                         i_width = img.imageWidth
@@ -640,12 +620,7 @@ class ExportPDFView(LoginRequiredMixin, TemplateView):
         return chart_buffer
 
     def _calculate_hours(self, timesheet):
-        if timesheet.start_time and timesheet.end_time:
-            start = datetime.combine(datetime.today(), timesheet.start_time)
-            end = datetime.combine(datetime.today(), timesheet.end_time)
-            if end < start: end += timedelta(days=1)
-            return (end - start).total_seconds() / 3600
-        return 0
+        return timesheet.duration_decimal
 
 class ExportSimpleView(LoginRequiredMixin, TemplateView):
     """
@@ -680,20 +655,8 @@ class ExportSimpleView(LoginRequiredMixin, TemplateView):
             styles['Heading3'].fontName = BOLD_FONT
     
             # --- 2. PRE-CALCULATE TOTALS (One Loop Only) ---
-            timesheets = Timesheet.objects.filter(
-                user_id=user_id,
-                date__range=[start_date, end_date]
-            ).select_related('activity', 'fundssource').annotate(
-                img_nr=Count('timesheet_images')
-            ).order_by('date', 'start_time')
-    
-            total_hours_decimal = 0
-            activity_totals = {}
-            for ts in timesheets:
-                h = self._calculate_hours(ts)
-                total_hours_decimal += h
-                code = ts.activity.code
-                activity_totals[code] = activity_totals.get(code, 0) + h
+            timesheets, activity_totals, total_minutes = period_timesheets(user_id, start_date, end_date)
+            total_hours_decimal = total_minutes / 60
     
             # Pull registration variables cleanly from session/request parsing upstream
             reg_num = report_data.get('reg_number', '_______')
@@ -723,7 +686,7 @@ class ExportSimpleView(LoginRequiredMixin, TemplateView):
             elements.append(Paragraph(f"<b>Perioada raportării:</b> {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}", styles['Normal']))
             elements.append(Spacer(1, 0.25 * inch))
     
-            standard_day = 8.5
+            standard_day = standard_day_hours(start_date, end_date)
             total_days = total_hours_decimal / standard_day
             
             summary_table_data = [
@@ -940,10 +903,5 @@ class ExportSimpleView(LoginRequiredMixin, TemplateView):
             return chart_buffer
     
     def _calculate_hours(self, timesheet):
-            if timesheet.start_time and timesheet.end_time:
-                start = datetime.combine(datetime.today(), timesheet.start_time)
-                end = datetime.combine(datetime.today(), timesheet.end_time)
-                if end < start: end += timedelta(days=1)
-                return (end - start).total_seconds() / 3600
-            return 0
+            return timesheet.duration_decimal
 
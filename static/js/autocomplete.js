@@ -0,0 +1,68 @@
+// Lazy pickers (select[data-autocomplete-url]) only render the selected option.
+// A search box above each one queries the endpoint and refills the options.
+// Pages that add selects later (cloned rows) call window.setupAutocomplete(select).
+(function () {
+    function setupAutocomplete(select) {
+        var url = select.dataset.autocompleteUrl;
+        var search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'form-control form-control-sm mb-1';
+        search.placeholder = select.getAttribute('placeholder') || '…';
+        search.autocomplete = 'off';
+        search.dataset.autocompleteSearch = '';
+        select.parentNode.insertBefore(search, select);
+
+        var timer = null;
+        var pending = null;
+
+        function fill(results) {
+            var keep = Array.prototype.filter.call(select.options, function (option) {
+                return option.value === '' || option.selected;
+            });
+            var kept = keep.map(function (option) { return option.value; });
+            select.replaceChildren.apply(select, keep);
+            results.forEach(function (item) {
+                if (kept.indexOf(String(item.id)) === -1) {
+                    select.add(new Option(item.text, item.id));
+                }
+            });
+        }
+
+        function load() {
+            if (pending) {
+                pending.abort();
+            }
+            pending = new AbortController();
+            fetch(url + '?q=' + encodeURIComponent(search.value), {
+                credentials: 'same-origin',
+                signal: pending.signal
+            })
+                .then(function (response) { return response.ok ? response.json() : { results: [] }; })
+                .then(function (data) {
+                    fill(data.results);
+                    if (search.value && select.options.length > 1) {
+                        select.size = Math.min(select.options.length, 8);
+                    }
+                })
+                .catch(function () {});
+        }
+
+        search.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(load, 200);
+        });
+        search.addEventListener('focus', function () {
+            if (select.options.length <= 2) {
+                load();
+            }
+        }, { once: true });
+        select.addEventListener('change', function () {
+            select.size = 0;
+        });
+    }
+
+    window.setupAutocomplete = setupAutocomplete;
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(setupAutocomplete);
+    });
+})();
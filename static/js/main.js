@@ -100,109 +100,6 @@ $(document).ready(function() {
     //     $('#selectedDate').val(newDate);
     // });
 });
-$(document).ready(function () {
-    // Define Romanian locale for Moment.js
-    moment.defineLocale('ro', {
-        months: 'Ianuarie_Februarie_Martie_Aprilie_Mai_Iunie_Iulie_August_Septebrie_Octombrie_Noiembrie_Decembrie'.split('_'),
-        monthsShort: 'Ian_Feb_Mar_Apr_Mai_Iun_Iul_Aug_Sep_Oct_Noi_Dec'.split('_'),
-        weekdays: 'Duminică_Luni_Marți_Miercuri_Joi_Vineri_Sâmbătă'.split('_'),
-        weekdaysShort: 'Dum_Lun_Mar_Mie_Joi_Vin_Sâm'.split('_'),
-        weekdaysMin: 'Du_Lu_Ma_Mi_Jo_Vi_Sâ'.split('_'),
-        week: {
-            dow: 1, // Monday is the first day of the week.
-            doy: 4  // The week that contains Jan 4th is the first week of the year.
-        },
-        // Add other locale settings as needed
-    });
-    var calendar = $('#calendar').fullCalendar({
-        header: {
-            left: 'prev,next today',
-            center: 'title',
-            right: 'month,agendaWeek,agendaDay'
-        },
-        locale: 'currentLocale',
-        events: '/get_timesheets/',
-        selectable: true,
-        selectHelper: true,
-        editable: true,
-        eventLimit: true,
-        // When a date is selected, open the modal
-        select: function (start, end, allDay) {
-            var date = $.fullCalendar.formatDate(start, "DD-MM-YYYY");
-
-            // Set the date in the hidden input field in the modal form
-            $('#modalDate').val(date);
-
-            // Update modal title (optional)
-            $('#timesheetModalLabel').text('Enter Timesheet Data for ' + date);
-            
-            // Show the modal
-            $('#timesheetModal').modal('show');
-        },
-            error: function() {
-                alert('Failed to load the fuckin modal');
-        },
-        eventResize: function (event) {
-            var start = $.fullCalendar.formatDate(event.start, "Y-MM-DD HH:mm:ss");
-            var end = $.fullCalendar.formatDate(event.end, "Y-MM-DD HH:mm:ss");
-            var title = event.title;
-            var id = event.id;
-            $.ajax({
-                type: "GET",
-                url: '/update',
-                data: {'title': title, 'start': start, 'end': end, 'id': id},
-                dataType: "json",
-                success: function (data) {
-                    calendar.fullCalendar('refetchEvents');
-                    alert('Event Update');
-                },
-                error: function (data) {
-                    alert('There is a problem!!!');
-                }
-            });
-        },
-
-        eventDrop: function (event) {
-            var start = $.fullCalendar.formatDate(event.start, "Y-MM-DD HH:mm:ss");
-            var end = $.fullCalendar.formatDate(event.end, "Y-MM-DD HH:mm:ss");
-            var title = event.title;
-            var id = event.id;
-            $.ajax({
-                type: "GET",
-                url: '/update',
-                data: {'title': title, 'start': start, 'end': end, 'id': id},
-                dataType: "json",
-                success: function (data) {
-                    calendar.fullCalendar('refetchEvents');
-                    alert('Event Update');
-                },
-                error: function (data) {
-                    alert('There is a problem!!!');
-                }
-            });
-        },
-
-        eventClick: function (event) {
-            if (confirm("Are you sure you want to remove it?")) {
-                var id = event.id;
-                $.ajax({
-                    type: "GET",
-                    url: '/remove',
-                    data: {'id': id},
-                    dataType: "json",
-                    success: function (data) {
-                        calendar.fullCalendar('refetchEvents');
-                        alert('Event Removed');
-                    },
-                    error: function (data) {
-                        alert('There is a problem!!!');
-                    }
-                });
-            }
-        },
-
-    });
-});
 // $(document).on('submit', '#timesheetForm', function(event) {
 //     event.preventDefault();  // Prevent the default form submission
 
@@ -226,3 +123,70 @@ $(document).ready(function () {
 //         }
 //     });
 // });
+
+// Photos chosen in a file input with data-max-width are downscaled and re-encoded
+// in the browser to the server's compression profile before upload, so rangers on
+// weak connections do not send pixels the server would throw away. A photo the
+// browser cannot decode is sent as it is; the server compresses it as before.
+function downscalePhoto(file, maxWidth, quality, maxBytes) {
+    if (!/^image\/(jpeg|png|webp)$/.test(file.type) || !window.createImageBitmap) {
+        return Promise.resolve(file);
+    }
+    return createImageBitmap(file, {imageOrientation: 'from-image'}).then(function (bitmap) {
+        var scale = Math.min(1, maxWidth / bitmap.width);
+        if (scale === 1 && file.type === 'image/jpeg' && file.size <= maxBytes) {
+            bitmap.close();
+            return file;
+        }
+        var canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        var context = canvas.getContext('2d');
+        // JPEG has no transparency
+        context.fillStyle = '#fff';
+        context.fillRect(0, 0, canvas.width, canvas.height);
+        context.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+        return new Promise(function (resolve) {
+            canvas.toBlob(function (blob) {
+                if (!blob || (scale === 1 && blob.size >= file.size)) {
+                    resolve(file);
+                    return;
+                }
+                var name = file.name.replace(/\.[^.]*$/, '') + '.jpg';
+                resolve(new File([blob], name, {type: 'image/jpeg', lastModified: file.lastModified}));
+            }, 'image/jpeg', quality);
+        });
+    }).catch(function () {
+        return file;
+    });
+}
+
+$(document).on('change', 'input[type=file][data-max-width]', function () {
+    var input = this;
+    var $input = $(input);
+    if (!window.DataTransfer || !input.files.length) {
+        return;
+    }
+    var $submit = $(input.form).find('[type=submit]').prop('disabled', true);
+    var chosen = Array.prototype.slice.call(input.files);
+    var processed = [];
+    // One photo at a time: a phone decoding several 12 MP photos at once runs out of memory
+    chosen.reduce(function (previous, file) {
+        return previous.then(function () {
+            return downscalePhoto(file, $input.data('maxWidth'), $input.data('quality') / 100, $input.data('maxBytes'));
+        }).then(function (result) {
+            processed.push(result);
+        });
+    }, Promise.resolve()).then(function () {
+        var transfer = new DataTransfer();
+        processed.forEach(function (file) {
+            transfer.items.add(file);
+        });
+        input.files = transfer.files;
+    }).catch(function () {
+        // The originals stay selected
+    }).then(function () {
+        $submit.prop('disabled', false);
+    });
+});
@@ -1,5 +1,18 @@
-from django.contrib import admin
-from .models import Activity, Timesheet, TimesheetImage, FundsSource
+import os
+
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from general.uploads import limit_uploads, upload_error
+from .importers import ImportFileError, TimesheetImporter
+from .models import Activity, ArchivedTimesheet, ImageTask, Timesheet, TimesheetImage, FundsSource, UserDayTotal
+
+
+class TimesheetImportForm(forms.Form):
+    file = forms.FileField(help_text="XLSX or CSV with the columns user, date, start_time, end_time, activity, fundssource, description")
+    dry_run = forms.BooleanField(required=False, help_text="Only validate the rows")
 
 
 @admin.register(FundsSource)
@@ -13,9 +26,76 @@ class TimesheetAdmin(admin.ModelAdmin):
     list_display = ['user', 'date', 'activity', 'start_time', 'end_time', 'created_at']
     list_filter = ['user']
     search_fields = ['user__username', 'activity__name']
+    change_list_template = 'admin/timesheet/timesheet/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(limit_uploads('imports')(self.import_view)),
+                 name='timesheet_timesheet_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:timesheet_timesheet_changelist')
+
+        result = None
+        form = TimesheetImportForm(request.POST or None, request.FILES or None)
+        stopped = upload_error(request) if request.method == 'POST' else None
+        if stopped:
+            messages.error(request, stopped)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            file_format = os.path.splitext(upload.name)[1].lstrip('.').lower()
+            try:
+                result = TimesheetImporter(dry_run=form.cleaned_data['dry_run']).run(upload.file, file_format)
+            except ImportFileError as exc:
+                messages.error(request, exc)
+            else:
+                messages.success(request, (
+                    f"{result.created} of {result.rows} rows {'valid' if form.cleaned_data['dry_run'] else 'imported'}, "
+                    f"{result.failed} rejected ({result.rows_per_second:.0f} rows/s)."
+                ))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import timesheets',
+            'form': form,
+            'result': result,
+        }
+        return TemplateResponse(request, 'admin/timesheet/timesheet/import.html', context)
+
+
+@admin.register(ArchivedTimesheet)
+class ArchivedTimesheetAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'activity', 'start_time', 'end_time', 'created_at']
+    list_filter = ['user']
+    search_fields = ['user__username', 'activity__name']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(TimesheetImage)
 class TimesheetImageAdmin(admin.ModelAdmin):
-    list_display = ['timesheet', 'image', 'uploaded_at']
-    search_fields = ['timesheet__user__username', 'timesheet__date']
\ No newline at end of file
+    list_display = ['timesheet', 'image', 'uploaded_at', 'status', 'file_size']
+    list_filter = ['status']
+    search_fields = ['timesheet__user__username', 'timesheet__date']
+
+
+@admin.register(ImageTask)
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ['image', 'created_at', 'available_at', 'attempts', 'locked_by', 'last_error']
+    readonly_fields = ['created_at']
+
+@admin.register(UserDayTotal)
+class UserDayTotalAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'worked_minutes', 'leave_minutes', 'entry_count', 'leave_category']
+    list_filter = ['leave_category']
+    search_fields = ['user__username', 'user__email']
+    date_hierarchy = 'date'
@@ -0,0 +1,97 @@
+"""
+Cold storage of closed years.
+
+archive_timesheets moves every Timesheet dated before a cutoff (1st of January of
+the first year still open) into ArchivedTimesheet with the same ids, so the live
+table only holds the current working set. Archived years are read-only.
+
+Readers that may reach into archived years ask for the querysets covering a date
+range: the live table alone when the range starts at or after the cutoff, the
+archive alone when it ends before it, both otherwise.
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import ArchivedTimesheet, Timesheet, TimesheetImage
+from .periods import range_filter
+from .rollups import deferred_day_totals
+
+CUTOFF_CACHE_KEY = 'timesheet:archive_cutoff'
+
+
+def archive_cutoff():
+    """First day that is not archived, or None when nothing is archived"""
+    cached = cache.get(CUTOFF_CACHE_KEY)
+    if cached is None:
+        last_day = ArchivedTimesheet.objects.aggregate(last=Max('date'))['last']
+        cached = date(last_day.year + 1, 1, 1).isoformat() if last_day else ''
+        cache.set(CUTOFF_CACHE_KEY, cached, None)
+    return date.fromisoformat(cached) if cached else None
+
+
+def clear_archive_cutoff():
+    cache.delete(CUTOFF_CACHE_KEY)
+
+
+def is_archived_day(day, cutoff=None):
+    cutoff = cutoff or archive_cutoff()
+    return bool(cutoff and day < cutoff)
+
+
+def period_querysets(start, end, **filters):
+    """
+    Querysets holding the timesheets in [start, end) that match filters: the
+    live table, the archive, or both (archive first) when the range straddles the cutoff.
+    """
+    cutoff = archive_cutoff()
+    if not cutoff or start >= cutoff:
+        return [Timesheet.objects.filter(**range_filter(start, end), **filters)]
+    if end <= cutoff:
+        return [ArchivedTimesheet.objects.filter(**range_filter(start, end), **filters)]
+    return [
+        ArchivedTimesheet.objects.filter(**range_filter(start, cutoff), **filters),
+        Timesheet.objects.filter(**range_filter(cutoff, end), **filters),
+    ]
+
+
+def span(start, end, **filters):
+    """
+    Single queryset of the timesheets in [start, end). Within one side of the
+    cutoff it is a plain queryset of that table; across it, a UNION ALL of both
+    (which only supports ordering, slicing and counting).
+    """
+    parts = period_querysets(start, end, **filters)
+    if len(parts) == 1:
+        return parts[0]
+    archived, live = parts
+    return live.union(archived, all=True)
+
+
+def archive_before(cutoff, batch_size=2000):
+    """
+    Moves the live timesheets dated before cutoff into the archive, batch by
+    batch, re-pointing their images. Returns the number of rows moved.
+    """
+    fields = [f.attname for f in Timesheet._meta.concrete_fields]
+    moved = 0
+    # Totals do not change: the rollup reads archived days from the archive
+    with deferred_day_totals(refresh=False):
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    Timesheet.objects.filter(date__lt=cutoff).order_by('date', 'pk').values(*fields)[:batch_size]
+                )
+                if not rows:
+                    break
+                ids = [row['id'] for row in rows]
+                ArchivedTimesheet.objects.bulk_create([ArchivedTimesheet(**row) for row in rows])
+                TimesheetImage.objects.filter(timesheet_id__in=ids).update(
+                    archived_timesheet_id=F('timesheet_id'), timesheet=None
+                )
+                Timesheet.objects.filter(pk__in=ids).delete()
+            moved += len(rows)
+    clear_archive_cutoff()
+    return moved
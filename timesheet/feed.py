@@ -0,0 +1,118 @@
+"""
+FullCalendar event feed of the logged in user's timesheets.
+
+FullCalendar asks for the visible window only (?start=&end=), so the payload
+grows with the window rather than with the user's history, and only the columns
+an event shows are read; activity labels come from the reference registry.
+
+Every user has a modification stamp in the cache, moved by day_totals_changed
+whenever one of their timesheets is written. The ETag of a window is derived
+from that stamp, so an unchanged window is answered with 304 before any
+timesheet is queried.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from . import reference
+from .archive import period_querysets
+
+STAMP_KEY = 'timesheet:feed:{user_id}'
+GENERATION_KEY = 'timesheet:feed:generation'
+STAMP_TIMEOUT = 30 * 24 * 3600
+# Widest window served in one request (FullCalendar's month view asks for 6 weeks)
+MAX_RANGE_DAYS = 366
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # From the clock: a restart at 1 would serve entries cached under an earlier 1
+        seed = time.time_ns()
+        cache.add(GENERATION_KEY, seed, None)
+        generation = cache.get(GENERATION_KEY, seed)
+    return generation
+
+
+def user_stamp(user_id):
+    """Time of the user's latest timesheet change (or of the first read after the stamp expired)"""
+    key = STAMP_KEY.format(user_id=user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, time.time_ns(), STAMP_TIMEOUT)
+        stamp = cache.get(key)
+    return stamp
+
+
+def touch_users(days):
+    """Moves the stamps of the users in the (user_id, date) pairs; None moves every stamp"""
+    if days is None:
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, time.time_ns(), None)
+        return
+
+    keys = {STAMP_KEY.format(user_id=user_id) for user_id, _ in days}
+
+    def touch():
+        stamp = time.time_ns()
+        cache.set_many({key: stamp for key in keys}, STAMP_TIMEOUT)
+
+    touch()
+    # Again after commit, so a read racing the write cannot pair the old rows with the new tag
+    transaction.on_commit(touch)
+
+
+def parse_range(params):
+    """[start, end) from FullCalendar's ?start=&end= (dates or ISO datetimes), or None when invalid"""
+    try:
+        start = parse_date((params.get('start') or '')[:10])
+        end = parse_date((params.get('end') or '')[:10])
+    except ValueError:
+        return None
+    if not start or not end or not start < end <= start + timedelta(days=MAX_RANGE_DAYS):
+        return None
+    return start, end
+
+
+def events_etag(user_id, start, end):
+    key = f"{user_id}:{_generation()}:{user_stamp(user_id)}:{reference.current_version()}:{start}:{end}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def event_class(hours):
+    if hours >= 8:
+        return 'timesheet-event-bar high-hours'
+    if hours >= 4:
+        return 'timesheet-event-bar medium-hours'
+    return 'timesheet-event-bar low-hours'
+
+
+def calendar_events(user_id, start, end):
+    """FullCalendar events of the user's timesheets in [start, end)"""
+    activities = reference.get_reference_data().activity_index
+    events = []
+    for queryset in period_querysets(start, end, user_id=user_id):
+        rows = queryset.order_by('date', 'start_time')\
+            .values_list('id', 'date', 'duration_minutes', 'activity_id', 'description')
+        for pk, day, minutes, activity_id, description in rows:
+            activity = activities.get(activity_id)
+            activity_name = f"{activity.code} - {activity.name}" if activity else "No Activity"
+            hours = round(minutes / 60, 2)
+            events.append({
+                'id': f"timesheet_{pk}",
+                'title': f"{activity_name} ({hours:.1f}h)",
+                'start': day.isoformat(),
+                'className': event_class(hours),
+                'extendedProps': {
+                    'activity': activity_name,
+                    'hours': hours,
+                    'description': description,
+                },
+            })
+    return events
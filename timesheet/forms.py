@@ -1,19 +1,25 @@
 from django import forms
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.contrib.auth import get_user_model
-from .models import Timesheet, FundsSource
-from dashboard.models import Activity  # Ensure this import matches your app structure
+from .archive import is_archived_day
+from .limits import (
+    FRIDAY_END, archived_day_message, daily_limit_minutes, existing_day_minutes, friday_end_message,
+    limit_exceeded_message,
+)
+from .models import Timesheet, compute_duration_minutes
+from .reference import (
+    ActivityAutocompleteSelect, ReferenceChoiceField, activity_choices, funds_choices, get_activity,
+    get_default_funds_source, get_funds_source, get_leave_activity,
+)
+from dashboard.models import LeaveCategory
+from users.forms import EmployeeChoiceField
 from datetime import date, datetime, timedelta
 
+ACTIVITY_SEARCH_PLACEHOLDER = _("Caută după cod, denumire sau program")
+
+
 class TimesheetForm(forms.ModelForm):
-    User = get_user_model()
-    user = forms.ModelChoiceField(
-        queryset=User.objects.filter(is_active=True).order_by('last_name'),
-        required=False,
-        label=_("Employee"),
-        widget=forms.Select(attrs={'class': 'form-control'})
-    )
+    user = EmployeeChoiceField(required=False, label=_("Employee"))
     is_annual_holiday = forms.BooleanField(
         required=False, 
         label=_("Concediu de Odihnă"),
@@ -49,13 +55,29 @@ class TimesheetForm(forms.ModelForm):
         widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
         label=_("End Time")
     )
+    # Choices come from the cached reference registry instead of a query per render
+    fundssource = ReferenceChoiceField(
+        funds_choices, get_funds_source,
+        label=_("Funds source"),
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    activity = ReferenceChoiceField(
+        activity_choices, get_activity,
+        label=_("Activity"),
+        widget=ActivityAutocompleteSelect(attrs={'class': 'form-control', 'placeholder': ACTIVITY_SEARCH_PLACEHOLDER})
+    )
+
+    # Leave checkbox matching each Activity.leave_category
+    LEAVE_FIELDS = {
+        LeaveCategory.CO: 'is_annual_holiday',
+        LeaveCategory.CM: 'is_sick_leave',
+        LeaveCategory.EF: 'is_family_event',
+    }
 
     class Meta:
         model = Timesheet
         fields = ['fundssource', 'date', 'start_time', 'end_time', 'activity', 'description', 'submitted_to_smart', 'user']
         widgets = {
-            'fundssource': forms.Select(attrs={'class': 'form-control'}),
-            'activity': forms.Select(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'submitted_to_smart': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
@@ -65,8 +87,7 @@ class TimesheetForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         if self.instance and self.instance.pk and self.instance.activity:
-            activity_name = self.instance.activity.name.upper() if hasattr(self.instance.activity, 'name') else str(self.instance.activity).upper()
-            is_special = any(x in activity_name for x in ['CONCEDIU', 'ANNUAL', 'SICK', 'EVENIMENT', 'FAMILY'])
+            is_special = self.instance.activity.is_leave
             self.fields['activity'].required = not is_special
             self.fields['fundssource'].required = not is_special
         else:
@@ -92,13 +113,9 @@ class TimesheetForm(forms.ModelForm):
 
         # Active Switch Memory Checklist on Edit
         if self.instance and self.instance.pk and self.instance.activity:
-            activity_name = self.instance.activity.name.upper() if hasattr(self.instance.activity, 'name') else str(self.instance.activity).upper()
-            if 'CONCEDIU ANUAL' in activity_name or 'ANNUAL' in activity_name:
-                self.fields['is_annual_holiday'].initial = True
-            elif 'CONCEDIU MEDICAL' in activity_name or 'SICK' in activity_name:
-                self.fields['is_sick_leave'].initial = True
-            elif 'EVENIMENT FAMILIAL' in activity_name or 'FAMILY' in activity_name:
-                self.fields['is_family_event'].initial = True
+            leave_field = self.LEAVE_FIELDS.get(self.instance.activity.leave_category)
+            if leave_field:
+                self.fields[leave_field].initial = True
 
         if self.requesting_user and not self.requesting_user.is_superuser:
             self.fields['user'].widget = forms.HiddenInput()
@@ -113,6 +130,9 @@ class TimesheetForm(forms.ModelForm):
     def clean(self):
         cleaned_data = super().clean()
         date = cleaned_data.get('date')
+        if date and is_archived_day(date):
+            self.add_error('date', archived_day_message(date))
+            return cleaned_data
         is_holiday = cleaned_data.get('is_annual_holiday')
         is_sick = cleaned_data.get('is_sick_leave')
         is_family_event = cleaned_data.get('is_family_event')
@@ -140,25 +160,22 @@ class TimesheetForm(forms.ModelForm):
             raise forms.ValidationError(_("Nu puteți bifa mai multe tipuri de evenimente/concedii speciale în aceeași zi."))
         
         if (is_holiday or is_sick or is_family_event) and date:
-            # 💡 FIX: Map exactly to EVENIMENT FAMILIAL if checked
             if is_holiday:
-                target_activity_name = 'CONCEDIU ANUAL'
+                target_category = LeaveCategory.CO
             elif is_sick:
-                target_activity_name = 'CONCEDIU MEDICAL'
+                target_category = LeaveCategory.CM
             else:
-                target_activity_name = 'EVENIMENT FAMILIAL'
+                target_category = LeaveCategory.EF
 
-            activity_obj = Activity.objects.filter(name__icontains=target_activity_name).first()
-            
+            activity_obj = get_leave_activity(target_category)
             if not activity_obj:
-                # Fallback search rule if precise text strings are missing inside DB model data
-                activity_obj = Activity.objects.filter(name__icontains='EVENIMENT' if is_family_event else 'CONCEDIU').first()
-                
+                raise forms.ValidationError(
+                    _("Nu există nicio activitate configurată pentru %(leave)s.") % {'leave': target_category.label}
+                )
+
             cleaned_data['activity'] = activity_obj
             
-            # 2. Pull exact DB instance for FundsSource
-            funds_obj = FundsSource.objects.filter(name__icontains='RNP ROMSILVA').first()
-            cleaned_data['fundssource'] = funds_obj
+            cleaned_data['fundssource'] = get_default_funds_source()
 
             # 3. Handle standard holiday timetables allocations
             cleaned_data['start_time'] = datetime.strptime("08:00", "%H:%M").time()
@@ -188,44 +205,113 @@ class TimesheetForm(forms.ModelForm):
                 self.add_error('end_time', _("Ora de final trebuie să fie după ora început."))
                 return cleaned_data
 
-            current_entry_hours = (end_dt - start_dt).total_seconds() / 3600
-            day_of_week = date.weekday()
-
-            if day_of_week <= 3:
-                limit = 8.5
-                day_name = _("Luni-Joi")
-            elif day_of_week == 4:
-                limit = 6.0
-                day_name = _("Vineri")
-                if end_time > datetime.strptime("14:00", "%H:%M").time():
-                    self.add_error('end_time', _("Programul de vineri se termină la ora 14:00."))
-                    return cleaned_data
+            entry_minutes = compute_duration_minutes(start_time, end_time)
+            if date.weekday() == 4 and end_time > FRIDAY_END:
+                self.add_error('end_time', friday_end_message())
+                return cleaned_data
+
+            existing_minutes = existing_day_minutes(target_user, [date]).get(date, 0)
+            if self.instance.pk and self.instance.user_id == target_user.pk and self.instance.date == date:
+                # The rollup already contains the stored version of the entry being edited
+                existing_minutes -= self.instance.duration_minutes
+
+            if existing_minutes + entry_minutes > daily_limit_minutes(date):
+                self.add_error('end_time', limit_exceeded_message(date, existing_minutes))
+
+        return cleaned_data
+
+
+class WeekEntryForm(forms.Form):
+    """One row of the weekly grid; rows left without an activity are skipped"""
+    date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    start_time = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control form-control-sm'}))
+    end_time = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control form-control-sm'}))
+    activity = ReferenceChoiceField(activity_choices, get_activity, required=False,
+                                    widget=ActivityAutocompleteSelect(attrs={'class': 'form-select form-select-sm',
+                                                                             'placeholder': ACTIVITY_SEARCH_PLACEHOLDER}))
+    fundssource = ReferenceChoiceField(funds_choices, get_funds_source, required=False,
+                                       widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    description = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control form-control-sm'}))
+
+    def is_entry(self):
+        return bool(getattr(self, 'cleaned_data', None) and self.cleaned_data.get('activity'))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        activity = cleaned_data.get('activity')
+        if not activity:
+            return cleaned_data
+
+        start_time = cleaned_data.get('start_time')
+        end_time = cleaned_data.get('end_time')
+        day = cleaned_data.get('date')
+        if day and is_archived_day(day):
+            self.add_error('date', archived_day_message(day))
+        if not start_time or not end_time:
+            raise forms.ValidationError(_("Ora de început și ora de final sunt obligatorii pentru activități standard."))
+        if end_time <= start_time:
+            self.add_error('end_time', _("Ora de final trebuie să fie după ora început."))
+        elif day and day.weekday() == 4 and end_time > FRIDAY_END:
+            self.add_error('end_time', friday_end_message())
+        if not cleaned_data.get('fundssource'):
+            self.add_error('fundssource', _("Vă rugăm să selectați o sursă de finanțare."))
+        return cleaned_data
+
+
+class BaseWeekEntryFormSet(forms.BaseFormSet):
+    """
+    Validates the daily limits of every day in the grid at once: the minutes already
+    booked come from a single UserDayTotal query and the new rows are summed per day.
+    With week_start, every row must also fall in that Monday-to-Sunday week.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user')
+        self.week_start = kwargs.pop('week_start', None)
+        super().__init__(*args, **kwargs)
+
+    def entry_forms(self):
+        return [form for form in self.forms if form.is_entry()]
+
+    def clean(self):
+        if any(self.errors):
+            return
+        entries = self.entry_forms()
+        if not entries:
+            raise forms.ValidationError(_("Completați cel puțin o activitate."))
+        if self.week_start:
+            week_end = self.week_start + timedelta(days=6)
+            outside = [form for form in entries if not self.week_start <= form.cleaned_data['date'] <= week_end]
+            for form in outside:
+                form.add_error('date', _("Data trebuie să fie între %(start)s și %(end)s.") % {
+                    'start': self.week_start.strftime('%d.%m.%Y'), 'end': week_end.strftime('%d.%m.%Y'),
+                })
+            if outside:
+                return
+
+        existing = existing_day_minutes(self.user, [form.cleaned_data['date'] for form in entries])
+        booked = dict(existing)
+        for form in entries:
+            day = form.cleaned_data['date']
+            minutes = compute_duration_minutes(form.cleaned_data['start_time'], form.cleaned_data['end_time'])
+            if booked.get(day, 0) + minutes > daily_limit_minutes(day):
+                form.add_error('end_time', limit_exceeded_message(day, booked.get(day, 0)))
             else:
-                limit = 8.5
-                day_name = _("Weekend")
+                booked[day] = booked.get(day, 0) + minutes
 
-            existing_entries = Timesheet.objects.filter(
-                user=target_user, 
-                date=date
+    def build_timesheets(self):
+        return [
+            Timesheet(
+                user=self.user,
+                date=form.cleaned_data['date'],
+                start_time=form.cleaned_data['start_time'],
+                end_time=form.cleaned_data['end_time'],
+                activity=form.cleaned_data['activity'],
+                fundssource=form.cleaned_data['fundssource'],
+                description=form.cleaned_data['description'],
             )
-            if self.instance.pk:
-                existing_entries = existing_entries.exclude(pk=self.instance.pk)
-
-            existing_hours = 0
-            for ts in existing_entries:
-                s = datetime.combine(date, ts.start_time)
-                e = datetime.combine(date, ts.end_time)
-                if e < s: e += timedelta(days=1)
-                existing_hours += (e - s).total_seconds() / 3600
-
-            total_day_hours = existing_hours + current_entry_hours
-
-            if total_day_hours > limit:
-                remaining = max(0, limit - existing_hours)
-                rem_h = int(remaining)
-                rem_m = int((remaining * 60) % 60)
-                
-                error_msg = _(f"Limită de ore lucrate depășită pentru {day_name}! Poți introduce maxim {rem_h}h și {rem_m:02d}m în această zi.")
-                self.add_error('end_time', error_msg)
-                    
-        return cleaned_data
\ No newline at end of file
+            for form in self.entry_forms()
+        ]
+
+
+WeekEntryFormSet = forms.formset_factory(WeekEntryForm, formset=BaseWeekEntryFormSet, extra=0, max_num=60)
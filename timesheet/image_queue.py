@@ -0,0 +1,109 @@
+"""
+Database-backed queue of the image processing behind TimesheetImage uploads.
+
+An upload is stored as it arrives and gets an ImageTask row in the same
+transaction, so the request does no image work. The process_images command
+claims due tasks with a conditional UPDATE (no broker, and no SELECT ... SKIP
+LOCKED, which SQLite lacks), compresses the image in place of the original, marks
+it ready and makes its renditions; until then the pages show the original file.
+
+A claim counts as an attempt. A failed task is retried with a doubling delay;
+after MAX_ATTEMPTS the image is marked failed and keeps its original. A task
+whose worker died is claimed again once its lock is older than LOCK_TIMEOUT, so
+a file that kills its worker is also given up after MAX_ATTEMPTS.
+"""
+import logging
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ImageStatus, ImageTask, TimesheetImage
+from .renditions import COMPRESS_PROFILE, generate_all
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+LOCK_TIMEOUT = timedelta(minutes=10)
+RETRY_DELAY = timedelta(minutes=1)
+
+
+def claim(worker, limit=10):
+    """Locks up to limit due tasks for the worker and returns them"""
+    now = timezone.now()
+    # A worker that died on the last attempt left its image processing
+    abandoned = ImageTask.objects.filter(attempts__gte=MAX_ATTEMPTS, locked_at__lt=now - LOCK_TIMEOUT)
+    TimesheetImage.objects.filter(pk__in=abandoned.values('image_id')).update(status=ImageStatus.FAILED)
+    abandoned.update(locked_at=None, locked_by='', last_error='The worker stopped during the last attempt')
+
+    due = ImageTask.objects.filter(available_at__lte=now, attempts__lt=MAX_ATTEMPTS)\
+        .filter(Q(locked_at__isnull=True) | Q(locked_at__lt=now - LOCK_TIMEOUT))\
+        .order_by('available_at', 'pk')
+    claimed = [
+        pk for pk, locked_at in due.values_list('pk', 'locked_at')[:limit]
+        # Only one worker's UPDATE still sees the lock it read
+        if ImageTask.objects.filter(pk=pk, locked_at=locked_at)\
+            .update(locked_at=now, locked_by=worker, attempts=F('attempts') + 1)
+    ]
+    return list(ImageTask.objects.filter(pk__in=claimed).select_related('image').order_by('available_at', 'pk'))
+
+
+def compress(image):
+    """Replaces the stored original with its compressed JPEG and marks the image ready"""
+    original = image.image.name
+    with image.image.open('rb'):
+        compressed = image.compress_image(image.image)
+    # Stored by save(), which keeps the file if a concurrent release deletes it
+    image.image = compressed
+    image.status = ImageStatus.READY
+    image.processed_with = COMPRESS_PROFILE
+    image.file_size = compressed.size
+    image.save(update_fields=['image', 'status', 'processed_with', 'file_size'])
+    if image.image.name != original:
+        TimesheetImage.release_file(original)
+
+
+def fail(task, exc):
+    # The attempt was counted when the task was claimed
+    task.last_error = f"{type(exc).__name__}: {exc}"
+    task.locked_at = None
+    task.locked_by = ''
+    task.available_at = timezone.now() + RETRY_DELAY * 2 ** (task.attempts - 1)
+    task.save(update_fields=['attempts', 'last_error', 'locked_at', 'locked_by', 'available_at'])
+    status = ImageStatus.FAILED if task.attempts >= MAX_ATTEMPTS else ImageStatus.PENDING
+    TimesheetImage.objects.filter(pk=task.image_id).update(status=status)
+
+
+def process(task):
+    """Runs one claimed task; returns whether it succeeded, None when its image was deleted meanwhile"""
+    TimesheetImage.objects.filter(pk=task.image_id).update(status=ImageStatus.PROCESSING)
+    try:
+        compress(task.image)
+    except Exception as exc:
+        if not TimesheetImage.objects.filter(pk=task.image_id).exists():
+            # The task went with it; the compressed file may already be stored
+            logger.info("Image %s was deleted while being processed", task.image_id)
+            TimesheetImage.release_file(task.image.image.name)
+            return None
+        logger.warning("Image %s failed (attempt %s): %s", task.image_id, task.attempts, exc)
+        fail(task, exc)
+        return False
+    task.delete()
+    try:
+        generate_all(task.image)
+    except Exception as exc:
+        # Not retried: pages make missing renditions on first request
+        logger.warning("Renditions of image %s failed: %s", task.image_id, exc)
+    return True
+
+
+def run_once(worker, limit=10):
+    """Claims and runs one batch; returns (succeeded, failed)"""
+    succeeded = failed = 0
+    for task in claim(worker, limit):
+        outcome = process(task)
+        if outcome:
+            succeeded += 1
+        elif outcome is False:
+            failed += 1
+    return succeeded, failed
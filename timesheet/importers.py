@@ -0,0 +1,257 @@
+"""
+Streaming import of timesheets from XLSX or CSV files (legacy pontaj sheets,
+corrections from accounting).
+
+Expected columns (header row, any order, case-insensitive):
+user (email or username), date, start_time, end_time, activity (code),
+fundssource (name), description (optional).
+
+Rows are read lazily (openpyxl read_only / csv), foreign keys are resolved through
+lookup dicts built once, daily limits are checked per batch against one
+UserDayTotal query plus what the file itself already booked, and valid rows are
+written with one bulk_create per batch. Invalid rows are reported and skipped.
+"""
+import csv
+import io
+import os
+import time as timer
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from dashboard.models import Activity
+from .archive import archive_cutoff, is_archived_day
+from .limits import FRIDAY_END, daily_limit_minutes, limit_exceeded_message
+from .models import FundsSource, Timesheet, UserDayTotal, compute_duration_minutes
+from .rollups import deferred_day_totals
+
+COLUMNS = ('user', 'date', 'start_time', 'end_time', 'activity', 'fundssource', 'description')
+REQUIRED_COLUMNS = set(COLUMNS) - {'description'}
+# Tried after ISO 8601, which is parsed with the much faster fromisoformat()
+DATE_FORMATS = ('%d.%m.%Y', '%d/%m/%Y')
+TIME_FORMATS = ('%H:%M', '%H.%M')
+
+# Errors kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (unknown format, missing columns)"""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    def add_error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, str(message)))
+
+
+def read_rows(source, file_format):
+    """Yields (row number, {column: value}) without loading the whole file"""
+    try:
+        yield from _read_rows(source, file_format)
+    except UnicodeDecodeError:
+        raise ImportFileError("The CSV file is not UTF-8 text")
+    except csv.Error as exc:
+        raise ImportFileError(f"Unreadable CSV file: {exc}")
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        # KeyError: a zip archive without the parts of a workbook
+        raise ImportFileError("The file is not an XLSX workbook")
+
+
+def _read_rows(source, file_format):
+    if file_format == 'xlsx':
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            yield from _map_columns(rows)
+        finally:
+            workbook.close()
+    elif file_format == 'csv':
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, newline='', encoding='utf-8-sig') as handle:
+                yield from _map_columns(csv.reader(handle))
+        else:
+            handle = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+            yield from _map_columns(csv.reader(handle))
+    else:
+        raise ImportFileError(f"Unsupported file format: {file_format}")
+
+
+def _map_columns(rows):
+    header = None
+    for number, values in enumerate(rows, start=1):
+        if not any(v not in (None, '') for v in values):
+            continue
+        if header is None:
+            header = [str(v or '').strip().lower() for v in values]
+            missing = REQUIRED_COLUMNS - set(header)
+            if missing:
+                raise ImportFileError(f"Missing columns: {', '.join(sorted(missing))}")
+            continue
+        yield number, {name: value for name, value in zip(header, values) if name in COLUMNS}
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or '').strip()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date '{text}'")
+
+
+def parse_time(value):
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, time):
+        return value
+    if isinstance(value, float) and 0 <= value < 1:
+        # Excel stores a bare time as a fraction of a day
+        minutes = round(value * 24 * 60)
+        return time(minutes // 60, minutes % 60)
+    text = str(value or '').strip()
+    try:
+        return time.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            pass
+    raise ValueError(f"invalid time '{text}'")
+
+
+def _key(value):
+    return str(value if value is not None else '').strip().lower()
+
+
+class TimesheetImporter:
+    def __init__(self, batch_size=5000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        User = get_user_model()
+
+        self.users = {}
+        for pk, email, username in User.objects.values_list('pk', 'email', 'username'):
+            if username:
+                self.users.setdefault(_key(username), pk)
+            if email:
+                self.users[_key(email)] = pk
+        self.activities = {}
+        for pk, code in Activity.objects.order_by('-pk').values_list('pk', 'code'):
+            self.activities[_key(code)] = pk
+        self.funds = {}
+        for pk, name in FundsSource.objects.order_by('-pk').values_list('pk', 'name'):
+            self.funds[_key(name)] = pk
+        self.cutoff = archive_cutoff()
+        # Minutes booked per (user_id, date): stored totals plus the rows accepted so far
+        self.booked = {}
+
+    def run(self, source, file_format):
+        result = ImportResult()
+        started = timer.perf_counter()
+        batch = []
+        with deferred_day_totals():
+            for number, row in read_rows(source, file_format):
+                result.rows += 1
+                try:
+                    batch.append((number, self.build(row)))
+                except ValueError as exc:
+                    result.add_error(number, exc)
+                if len(batch) >= self.batch_size:
+                    self.flush(batch, result)
+                    batch = []
+            self.flush(batch, result)
+        result.seconds = timer.perf_counter() - started
+        return result
+
+    def build(self, row):
+        """Unsaved Timesheet for one row; raises ValueError with a readable message"""
+        user_id = self.users.get(_key(row.get('user')))
+        if user_id is None:
+            raise ValueError(f"unknown user '{row.get('user')}'")
+        activity_id = self.activities.get(_key(row.get('activity')))
+        if activity_id is None:
+            raise ValueError(f"unknown activity '{row.get('activity')}'")
+        funds_id = self.funds.get(_key(row.get('fundssource')))
+        if funds_id is None:
+            raise ValueError(f"unknown funds source '{row.get('fundssource')}'")
+
+        day = parse_date(row.get('date'))
+        start_time = parse_time(row.get('start_time'))
+        end_time = parse_time(row.get('end_time'))
+        if is_archived_day(day, self.cutoff):
+            raise ValueError(f"{day.year} is archived")
+        if end_time <= start_time:
+            raise ValueError("end time must be after start time")
+        if day.weekday() == 4 and end_time > FRIDAY_END:
+            raise ValueError("Friday entries end at 14:00")
+
+        return Timesheet(
+            user_id=user_id, date=day, start_time=start_time, end_time=end_time,
+            activity_id=activity_id, fundssource_id=funds_id,
+            description=str(row.get('description') or '').strip(),
+        )
+
+    def load_booked(self, timesheets):
+        """Fetches the stored totals of the (user, date) pairs not seen yet, in one query"""
+        unseen = {(ts.user_id, ts.date) for ts in timesheets} - self.booked.keys()
+        if not unseen:
+            return
+        for key in unseen:
+            self.booked[key] = 0
+        stored = UserDayTotal.objects.filter(
+            user_id__in={user_id for user_id, _ in unseen},
+            date__gte=min(day for _, day in unseen),
+            date__lte=max(day for _, day in unseen),
+        ).values_list('user_id', 'date', 'worked_minutes', 'leave_minutes')
+        for user_id, day, worked, leave in stored.iterator():
+            if (user_id, day) in unseen:
+                self.booked[(user_id, day)] = worked + leave
+
+    def flush(self, batch, result):
+        if not batch:
+            return
+        self.load_booked([ts for _, ts in batch])
+
+        accepted = []
+        for number, ts in batch:
+            key = (ts.user_id, ts.date)
+            minutes = compute_duration_minutes(ts.start_time, ts.end_time)
+            if self.booked[key] + minutes > daily_limit_minutes(ts.date):
+                result.add_error(number, limit_exceeded_message(ts.date, self.booked[key]))
+                continue
+            self.booked[key] += minutes
+            accepted.append(ts)
+
+        if not self.dry_run and accepted:
+            with transaction.atomic():
+                Timesheet.objects.bulk_create(accepted)
+        result.created += len(accepted)
@@ -0,0 +1,109 @@
+"""
+Daily working-time rules shared by the single-entry form and the weekly grid.
+
+Monday to Thursday allow 8h30, Friday 6h ending at 14:00 at the latest, and the
+weekend falls back to the weekday limit. Existing minutes come from the
+UserDayTotal rollup, so checking any number of days costs one query.
+
+Form validation alone is racy: two submissions for the same day can both pass
+before either is saved. Writes therefore go through serialized_user_writes(),
+which locks the user's row (or, on backends without SELECT ... FOR UPDATE, a
+process-wide lock) and save_within_daily_limit() re-checks the day inside it.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+
+from .models import Timesheet, UserDayTotal, compute_duration_minutes
+from .workcalendar import FRIDAY_LIMIT_MINUTES, work_year
+
+# The usual start of a working day, from which the week grid proposes the day's limit
+DAY_START = time(8, 0)
+# Friday's limit from the usual start: 14:00
+FRIDAY_END = (datetime.combine(date.min, DAY_START) + timedelta(minutes=FRIDAY_LIMIT_MINUTES)).time()
+
+# Serializes timesheet writes where the database cannot lock rows (sqlite)
+_write_lock = threading.Lock()
+
+
+def daily_limit_minutes(day):
+    """Maximum minutes that may be booked on the given date"""
+    return work_year(day.year).limit_minutes(day)
+
+
+def day_label(day):
+    weekday = day.weekday()
+    if weekday <= 3:
+        return _("Luni-Joi")
+    if weekday == 4:
+        return _("Vineri")
+    return _("Weekend")
+
+
+def existing_day_minutes(user, days):
+    """{date: worked + leave minutes already booked} for the given user and dates, in one query"""
+    if not days:
+        return {}
+    return {
+        total.date: total.total_minutes
+        for total in UserDayTotal.objects.filter(user=user, date__in=set(days))
+    }
+
+
+def limit_exceeded_message(day, existing_minutes):
+    """Error shown when an entry would push the day past its limit"""
+    remaining = max(0, daily_limit_minutes(day) - existing_minutes)
+    rem_h, rem_m = divmod(remaining, 60)
+    return _(f"Limită de ore lucrate depășită pentru {day_label(day)}! Poți introduce maxim {rem_h}h și {rem_m:02d}m în această zi.")
+
+
+def friday_end_message():
+    return _("Programul de vineri se termină la ora 14:00.")
+
+
+def archived_day_message(day):
+    return _("Anul %(year)s este arhivat și nu mai poate fi modificat.") % {'year': day.year}
+
+
+@contextmanager
+def serialized_user_writes(user_id):
+    """
+    Transaction in which no other request can write timesheets for the same
+    user until commit: the user row is locked with SELECT ... FOR UPDATE.
+    """
+    if not connection.features.has_select_for_update:
+        with _write_lock, transaction.atomic():
+            yield
+        return
+
+    with transaction.atomic():
+        list(get_user_model().objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+        yield
+
+
+def booked_minutes(user_id, day, exclude_pk=None):
+    """Minutes stored for the user on the day, summed by the database in one query"""
+    timesheets = Timesheet.objects.filter(user_id=user_id, date=day)
+    if exclude_pk:
+        timesheets = timesheets.exclude(pk=exclude_pk)
+    return timesheets.total_minutes()
+
+
+def save_within_daily_limit(timesheet):
+    """
+    Saves the timesheet after re-checking its day's limit under the user's write
+    lock. Raises ValidationError (and saves nothing) when the limit would be exceeded.
+    Leave entries book the full standard day and are not limited, like in the form.
+    """
+    with serialized_user_writes(timesheet.user_id):
+        if not timesheet.activity.is_leave:
+            existing = booked_minutes(timesheet.user_id, timesheet.date, exclude_pk=timesheet.pk)
+            minutes = compute_duration_minutes(timesheet.start_time, timesheet.end_time)
+            if existing + minutes > daily_limit_minutes(timesheet.date):
+                raise ValidationError(limit_exceeded_message(timesheet.date, existing))
+        timesheet.save()
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timesheet.archive import archive_before, archive_cutoff
+from timesheet.models import Timesheet
+
+
+class Command(BaseCommand):
+    help = 'Moves the timesheets of closed years into the ArchivedTimesheet table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-years', type=int, default=2,
+                            help='Years kept live, counting the current one (default: 2)')
+        parser.add_argument('--before-year', type=int,
+                            help='Archive every year before this one instead')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many timesheets would move')
+
+    def handle(self, *args, **options):
+        first_open_year = options['before_year'] or date.today().year - options['keep_years'] + 1
+        if first_open_year > date.today().year:
+            raise CommandError("The current year cannot be archived.")
+        cutoff = date(first_open_year, 1, 1)
+
+        current = archive_cutoff()
+        if current and cutoff < current:
+            self.stdout.write(f"Everything before {current} is already archived.")
+            return
+
+        pending = Timesheet.objects.filter(date__lt=cutoff).count()
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{pending} timesheets dated before {cutoff} would be archived."))
+            return
+
+        moved = archive_before(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} timesheets dated before {cutoff}."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from timesheet.models import Timesheet
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored duration_minutes of existing timesheets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows read and ids updated per round trip')
+
+    def handle(self, *args, **options):
+        timesheets = Timesheet.objects.all()
+        self.stdout.write(f"Checking {timesheets.count()} timesheets...")
+
+        changed = timesheets.refresh_durations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Updated duration of {changed} timesheets."))
@@ -0,0 +1,180 @@
+import random
+import statistics
+import time as timer
+from datetime import date, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Sum
+
+from dashboard.models import Activity
+from timesheet.models import FundsSource, Timesheet
+from timesheet.periods import month_filter, year_filter
+from timesheet.rollups import deferred_day_totals
+
+User = get_user_model()
+
+BENCH_EMAIL_DOMAIN = 'bench.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the hot Timesheet queries written with date__year/date__month and no composite '
+        'indexes ("before") against range predicates with the (user, date)/(date, user) indexes ("after"). '
+        'The "before" run changes both at once, so the speedup is their combined effect. '
+        'It drops the Timesheet indexes while it runs and --seed inserts hundreds of thousands '
+        'of rows: point it at a scratch database with --database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database',
+                            help='Alias of a scratch database from DATABASES to benchmark (required '
+                                 'unless --i-know-this-is-not-production is given)')
+        parser.add_argument('--i-know-this-is-not-production', action='store_true', dest='not_production',
+                            help='Allow running against the default database')
+        parser.add_argument('--seed', action='store_true',
+                            help='Insert a synthetic dataset before benchmarking')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Executions per query; the median is reported')
+        parser.add_argument('--explain', action='store_true',
+                            help='Print the query plan of every query')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the synthetic dataset afterwards')
+
+    def handle(self, *args, **options):
+        self.db = options['database'] or DEFAULT_DB_ALIAS
+        if self.db == DEFAULT_DB_ALIAS and not options['not_production']:
+            raise CommandError(
+                "This drops and recreates the Timesheet indexes (a table rebuild on MySQL, with the hot "
+                "queries unindexed meanwhile) and --seed inserts a synthetic dataset. Run it against a "
+                "scratch database with --database <alias>, or pass --i-know-this-is-not-production."
+            )
+        if self.db not in connections:
+            raise CommandError(f"Unknown database alias {self.db!r}.")
+        connection = connections[self.db]
+        timesheets = Timesheet.objects.using(self.db)
+
+        if options['seed']:
+            self.seed(options['users'], options['years'])
+
+        self.stdout.write(f"Timesheet rows: {timesheets.count()} ({self.db}, {connection.vendor})")
+        probe = timesheets.order_by('-date').values('user_id', 'date').first()
+        if not probe:
+            self.stdout.write(self.style.WARNING("No timesheets to benchmark, run with --seed."))
+            return
+
+        user_id, year, month = probe['user_id'], probe['date'].year, probe['date'].month
+        cases = self.build_cases(user_id, year, month)
+
+        indexes = Timesheet._meta.indexes
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(Timesheet, index)
+        try:
+            before = self.run_cases(cases, 'before', options)
+        finally:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Timesheet, index)
+        after = self.run_cases(cases, 'after', options)
+
+        self.stdout.write("")
+        self.stdout.write(f"{'query':<28}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f"{name:<28}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>9.1f}x")
+        self.stdout.write("'before' uses the legacy predicates without the indexes, so each speedup "
+                          "is the combined effect of both changes.")
+
+        if options['cleanup']:
+            # The synthetic users' day totals go with them; nothing else needs refreshing
+            with deferred_day_totals(refresh=False):
+                deleted, _ = User.objects.using(self.db).filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').delete()
+            self.stdout.write(f"Deleted {deleted} synthetic rows.")
+
+    def build_cases(self, user_id, year, month):
+        """Each case maps to (legacy queryset, range-predicate queryset)"""
+        ts = Timesheet.objects.using(self.db)
+        return {
+            'calendar (user, month)': (
+                lambda: ts.filter(user_id=user_id, date__year=year, date__month=month).order_by('-date', '-start_time'),
+                lambda: ts.filter(user_id=user_id, **month_filter(year, month)).order_by('-date', '-start_time'),
+            ),
+            'list month filter': (
+                lambda: ts.filter(user_id=user_id, date__year=year, date__month=month).order_by('-date', '-created_at')[:25],
+                lambda: ts.filter(user_id=user_id, **month_filter(year, month)).order_by('-date', '-created_at')[:25],
+            ),
+            'hours summary (month)': (
+                lambda: ts.filter(date__year=year, date__month=month).values('user_id', 'date').annotate(m=Sum('duration_minutes')).order_by(),
+                lambda: ts.filter(**month_filter(year, month)).values('user_id', 'date').annotate(m=Sum('duration_minutes')).order_by(),
+            ),
+            'worked hours per member': (
+                lambda: ts.filter(date__year=year, date__month=month).values('user_id').annotate(m=Sum('duration_minutes')).order_by(),
+                lambda: ts.filter(**month_filter(year, month)).values('user_id').annotate(m=Sum('duration_minutes')).order_by(),
+            ),
+            'yearly statistics': (
+                lambda: ts.filter(date__year=year).aggregate(m=Sum('duration_minutes'), n=Count('id')),
+                lambda: ts.filter(**year_filter(year)).aggregate(m=Sum('duration_minutes'), n=Count('id')),
+            ),
+        }
+
+    def run_cases(self, cases, label, options):
+        results = {}
+        for name, (legacy, ranged) in cases.items():
+            make_qs = legacy if label == 'before' else ranged
+            timings = []
+            for _ in range(options['repeat']):
+                started = timer.perf_counter()
+                result = make_qs()
+                if not isinstance(result, dict):
+                    list(result)
+                timings.append((timer.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+
+            if options['explain']:
+                qs = make_qs()
+                if not isinstance(qs, dict):
+                    self.stdout.write(self.style.MIGRATE_HEADING(f"[{label}] {name}"))
+                    self.stdout.write(qs.explain())
+        return results
+
+    def seed(self, user_count, years):
+        """
+        One to two entries per working day for every synthetic user. No day totals
+        are computed: the benchmarked queries read the timesheets only.
+        """
+        rng = random.Random(42)
+        activity, _ = Activity.objects.using(self.db).get_or_create(
+            code='BENCH', defaults={'group': 'BENCH', 'subgroup': 'BENCH', 'name': 'Benchmark', 'responsible': 'IT'}
+        )
+        funds, _ = FundsSource.objects.using(self.db).get_or_create(name='BENCH', defaults={'description': 'Benchmark'})
+
+        users = [
+            User(email=f'bench{i}@{BENCH_EMAIL_DOMAIN}', username=f'bench{i}', is_active=True)
+            for i in range(user_count)
+        ]
+        User.objects.using(self.db).bulk_create(users, ignore_conflicts=True)
+        user_ids = list(User.objects.using(self.db).filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').values_list('id', flat=True))
+
+        first_day = date(date.today().year - years + 1, 1, 1)
+        days = [first_day + timedelta(days=i) for i in range((date.today() - first_day).days + 1)]
+        working_days = [d for d in days if d.weekday() < 5]
+
+        timesheets = Timesheet.objects.using(self.db)
+        batch, created = [], 0
+        with deferred_day_totals(refresh=False):
+            for user_id in user_ids:
+                for day in working_days:
+                    for start, end in ((time(8, 0), time(12, 0)), (time(12, 0), time(16, 30)))[:rng.randint(1, 2)]:
+                        batch.append(Timesheet(user_id=user_id, date=day, start_time=start, end_time=end,
+                                               activity=activity, fundssource=funds))
+                    if len(batch) >= 5000:
+                        timesheets.bulk_create(batch)
+                        created += len(batch)
+                        batch = []
+            timesheets.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Seeded {created} timesheets for {len(user_ids)} users."))
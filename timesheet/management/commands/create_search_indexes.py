@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from timesheet.models import ArchivedTimesheet, Timesheet
+from timesheet.search import FULLTEXT_INDEX
+
+
+class Command(BaseCommand):
+    help = 'Creates the MySQL FULLTEXT indexes behind the timesheet description search'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            self.stdout.write(f"{connection.vendor} has no FULLTEXT indexes; the search falls back to icontains.")
+            return
+
+        for model in (Timesheet, ArchivedTimesheet):
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                    [table, FULLTEXT_INDEX],
+                )
+                if cursor.fetchone():
+                    self.stdout.write(f"{table} already has {FULLTEXT_INDEX}.")
+                    continue
+                cursor.execute(
+                    f"ALTER TABLE {connection.ops.quote_name(table)} "
+                    f"ADD FULLTEXT INDEX {connection.ops.quote_name(FULLTEXT_INDEX)} (`description`)"
+                )
+            self.stdout.write(self.style.SUCCESS(f"Created {FULLTEXT_INDEX} on {table}."))
@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timesheet.importers import ImportFileError, TimesheetImporter
+
+
+class Command(BaseCommand):
+    help = 'Imports timesheets from an XLSX or CSV file (user, date, start_time, end_time, activity, fundssource, description)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['xlsx', 'csv'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate every row without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        importer = TimesheetImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        try:
+            result = importer.run(path, file_format)
+        except (ImportFileError, OSError) as exc:
+            raise CommandError(exc)
+
+        for number, message in result.errors:
+            self.stdout.write(self.style.WARNING(f"Row {number}: {message}"))
+        if result.failed > len(result.errors):
+            self.stdout.write(f"... and {result.failed - len(result.errors)} more errors.")
+
+        verb = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.created} of {result.rows} rows ({result.failed} rejected) "
+            f"in {result.seconds:.1f}s, {result.rows_per_second:.0f} rows/s."
+        ))
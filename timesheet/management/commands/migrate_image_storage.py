@@ -0,0 +1,55 @@
+import os
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from timesheet.models import TimesheetImage
+from timesheet.storage import HASHED_NAME, content_digest, hashed_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the timesheet images still stored under their upload name into the '
+        'content-addressed, sharded layout; identical files are kept once. Safe to rerun.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='File names read per database round trip (default: 500)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many files would move and how many are duplicates')
+
+    def handle(self, *args, **options):
+        field = TimesheetImage._meta.get_field('image')
+        storage = field.storage
+        dry_run = options['dry_run']
+        legacy = TimesheetImage.objects.exclude(image='').exclude(image__regex=HASHED_NAME.pattern)\
+            .order_by('image').values_list('image', flat=True).distinct()
+
+        totals = Counter()
+        targets = set()
+        for name in legacy.iterator(chunk_size=options['chunk_size']):
+            if not storage.exists(name):
+                totals['missing'] += 1
+                continue
+            upload_name = field.generate_filename(None, os.path.basename(name))
+            with storage.open(name, 'rb') as source:
+                target = hashed_name(upload_name, content_digest(source))
+                if storage.exists(target) or target in targets:
+                    totals['duplicate'] += 1
+                    totals['saved'] += storage.size(name)
+                elif not dry_run:
+                    storage.save(upload_name, source)
+                if not dry_run:
+                    TimesheetImage.objects.filter(image=name).update(image=target)
+                    storage.keep(target, source)
+            targets.add(target)
+            totals['moved'] += 1
+            if not dry_run:
+                TimesheetImage.release_file(name)
+
+        would = 'would be ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['moved']} files {would}moved, {totals['duplicate']} of them duplicates "
+            f"({totals['saved'] / 1024 / 1024:.1f} MB {would}saved), {totals['missing']} missing."
+        ))
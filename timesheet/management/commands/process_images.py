@@ -0,0 +1,38 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from timesheet.image_queue import run_once
+
+
+class Command(BaseCommand):
+    help = 'Background worker compressing uploaded timesheet images from the ImageTask queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the tasks that are due, then exit')
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='Seconds to wait when the queue is empty (default: 5)')
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        total_succeeded = total_failed = 0
+        try:
+            while True:
+                succeeded, failed = run_once(worker, options['batch_size'])
+                total_succeeded += succeeded
+                total_failed += failed
+                if succeeded or failed:
+                    self.stdout.write(f"Processed {succeeded} images, {failed} failed.")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker {worker} stopped: {total_succeeded} images processed, {total_failed} failed."
+        ))
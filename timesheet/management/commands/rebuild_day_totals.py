@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from timesheet.models import ArchivedTimesheet, Timesheet, UserDayTotal
+from timesheet.rollups import rebuild_day_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-user daily totals (UserDayTotal) from the timesheets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild this user id')
+        parser.add_argument('--from', dest='date_from', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        scope = {}
+        if options['user']:
+            scope['user_id'] = options['user']
+        if options['date_from']:
+            scope['date__gte'] = parse_date(options['date_from'])
+        if options['date_to']:
+            scope['date__lte'] = parse_date(options['date_to'])
+
+        with transaction.atomic():
+            deleted, _ = UserDayTotal.objects.filter(**scope).delete()
+            written = sum(
+                rebuild_day_totals(model.objects.filter(**scope), batch_size=options['batch_size'])
+                for model in (ArchivedTimesheet, Timesheet)
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} and wrote {written} day totals."))
@@ -1,38 +1,119 @@
 import os
-from PIL import Image
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+from django.core.files import File
 from django.core.management.base import BaseCommand
-# Change 'reports' to the actual folder name of your app
-from timesheet.models import TimesheetImage 
+from PIL import Image
+
+from timesheet.models import ImageStatus, TimesheetImage
+from timesheet.renditions import COMPRESS_MAX_WIDTH, COMPRESS_PROFILE, CONFORMING_MAX_BYTES, compress_bytes
+
+# Recorded as processed_with of images whose file is missing or unreadable, so reruns skip them
+SKIPPED_OUTCOMES = ('missing', 'error')
+
+
+def shrink(task):
+    """
+    Runs in a pool process, without the database: compresses one file and
+    returns (name, outcome, bytes before, bytes after, path of the new JPEG).
+    The new JPEG is written to scratch, the command's temporary directory.
+    """
+    name, path, scratch = task
+    try:
+        before = os.path.getsize(path)
+        with Image.open(path) as img:
+            is_jpeg = img.format == 'JPEG'
+            if is_jpeg and img.width <= COMPRESS_MAX_WIDTH and before <= CONFORMING_MAX_BYTES:
+                return name, 'within', before, before, None
+        data = compress_bytes(path)
+    except FileNotFoundError:
+        return name, 'missing', 0, 0, None
+    except Exception:
+        return name, 'error', 0, 0, None
+
+    if len(data) >= before and is_jpeg:
+        # Re-encoding would not help
+        return name, 'within', before, before, None
+    written = None
+    if scratch:
+        # Stored under its content hash by the parent (record); the original stays until then
+        fd, written = tempfile.mkstemp(dir=scratch, suffix='.jpg')
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+    return name, 'compressed', before, len(data), written
+
 
 class Command(BaseCommand):
-    help = 'Resizes all existing timesheet images to save disk space'
-
-    def handle(self, *args, **kwargs):
-        images = TimesheetImage.objects.all()
-        self.stdout.write(f"Found {images.count()} images. Starting...")
-
-        for ts_img in images:
-            # Check if image field has a file and if that file exists on disk
-            if not ts_img.image or not os.path.exists(ts_img.image.path):
-                continue
-            
-            file_path = ts_img.image.path
-            
-            # Open the image using Pillow
-            with Image.open(file_path) as img:
-                # Only process if wide (>1200px) or heavy (>500KB)
-                if img.width > 1200 or os.path.getsize(file_path) > 500000:
-                    max_width = 1200
-                    w_percent = (max_width / float(img.width))
-                    h_size = int((float(img.height) * float(w_percent)))
-                    
-                    # Resize and handle transparency
-                    resized_img = img.resize((max_width, h_size), Image.Resampling.LANCZOS)
-                    if resized_img.mode in ("RGBA", "P"):
-                        resized_img = resized_img.convert("RGB")
-                    
-                    # Save back to the same path
-                    resized_img.save(file_path, "JPEG", quality=70, optimize=True)
-                    self.stdout.write(self.style.SUCCESS(f"Compressed: {os.path.basename(file_path)}"))
-                else:
-                    self.stdout.write(f"Skipped: {os.path.basename(file_path)}")
\ No newline at end of file
+    help = (
+        'Compresses the stored timesheet images that were not written with the current '
+        'profile, in parallel. Processed images are marked, so reruns skip them; so are '
+        'missing and unreadable files, until --retry-skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Pool processes (default: one per core)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Images read, processed and recorded per round (default: 500)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be compressed and the bytes it would save')
+        parser.add_argument('--retry-skipped', action='store_true',
+                            help='Also check the images found missing or unreadable by earlier runs')
+
+    def handle(self, *args, **options):
+        field = TimesheetImage._meta.get_field('image')
+        dry_run = options['dry_run']
+        chunk_size = options['chunk_size']
+        # Uploads still queued are left to the process_images worker; a file shared
+        # by several images is compressed once
+        done = [COMPRESS_PROFILE] if options['retry_skipped'] else [COMPRESS_PROFILE, *SKIPPED_OUTCOMES]
+        pending = TimesheetImage.objects.filter(status=ImageStatus.READY)\
+            .exclude(processed_with__in=done).exclude(image='')\
+            .order_by('image').values_list('image', flat=True).distinct()
+
+        totals = Counter()
+        rows = pending.iterator(chunk_size=chunk_size)
+        # The re-encoded files wait outside the storage, so an interrupted run leaves
+        # nothing in the shard directories; the directory goes with the run.
+        # Forked, so the workers inherit the loaded apps; they never touch the database
+        with tempfile.TemporaryDirectory(prefix='resize_images-') as scratch, \
+                ProcessPoolExecutor(max_workers=options['workers'], mp_context=get_context('fork')) as pool:
+            while batch := list(islice(rows, chunk_size)):
+                tasks = [(name, field.storage.path(name), None if dry_run else scratch) for name in batch]
+                chunks = max(1, len(tasks) // (options['workers'] * 4))
+                marks = defaultdict(list)
+                # Each compressed file is recorded as soon as it arrives, so an interrupted run keeps it
+                for name, outcome, before, after, written in pool.map(shrink, tasks, chunksize=chunks):
+                    totals[outcome] += 1
+                    totals['saved'] += before - after
+                    if written:
+                        self.record(field, name, after, written)
+                    elif outcome != 'compressed':
+                        marks[COMPRESS_PROFILE if outcome == 'within' else outcome].append(name)
+                if not dry_run:
+                    for mark, names in marks.items():
+                        TimesheetImage.objects.filter(status=ImageStatus.READY, image__in=names)\
+                            .update(processed_with=mark)
+                self.stdout.write(f"{sum(totals[o] for o in ('compressed', 'within', 'missing', 'error'))} images checked...")
+
+        would = 'would be ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['compressed']} images {would}compressed, {totals['within']} already within the profile, "
+            f"{totals['missing']} missing, {totals['error']} unreadable; "
+            f"{totals['saved'] / 1024 / 1024:.1f} MB {would}saved."
+        ))
+
+    def record(self, field, name, size, written):
+        """Stores a re-encoded file under its content hash and points the images of name at it"""
+        stem = os.path.splitext(os.path.basename(name))[0]
+        with open(written, 'rb') as compressed:
+            new_name = field.storage.save(field.generate_filename(None, f"{stem}.jpg"), File(compressed))
+            TimesheetImage.objects.filter(status=ImageStatus.READY, image=name)\
+                .update(image=new_name, processed_with=COMPRESS_PROFILE, file_size=size)
+            field.storage.keep(new_name, File(compressed))
+        os.remove(written)
+        TimesheetImage.release_file(name)
@@ -1,10 +1,14 @@
+from collections import defaultdict
+from functools import partial
 from datetime import datetime, timedelta
-import sys
+import os
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum
 from django.conf import settings
-from dashboard.models import Activity
+from dashboard.models import Activity, LeaveCategory
 from django.utils import timezone
+from .periods import month_filter, year_filter
 
 def default_start_time():
     now = timezone.localtime()
@@ -16,6 +20,20 @@ def default_end_time():
     return now.replace(hour=10, minute=0, second=0, microsecond=0).time()
 
 
+def compute_duration_minutes(start_time, end_time):
+    """
+    Length of a shift in whole minutes. An end time earlier than the start time
+    is an overnight shift, so the end rolls over to the next day.
+    """
+    if not start_time or not end_time:
+        return 0
+    start_dt = datetime.combine(datetime.min, start_time)
+    end_dt = datetime.combine(datetime.min, end_time)
+    if end_dt < start_dt:
+        end_dt += timedelta(days=1)
+    return int((end_dt - start_dt).total_seconds() // 60)
+
+
 class FundsSource(models.Model):
     """This class created db tables for the source of funds, which will be selectable from a
     dropdown list when generating a timesheet
@@ -31,9 +49,101 @@ class FundsSource(models.Model):
         return self.name
 
 
-class Timesheet(models.Model):
+class TimesheetQuerySet(models.QuerySet):
     """
-    This class created db tables for each timesheet, linked to activity model and FundsSource model by ForeinKey relations
+    Keeps duration_minutes in sync for the bulk paths that bypass Timesheet.save()
+    """
+    DURATION_SOURCE_FIELDS = {'start_time', 'end_time'}
+
+    # Fields that change which day rollup (UserDayTotal) a row belongs to or contributes to
+    ROLLUP_SOURCE_FIELDS = {'user', 'user_id', 'date', 'activity', 'activity_id', 'duration_minutes'} | DURATION_SOURCE_FIELDS
+
+    def update(self, **kwargs):
+        from .rollups import refresh_day_totals
+
+        if not self.ROLLUP_SOURCE_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            days_before = set(self.values_list('pk', 'user_id', 'date'))
+            rows = super().update(**kwargs)
+            pks = [pk for pk, _, _ in days_before]
+            updated = self.model.objects.using(self.db).filter(pk__in=pks)
+            if self.DURATION_SOURCE_FIELDS.intersection(kwargs):
+                updated.refresh_durations()
+            days = {(user_id, day) for _, user_id, day in days_before}
+            days.update(updated.values_list('user_id', 'date'))
+            refresh_day_totals(days)
+        return rows
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .rollups import refresh_day_totals
+
+        objs = list(objs)
+        for obj in objs:
+            obj.duration_minutes = compute_duration_minutes(obj.start_time, obj.end_time)
+        created = super().bulk_create(objs, *args, **kwargs)
+        refresh_day_totals((obj.user_id, obj.date) for obj in objs)
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .rollups import refresh_day_totals
+
+        objs = list(objs)
+        fields = list(fields)
+        if self.DURATION_SOURCE_FIELDS.intersection(fields):
+            for obj in objs:
+                obj.duration_minutes = compute_duration_minutes(obj.start_time, obj.end_time)
+            if 'duration_minutes' not in fields:
+                fields.append('duration_minutes')
+        if not self.ROLLUP_SOURCE_FIELDS.intersection(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+
+        with transaction.atomic(using=self.db):
+            days = set(self.filter(pk__in=[obj.pk for obj in objs]).values_list('user_id', 'date'))
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            days.update((obj.user_id, obj.date) for obj in objs)
+            refresh_day_totals(days)
+        return rows
+    bulk_update.alters_data = True
+
+    def refresh_durations(self, batch_size=2000):
+        """
+        Recomputes duration_minutes for every row in the queryset, issuing one
+        UPDATE per distinct duration (and per batch of ids) rather than per row.
+        Returns the number of rows whose stored value changed.
+        """
+        stale = defaultdict(list)
+        rows = self.values_list('pk', 'start_time', 'end_time', 'duration_minutes')
+        for pk, start_time, end_time, stored in rows.iterator(chunk_size=batch_size):
+            minutes = compute_duration_minutes(start_time, end_time)
+            if minutes != stored:
+                stale[minutes].append(pk)
+
+        changed = 0
+        base = models.QuerySet(self.model, using=self.db)
+        for minutes, pks in stale.items():
+            for i in range(0, len(pks), batch_size):
+                changed += base.filter(pk__in=pks[i:i + batch_size]).update(duration_minutes=minutes)
+        return changed
+
+    def in_month(self, year, month):
+        """Index-friendly equivalent of filter(date__year=year, date__month=month)"""
+        return self.filter(**month_filter(year, month))
+
+    def in_year(self, year):
+        """Index-friendly equivalent of filter(date__year=year)"""
+        return self.filter(**year_filter(year))
+
+    def total_minutes(self):
+        """Total worked minutes of the queryset, summed by the database"""
+        return self.aggregate(total=Sum('duration_minutes'))['total'] or 0
+
+
+class TimesheetFields(models.Model):
+    """
+    Columns shared by the live Timesheet table and its cold ArchivedTimesheet copy.
+    Both keep the same column order, so their querysets can be combined with union().
     """
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -47,95 +157,260 @@ class Timesheet(models.Model):
     description = models.TextField(blank=True)
     submitted_to_smart = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # Denormalised length of the shift, kept in sync on save and on bulk writes
+    duration_minutes = models.PositiveIntegerField(default=0, editable=False)
+
+    is_archived = False
+
+    class Meta:
+        abstract = True
 
     # This method is used to set the upload path for images associated with the timesheet
     def get_image_upload_path(self, filename):
             return f'timesheet_images/user_{self.user.pk}/{self.date}/{filename}'
 
     def worked_hours(self):
-        if self.start_time and self.end_time:
-            start_dt = timezone.datetime.combine(self.date, self.start_time)
-            end_dt = timezone.datetime.combine(self.date, self.end_time)
-            
-            if end_dt < start_dt:
-                # Handle overnight shift: add 1 day to end_dt
-                end_dt += timedelta(days=1)
-                
-            duration = end_dt - start_dt
-            return round(duration.total_seconds() / 3600, 2)
-        return 0
+        return round(self.duration_minutes / 60, 2)
 
     @property
     def duration_decimal(self):
         """Returns hours as 8.5"""
-        if self.start_time and self.end_time:
-            start = datetime.combine(datetime.today(), self.start_time)
-            end = datetime.combine(datetime.today(), self.end_time)
-            if end < start:
-                end += timedelta(days=1)
-            return (end - start).total_seconds() / 3600
-        return 0
+        return self.duration_minutes / 60
 
     @property
     def duration_display(self):
         """Returns formatted string '8h 30m'"""
-        total_hours = self.duration_decimal
-        hours = int(total_hours)
-        minutes = int(round((total_hours - hours) * 60))
+        hours, minutes = divmod(self.duration_minutes, 60)
         return f"{hours}h {minutes:02d}m"
 
     # This method is used to set the upload path for documents associated with the timesheet
     def __str__(self):
         return f"Timesheet for {self.user.username}"
 
+
+class Timesheet(TimesheetFields):
+    """
+    This class created db tables for each timesheet, linked to activity model and FundsSource model by ForeinKey relations
+    """
+    objects = TimesheetQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the (user, day) the row was loaded with, so moving it to another
+        # day also refreshes the rollup it left. Read from __dict__ to keep deferred fields deferred.
+        instance._loaded_day = (instance.__dict__.get('user_id'), instance.__dict__.get('date'))
+        return instance
+
+    class Meta:
+        indexes = [
+            # Per-user month/day lookups (calendar, list, daily limit check)
+            models.Index(fields=['user', 'date'], name='timesheet_user_date_idx'),
+            # Organisation-wide period scans grouped by user (summaries, analytics)
+            models.Index(fields=['date', 'user'], name='timesheet_date_user_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.duration_minutes = compute_duration_minutes(self.start_time, self.end_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start_time', 'end_time'}.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'duration_minutes'}
+        super().save(*args, **kwargs)
+
+
+class ArchivedTimesheet(TimesheetFields):
+    """
+    Timesheets of closed years, moved here by the archive_timesheets command with
+    their original ids. Read-only; see timesheet.archive for transparent reads.
+    """
+    is_archived = True
+
+    class Meta:
+        verbose_name = "Archived timesheet"
+        verbose_name_plural = "Archived timesheets"
+        indexes = [
+            models.Index(fields=['user', 'date'], name='archived_user_date_idx'),
+            models.Index(fields=['date', 'user'], name='archived_date_user_idx'),
+        ]
+
+
+class UserDayTotal(models.Model):
+    """
+    Rollup of one user's timesheets on one day, maintained by timesheet.rollups on
+    every Timesheet write so calendars and summaries read one row per day.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='day_totals')
+    date = models.DateField()
+    # Minutes booked on regular work activities
+    worked_minutes = models.PositiveIntegerField(default=0)
+    # Minutes booked on leave activities (CO/CM/EF)
+    leave_minutes = models.PositiveIntegerField(default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+    leave_category = models.PositiveSmallIntegerField(choices=LeaveCategory.choices, default=LeaveCategory.WORK)
+
+    class Meta:
+        verbose_name = "Day total"
+        verbose_name_plural = "Day totals"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_user_day_total'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'user'], name='daytotal_date_user_idx'),
+        ]
+
+    @property
+    def total_minutes(self):
+        return self.worked_minutes + self.leave_minutes
+
+    @property
+    def is_leave(self):
+        return self.leave_category != LeaveCategory.WORK
+
+    def __str__(self):
+        return f"{self.user} {self.date}: {self.total_minutes} min"
+
+
 from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from .renditions import COMPRESS_PROFILE, compress_bytes, conforms, ensure as ensure_rendition
+from .storage import image_storage
+
+class ImageStatus(models.IntegerChoices):
+    """Where an uploaded image is in the background processing (see timesheet.image_queue)"""
+    PENDING = 0, 'Pending'
+    PROCESSING = 1, 'Processing'
+    READY = 2, 'Ready'
+    FAILED = 3, 'Failed'
+
 
 class TimesheetImage(models.Model):
     """
     This class creates db tables for images associated with timesheets
     """
-    timesheet = models.ForeignKey(Timesheet, related_name='timesheet_images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='timesheet_images/') 
+    timesheet = models.ForeignKey(Timesheet, related_name='timesheet_images', on_delete=models.CASCADE,
+                                  null=True, blank=True)
+    # Set instead of timesheet once the entry has been archived
+    archived_timesheet = models.ForeignKey(ArchivedTimesheet, related_name='timesheet_images',
+                                           on_delete=models.CASCADE, null=True, blank=True)
+    # Named by content hash (timesheet.storage): identical uploads share one file
+    image = models.ImageField(upload_to='timesheet_images/', storage=image_storage, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Images stored before the queue existed were compressed on upload
+    status = models.PositiveSmallIntegerField(choices=ImageStatus.choices, default=ImageStatus.READY)
+    # Compression profile the stored file was written with (renditions.COMPRESS_PROFILE), '' when unknown
+    processed_with = models.CharField(max_length=20, blank=True)
+    # Bytes of the stored file, null for images stored before it was recorded
+    file_size = models.PositiveIntegerField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
-        if not self.pk or (self.image and hasattr(self.image, 'file')):
-            if not isinstance(self.image.file, BytesIO):
-                self.image = self.compress_image(self.image)
-        super().save(*args, **kwargs)
+        # Uploads are stored as they come; the process_images worker compresses them,
+        # unless the browser already did (renditions.conforms)
+        queue = self._state.adding and bool(self.image)
+        if queue:
+            self.file_size = self.image.size
+            if conforms(self.image, self.file_size):
+                queue = False
+                self.status = ImageStatus.READY
+                self.processed_with = COMPRESS_PROFILE
+            else:
+                self.status = ImageStatus.PENDING
+        # A new file may have been deduplicated against one a concurrent release deletes
+        content = None if not self.image or self.image._committed else self.image.file
+        # The row and its task commit together, so no upload is left without its task
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if queue:
+                ImageTask.objects.create(image=self)
+        if content is not None:
+            transaction.on_commit(partial(image_storage.keep, self.image.name, content))
+
+    @property
+    def is_ready(self):
+        return self.status == ImageStatus.READY
+
+    @classmethod
+    def release_file(cls, name):
+        """
+        Deletes a stored file once no image refers to it any more, checked after
+        the current transaction commits: a rolled-back delete keeps its file.
+        """
+        if name:
+            transaction.on_commit(partial(cls.delete_unreferenced, name))
+
+    @classmethod
+    def delete_unreferenced(cls, name):
+        with image_storage.lock():
+            if not cls.objects.filter(image=name).exists():
+                image_storage.delete(name)
+
+    def rendition(self, name):
+        """
+        Storage name of a downscaled copy (thumbnail, preview or print, see
+        timesheet.renditions), made on first use; None when it cannot be made.
+        """
+        if not self.image:
+            return None
+        try:
+            return ensure_rendition(self, name)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Missing or unreadable file: callers fall back to the original
+            return None
+
+    def rendition_url(self, name):
+        """
+        URL of the rendition for pages. Until the worker processed the upload the
+        original is shown: decoding it inside the request is the work the queue
+        takes off the page, and the worker makes the renditions (generate_all).
+        """
+        rendition = self.rendition(name) if self.is_ready else None
+        if rendition:
+            return default_storage.url(rendition)
+        return self.image.url if self.image else ''
+
+    def rendition_path(self, name):
+        rendition = self.rendition(name)
+        return default_storage.path(rendition) if rendition else self.image.path
 
     def compress_image(self, uploaded_image):
-        img = Image.open(uploaded_image)
-        
-        # Convert to RGB (required for JPEG)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # 1. Resize: Set a max width of 1200px (plenty for reports)
-        max_width = 1200
-        if img.width > max_width:
-            output_size = (max_width, int((max_width / img.width) * img.height))
-            img = img.resize(output_size, Image.Resampling.LANCZOS)
-
-        # 2. Compress
-        output_io_stream = BytesIO()
-        img.save(output_io_stream, format='JPEG', quality=70, optimize=True)
-        output_io_stream.seek(0)
-
-        # 3. Wrap back into a Django-friendly file
-        return InMemoryUploadedFile(
-            output_io_stream,
-            'ImageField',
-            f"{uploaded_image.name.split('.')[0]}.jpg",
-            'image/jpeg',
-            sys.getsizeof(output_io_stream),
-            None
+        """The upload as the full-size JPEG (see renditions.compress_bytes), as a Django file"""
+        return ContentFile(
+            compress_bytes(uploaded_image),
+            name=f"{os.path.splitext(os.path.basename(uploaded_image.name))[0]}.jpg",
         )
 
+    @property
+    def entry(self):
+        """The live or archived timesheet the image belongs to"""
+        return self.timesheet or self.archived_timesheet
+
+    def __str__(self):
+        return f"Image for {self.entry.user.username} on {self.entry.date}"
+
+
+class ImageTask(models.Model):
+    """
+    Queued background work on an uploaded image, claimed and consumed by the
+    process_images command; the row is deleted once the work succeeded.
+    """
+    image = models.ForeignKey(TimesheetImage, related_name='tasks', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Not claimed before this time (retries back off)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Image task"
+        verbose_name_plural = "Image tasks"
+        indexes = [
+            models.Index(fields=['available_at'], name='imagetask_available_idx'),
+        ]
+
     def __str__(self):
-        return f"Image for {self.timesheet.user.username} on {self.timesheet.date}"
+        return f"Task for image {self.image_id} (attempt {self.attempts + 1})"
 
 
 # class TimesheetDocument(models.Model):
@@ -0,0 +1,128 @@
+"""
+Cached month grid of the timesheet calendar.
+
+The grid (status colour, hours and entry count of every day, days off)
+only depends on the user's UserDayTotal rows, so it is computed once per
+(user, year, month) and kept in the cache. day_totals_changed evicts the months
+holding the refreshed days, immediately and again after commit so a request
+racing the write cannot store the old totals; a rebuild of unknown scope bumps
+a generation number that is part of every key.
+"""
+import calendar
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import UserDayTotal
+from .periods import month_filter
+from .workcalendar import work_year
+
+GENERATION_KEY = 'timesheet:calendar:generation'
+MONTH_KEY = 'timesheet:calendar:{generation}:{user_id}:{year}-{month}'
+MONTH_TIMEOUT = 7 * 24 * 3600
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # From the clock: a restart at 1 would serve entries cached under an earlier 1
+        seed = time.time_ns()
+        cache.add(GENERATION_KEY, seed, None)
+        generation = cache.get(GENERATION_KEY, seed)
+    return generation
+
+
+def month_key(user_id, year, month, generation=None):
+    return MONTH_KEY.format(generation=generation or _generation(), user_id=user_id, year=year, month=month)
+
+
+def day_status(total_hours, target_hours, is_holiday):
+    if total_hours >= target_hours:
+        return "success"  # Green (worked full target hours)
+    if total_hours > 0:
+        return "warning"  # Yellow (worked partial hours)
+    if is_holiday:
+        return "info"     # Blue (legal holiday, no hours recorded)
+    return "danger"       # Red (missing working hours on regular day)
+
+
+def build_month_matrix(user_id, year, month):
+    """Weeks (Monday first) of day cells for the calendar template"""
+    calendar_year = work_year(year)
+    totals = {
+        total.date: total
+        for total in UserDayTotal.objects.filter(user_id=user_id, **month_filter(year, month))
+    }
+
+    matrix = []
+    for week in calendar.Calendar(firstweekday=0).monthdatescalendar(year, month):
+        week_data = []
+        for day in week:
+            if day.month != month:
+                week_data.append({
+                    'day': day, 'status': 'muted', 'total_decimal': 0, 'total_hm': '',
+                    'activities': 0, 'is_holiday': False, 'holiday_name': '',
+                })
+                continue
+
+            total = totals.get(day)
+            minutes = total.total_minutes if total else 0
+            is_holiday = calendar_year.is_day_off(day)
+            hours, rest = divmod(minutes, 60)
+            week_data.append({
+                'day': day,
+                'status': day_status(minutes / 60, calendar_year.target_hours(day), is_holiday),
+                'total_decimal': minutes / 60,
+                'total_hm': f"{hours}h {rest}m" if minutes > 0 else "0h",
+                'activities': total.entry_count if total else 0,
+                'is_holiday': is_holiday,
+                'holiday_name': calendar_year.day_name(day),
+            })
+        matrix.append(week_data)
+    return matrix
+
+
+def get_month_matrix(user_id, year, month):
+    key = month_key(user_id, year, month)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_month_matrix(user_id, year, month)
+        cache.set(key, matrix, MONTH_TIMEOUT)
+    return matrix
+
+
+def invalidate_months(days):
+    """Evicts the cached months holding the given (user_id, date) pairs; None evicts all of them"""
+    if days is None:
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, time.time_ns(), None)
+        return
+
+    months = defaultdict(set)
+    for user_id, day in days:
+        months[user_id].add((day.year, day.month))
+    generation = _generation()
+    keys = [
+        month_key(user_id, year, month, generation)
+        for user_id, user_months in months.items()
+        for year, month in user_months
+    ]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def parse_month(params, today=None):
+    """(year, month) from ?year=&month=, falling back to the current month"""
+    today = today or date.today()
+    try:
+        year = int(params.get('year', today.year))
+        month = int(params.get('month', today.month))
+        date(year, month, 1)
+    except (TypeError, ValueError):
+        return today.year, today.month
+    return year, month
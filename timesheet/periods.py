@@ -0,0 +1,35 @@
+"""
+Date period helpers that turn a month or a year into half-open date ranges.
+
+Filtering with date__year / date__month wraps the column in a function call
+(YEAR(`date`) = ... on MySQL), so no index on `date` can be used. The helpers
+below emit plain `date >= start AND date < end` predicates instead.
+"""
+from datetime import date
+
+
+def month_bounds(year, month):
+    """Returns (first day of the month, first day of the next month)"""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def year_bounds(year):
+    """Returns (1st of January, 1st of January of the next year)"""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def range_filter(start, end, field='date'):
+    """Filter kwargs for the half-open interval [start, end)"""
+    return {f'{field}__gte': start, f'{field}__lt': end}
+
+
+def month_filter(year, month, field='date'):
+    """Filter kwargs matching every day of the given month"""
+    return range_filter(*month_bounds(year, month), field=field)
+
+
+def year_filter(year, field='date'):
+    """Filter kwargs matching every day of the given year"""
+    return range_filter(*year_bounds(year), field=field)
@@ -0,0 +1,156 @@
+"""
+Process-local registry of the reference data behind the timesheet forms:
+activities, funds sources, the activity booked for each leave type and the
+default funds source of leave entries.
+
+Each worker keeps the data as compact tuples. A version number in the shared
+cache is bumped once an Activity/FundsSource save or delete commits, and
+started again from the clock when the cache lost it, so no data cached under an
+older number comes back. A worker
+only rebuilds its copy when the version moved, taking it from the cache when
+another worker already did the work, else with two queries.
+"""
+import time
+from collections import namedtuple
+
+from django import forms
+from django.core.cache import cache
+
+from dashboard.models import Activity, LeaveCategory
+from general.widgets import AutocompleteSelect
+from .models import FundsSource
+
+VERSION_KEY = 'reference:version'
+DATA_KEY = 'reference:data:{}'
+DEFAULT_FUNDS_NAME = 'RNP ROMSILVA'
+
+ActivityRef = namedtuple('ActivityRef', 'id code name leave_category')
+FundsRef = namedtuple('FundsRef', 'id name')
+ReferenceData = namedtuple(
+    'ReferenceData', 'activities funds activity_index funds_index leave_activities default_funds'
+)
+
+_local = {'version': None, 'data': None}
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        seed = time.time_ns()
+        cache.add(VERSION_KEY, seed, None)
+        version = cache.get(VERSION_KEY, seed)
+    return version
+
+
+def bump_version():
+    """Invalidates every worker's copy; called by the model signals once the change commits"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    _local['version'] = None
+
+
+def load_reference_data():
+    activities = tuple(
+        ActivityRef(*row)
+        for row in Activity.objects.order_by('sort_key', 'pk').values_list('id', 'code', 'name', 'leave_category')
+    )
+    funds = tuple(FundsRef(*row) for row in FundsSource.objects.order_by('pk').values_list('id', 'name'))
+
+    leave_activities = {}
+    for activity in sorted(activities, key=lambda a: a.id):
+        if activity.leave_category != LeaveCategory.WORK:
+            leave_activities.setdefault(activity.leave_category, activity.id)
+    default_funds = next((f.id for f in funds if f.name.strip().upper() == DEFAULT_FUNDS_NAME), None)
+    if default_funds is None:
+        default_funds = next((f.id for f in funds if DEFAULT_FUNDS_NAME in f.name.upper()), None)
+    return ReferenceData(
+        activities, funds,
+        {a.id: a for a in activities}, {f.id: f for f in funds},
+        leave_activities, default_funds,
+    )
+
+
+def get_reference_data():
+    version = current_version()
+    if _local['version'] == version:
+        return _local['data']
+
+    data = cache.get(DATA_KEY.format(version))
+    if data is None:
+        data = load_reference_data()
+        cache.set(DATA_KEY.format(version), data, 24 * 3600)
+    _local.update(version=version, data=data)
+    return data
+
+
+def _instance(model, ref):
+    # Loaded-from-db instance; the fields not kept in the registry are deferred
+    return model.from_db('default', list(ref._fields), list(ref))
+
+
+def get_activity(pk):
+    ref = get_reference_data().activity_index.get(pk)
+    return _instance(Activity, ref) if ref else None
+
+
+def get_funds_source(pk):
+    ref = get_reference_data().funds_index.get(pk)
+    return _instance(FundsSource, ref) if ref else None
+
+
+def get_leave_activity(category):
+    """Activity booked for a leave type, or None when no activity has that category"""
+    pk = get_reference_data().leave_activities.get(category)
+    return get_activity(pk) if pk else None
+
+
+def get_default_funds_source():
+    pk = get_reference_data().default_funds
+    return get_funds_source(pk) if pk else None
+
+
+def activity_choices():
+    return [('', '---------')] + [(a.id, f"{a.code} - {a.name}") for a in get_reference_data().activities]
+
+
+def funds_choices():
+    return [('', '---------')] + [(f.id, f.name) for f in get_reference_data().funds]
+
+
+def activity_label(pk):
+    try:
+        ref = get_reference_data().activity_index.get(int(pk))
+    except (TypeError, ValueError):
+        return ''
+    return f"{ref.code} - {ref.name}" if ref else ''
+
+
+class ActivityAutocompleteSelect(AutocompleteSelect):
+    """Activity picker filled from the activity typeahead endpoint"""
+    url_name = 'activity_autocomplete'
+
+    def label_for(self, value):
+        return activity_label(value)
+
+
+class ReferenceChoiceField(forms.TypedChoiceField):
+    """
+    Choice field over registry entries that cleans to a model instance,
+    replacing a ModelChoiceField without querying the database.
+    """
+
+    def __init__(self, choices, lookup, **kwargs):
+        self.lookup = lookup
+        super().__init__(choices=choices, coerce=lambda value: lookup(int(value)), empty_value=None, **kwargs)
+
+    def prepare_value(self, value):
+        return getattr(value, 'pk', value)
+
+    def valid_value(self, value):
+        # Looked up by key: the choices are only listed when a plain select renders them
+        try:
+            return self.lookup(int(self.prepare_value(value))) is not None
+        except (TypeError, ValueError):
+            return False
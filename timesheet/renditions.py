@@ -0,0 +1,130 @@
+"""
+Downscaled copies (renditions) of timesheet images.
+
+Pages and the PDF export used the full 1200px JPEG for every picture. Each image
+now gets one JPEG per entry of RENDITIONS, stored next to the originals under a
+path derived from the image id and the rendition name, so no column tracks them.
+The process_images worker makes them right after compressing an upload. Images
+it has not reached yet, and older ones, get theirs on first request. They live in
+the default storage: the originals' storage names files by content, not by path.
+"""
+import os
+from collections import namedtuple
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+Rendition = namedtuple('Rendition', 'name max_size quality')
+
+RENDITIONS = {r.name: r for r in (
+    # Image lists and attachment previews
+    Rendition('thumbnail', 200, 70),
+    # Gallery cards
+    Rendition('preview', 640, 75),
+    # 1.8 x 2.5 inch cells of the PDF export at ~200 dpi
+    Rendition('print', 500, 80),
+)}
+RENDITION_DIR = 'timesheet_images/renditions'
+
+# The stored full-size copy itself: width cap and JPEG quality. The profile tag is
+# recorded on every image written with them, so resize_images skips those.
+COMPRESS_MAX_WIDTH = 1200
+COMPRESS_QUALITY = 70
+COMPRESS_PROFILE = f"{COMPRESS_MAX_WIDTH}px-q{COMPRESS_QUALITY}"
+# JPEGs within the width cap and below this size are kept as they are: the upload
+# form downscales photos in the browser to the profile above
+CONFORMING_MAX_BYTES = 500_000
+# Metadata a kept file must not carry: EXIF and XMP hold GPS positions and device
+# details, and an EXIF orientation would need a transpose
+PRIVATE_METADATA = ('exif', 'xmp')
+
+
+def rendition_name(image_pk, name):
+    return f"{RENDITION_DIR}/{image_pk}/{name}.jpg"
+
+
+def conforms(source, size):
+    """
+    Whether the file already is a full-size JPEG the server would not improve:
+    within the width cap and CONFORMING_MAX_BYTES, with no EXIF or XMP. A photo
+    the browser re-encoded has none; any other is re-encoded by the worker, which
+    drops them. Reads the header only.
+    """
+    if size > CONFORMING_MAX_BYTES:
+        return False
+    try:
+        with Image.open(source) as img:
+            return (img.format == 'JPEG' and img.width <= COMPRESS_MAX_WIDTH
+                    and not any(img.info.get(key) for key in PRIVATE_METADATA))
+    except (OSError, Image.DecompressionBombError):
+        return False
+    finally:
+        source.seek(0)
+
+
+def reduce_decoding(img, edge):
+    """
+    Lets a JPEG decode at the smallest DCT scale (1/2 to 1/8) that still covers an
+    edge x edge box, whatever the EXIF orientation: a 12 MP photo bound for 1200px
+    is decoded at 2000x1500 instead of 4000x3000, a quarter of the memory.
+    """
+    if img.format in ('JPEG', 'MPO'):
+        img.draft(None, (edge, edge))
+
+
+def compress_bytes(source):
+    """The source image as the full-size JPEG: at most COMPRESS_MAX_WIDTH wide, COMPRESS_QUALITY"""
+    with Image.open(source) as img:
+        reduce_decoding(img, COMPRESS_MAX_WIDTH)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.width > COMPRESS_MAX_WIDTH:
+            size = (COMPRESS_MAX_WIDTH, int(COMPRESS_MAX_WIDTH / img.width * img.height))
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=COMPRESS_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def render(source, rendition):
+    """JPEG of the source image fitted into a max_size square"""
+    with Image.open(source) as img:
+        reduce_decoding(img, rendition.max_size)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((rendition.max_size, rendition.max_size), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=rendition.quality, optimize=True)
+    return ContentFile(output.getvalue())
+
+
+def ensure(image, name):
+    """Storage name of the image's rendition, made first if missing"""
+    storage = default_storage
+    path = rendition_name(image.pk, name)
+    if not storage.exists(path):
+        with image.image.open('rb') as source:
+            content = render(source, RENDITIONS[name])
+        saved = storage.save(path, content)
+        if saved != path:
+            # Another request made it meanwhile; keep theirs
+            storage.delete(saved)
+    return path
+
+
+def generate_all(image):
+    for name in RENDITIONS:
+        ensure(image, name)
+
+
+def delete_all(image_pk, storage=default_storage):
+    for name in RENDITIONS:
+        storage.delete(rendition_name(image_pk, name))
+    try:
+        os.rmdir(storage.path(f"{RENDITION_DIR}/{image_pk}"))
+    except (OSError, NotImplementedError):
+        pass
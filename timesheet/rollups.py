@@ -0,0 +1,195 @@
+"""
+Maintenance of the UserDayTotal rollup.
+
+Every code path that writes timesheets ends up in refresh_day_totals() with the
+(user_id, date) pairs it touched: the model signals for single saves/deletes and
+TimesheetQuerySet for update(), bulk_create() and bulk_update(). Each affected day
+is recomputed from its timesheets with one grouped query per user, so the rollup
+cannot drift the way a +/- delta would.
+
+Caches derived from the rollup listen to day_totals_changed, which carries the
+refreshed (user_id, date) pairs, or days=None after a rebuild of unknown scope.
+
+Bulk jobs (imports, archiving) wrap their writes in deferred_day_totals() so the
+touched days are collected and refreshed once at the end instead of per batch.
+Days before the archive cutoff are summed from ArchivedTimesheet as well.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.dispatch import Signal
+
+from dashboard.models import LEAVE_PRECEDENCE, LeaveCategory
+
+day_totals_changed = Signal()
+
+# Days to refresh when the current thread is inside deferred_day_totals()
+_deferred = threading.local()
+
+# Dates per grouped query, well below the bound-parameter limits of every backend
+DATES_PER_QUERY = 500
+TOTAL_FIELDS = ['worked_minutes', 'leave_minutes', 'entry_count', 'leave_category']
+
+
+def summarize_day(rows):
+    """
+    Folds grouped timesheet rows of one day (activity leave category, minutes, entries)
+    into the UserDayTotal field values.
+    """
+    worked = leave = entries = 0
+    categories = set()
+    for row in rows:
+        category = row['activity__leave_category'] or LeaveCategory.WORK
+        entries += row['entries']
+        if category == LeaveCategory.WORK:
+            worked += row['minutes'] or 0
+        else:
+            leave += row['minutes'] or 0
+            categories.add(category)
+
+    leave_category = next((c for c in LEAVE_PRECEDENCE if c in categories), LeaveCategory.WORK)
+    return {
+        'worked_minutes': worked,
+        'leave_minutes': leave,
+        'entry_count': entries,
+        'leave_category': leave_category,
+    }
+
+
+def grouped_day_rows(timesheets):
+    """Timesheet rows summed per (user, date, leave category) by the database"""
+    return timesheets.values('user_id', 'date', 'activity__leave_category').annotate(
+        minutes=Sum('duration_minutes'),
+        entries=Count('id'),
+    ).order_by()
+
+
+def _refresh_user_days(user_id, dates, cutoff):
+    """Recomputes the UserDayTotal rows of one user for the given dates"""
+    from .models import ArchivedTimesheet, Timesheet, UserDayTotal
+
+    sources = [Timesheet.objects]
+    if cutoff and dates[0] < cutoff:
+        # Days of closed years live in the archive
+        sources.append(ArchivedTimesheet.objects)
+    rows_by_day = defaultdict(list)
+    for source in sources:
+        for row in grouped_day_rows(source.filter(user_id=user_id, date__in=dates)):
+            rows_by_day[row['date']].append(row)
+
+    existing = {t.date: t for t in UserDayTotal.objects.filter(user_id=user_id, date__in=dates)}
+    to_create, to_update = [], []
+    for day in dates:
+        total = existing.get(day)
+        if day not in rows_by_day:
+            continue
+        values = summarize_day(rows_by_day[day])
+        if total is None:
+            to_create.append(UserDayTotal(user_id=user_id, date=day, **values))
+        elif any(getattr(total, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(total, field, value)
+            to_update.append(total)
+
+    emptied = [day for day in existing if day not in rows_by_day]
+    if emptied:
+        UserDayTotal.objects.filter(user_id=user_id, date__in=emptied).delete()
+    # Not every writer holds the user's lock: a concurrent refresh may have inserted the day meanwhile
+    UserDayTotal.objects.bulk_create(
+        to_create, update_conflicts=True, unique_fields=['user', 'date'], update_fields=TOTAL_FIELDS,
+    )
+    UserDayTotal.objects.bulk_update(to_update, TOTAL_FIELDS)
+
+
+def refresh_day_totals(days):
+    """Recomputes the UserDayTotal rows of the given (user_id, date) pairs"""
+    from .models import UserDayTotal
+
+    days = {(user_id, day) for user_id, day in days if user_id is not None and day is not None}
+    pending = getattr(_deferred, 'days', None)
+    if pending is not None:
+        pending.update(days)
+        return
+    if not days:
+        return
+
+    dates_by_user = defaultdict(list)
+    for user_id, day in sorted(days):
+        dates_by_user[user_id].append(day)
+
+    from .archive import archive_cutoff
+
+    cutoff = archive_cutoff()
+    with transaction.atomic():
+        for user_id, dates in dates_by_user.items():
+            for i in range(0, len(dates), DATES_PER_QUERY):
+                _refresh_user_days(user_id, dates[i:i + DATES_PER_QUERY], cutoff)
+
+    day_totals_changed.send(sender=UserDayTotal, days=days)
+
+
+@contextmanager
+def deferred_day_totals(refresh=True):
+    """
+    Collects the days touched by timesheet writes inside the block and refreshes
+    them in one pass on exit. Nested blocks join the outermost one. refresh=False
+    drops them instead, for jobs that move rows without changing any total.
+    """
+    if getattr(_deferred, 'days', None) is not None:
+        yield
+        return
+
+    _deferred.days = set()
+    try:
+        yield
+    finally:
+        days, _deferred.days = _deferred.days, None
+        # Rows committed before an error still need their totals, unless the transaction is lost anyway
+        if refresh and not transaction.get_connection().needs_rollback:
+            refresh_day_totals(days)
+
+
+def refresh_activity_days(activity_ids):
+    """Recomputes every day booked on the given activities, after their leave category changed"""
+    from .models import Timesheet
+
+    days = Timesheet.objects.filter(activity_id__in=activity_ids).values_list('user_id', 'date').distinct()
+    refresh_day_totals(set(days))
+
+
+def rebuild_day_totals(timesheets, batch_size=2000):
+    """
+    Recreates the rollup from scratch for every (user, date) covered by the
+    given Timesheet queryset. Returns the number of day rows written.
+    """
+    from .models import UserDayTotal
+
+    written = 0
+    batch = []
+    current_key, current_rows = None, []
+
+    def flush_day():
+        if current_key is not None:
+            batch.append(UserDayTotal(user_id=current_key[0], date=current_key[1], **summarize_day(current_rows)))
+
+    rows = grouped_day_rows(timesheets).order_by('user_id', 'date')
+    with transaction.atomic():
+        for row in rows.iterator(chunk_size=batch_size):
+            key = (row['user_id'], row['date'])
+            if key != current_key:
+                flush_day()
+                current_key, current_rows = key, []
+                if len(batch) >= batch_size:
+                    UserDayTotal.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            current_rows.append(row)
+        flush_day()
+        UserDayTotal.objects.bulk_create(batch)
+        written += len(batch)
+
+    day_totals_changed.send(sender=UserDayTotal, days=None)
+    return written
@@ -0,0 +1,97 @@
+"""
+Full-text search over timesheet descriptions and reporter names.
+
+On MySQL, descriptions are matched with MATCH ... AGAINST in boolean mode (each
+word required, as a prefix) on the FULLTEXT indexes created by the
+create_search_indexes command, and ranked by relevance. Other backends (SQLite
+in the tests) fall back to one icontains per word, newest first. Either way
+words shorter than MIN_WORD_LENGTH are ignored.
+
+Reporter names are looked up in the in-memory employee directory, so a search
+never joins the user table; their entries rank after the description matches.
+
+A search reads at most MAX_HITS primary keys with one narrow query per source,
+each served by its own index, so its cost does not grow with the matches. The
+view pages over that list, loads only the rows of the current page and reports
+a count of MAX_HITS as capped.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q, Value
+
+from users.directory import search as search_employees
+
+MAX_HITS = 500
+FULLTEXT_INDEX = 'timesheet_description_ft'
+# Words shorter than InnoDB's innodb_ft_min_token_size are not indexed
+MIN_WORD_LENGTH = 3
+# Boolean-mode operators, stripped from the user's words
+OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+
+class SearchMatch(Func):
+    """MATCH (column) AGAINST (query IN BOOLEAN MODE): the relevance, served by the FULLTEXT index"""
+    output_field = FloatField()
+
+    def __init__(self, column, query):
+        super().__init__(F(column), Value(query))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        column_sql, column_params = compiler.compile(self.source_expressions[0])
+        query_sql, query_params = compiler.compile(self.source_expressions[1])
+        return (
+            f"MATCH ({column_sql}) AGAINST ({query_sql} IN BOOLEAN MODE)",
+            (*column_params, *query_params),
+        )
+
+
+def query_words(query):
+    return [word for word in OPERATORS.sub(' ', query or '').split() if word]
+
+
+def boolean_query(words):
+    """'+patrulare* +nocturna*': every word required, each as a prefix"""
+    return ' '.join(f'+{word}*' for word in words)
+
+
+def description_hits(queryset, words, limit=MAX_HITS):
+    """Primary keys of the entries whose description holds every word, best match first"""
+    words = [word for word in words if len(word) >= MIN_WORD_LENGTH]
+    if not words:
+        return []
+    if connection.vendor == 'mysql':
+        queryset = queryset.annotate(score=SearchMatch('description', boolean_query(words)))\
+            .filter(score__gt=0).order_by('-score', '-date', 'id')
+    else:
+        condition = Q()
+        for word in words:
+            condition &= Q(description__icontains=word)
+        queryset = queryset.filter(condition).order_by('-date', '-created_at', 'id')
+    return list(queryset.values_list('pk', flat=True)[:limit])
+
+
+def reporter_hits(queryset, query, limit=MAX_HITS):
+    """Primary keys of the entries filed by employees matching the query, newest first"""
+    user_ids = [employee.id for employee in search_employees(query, limit=limit)]
+    if not user_ids:
+        return []
+    return list(
+        queryset.filter(user_id__in=user_ids).order_by('-date', '-created_at', 'id')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+def search_timesheets(queryset, query, limit=MAX_HITS):
+    """
+    Ranked primary keys (at most limit) of the entries in queryset matching the
+    query in their description or their reporter's name.
+    """
+    words = query_words(query)
+    if not words:
+        return []
+    hits = description_hits(queryset, words, limit)
+    if len(hits) < limit:
+        found = set(hits)
+        hits += [pk for pk in reporter_hits(queryset, ' '.join(words), limit) if pk not in found]
+    return hits[:limit]
@@ -0,0 +1,72 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from dashboard.models import Activity, ClosureDay
+from . import feed, workcalendar
+from .models import FundsSource, Timesheet, TimesheetImage
+from .month_calendar import invalidate_months
+from .reference import bump_version
+from .renditions import delete_all as delete_renditions
+from .rollups import day_totals_changed, refresh_activity_days, refresh_day_totals
+
+
+@receiver(post_save, sender=Timesheet)
+def timesheet_saved(sender, instance, **kwargs):
+    days = {(instance.user_id, instance.date)}
+    loaded_day = getattr(instance, '_loaded_day', None)
+    if loaded_day:
+        days.add(loaded_day)
+    refresh_day_totals(days)
+    instance._loaded_day = (instance.user_id, instance.date)
+
+
+@receiver(post_delete, sender=Timesheet)
+def timesheet_deleted(sender, instance, **kwargs):
+    refresh_day_totals({(instance.user_id, instance.date)})
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_leave_category', None)
+    if not created and loaded is not None and loaded != instance.leave_category:
+        refresh_activity_days([instance.pk])
+    instance._loaded_leave_category = instance.leave_category
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(post_save, sender=FundsSource)
+@receiver(post_delete, sender=FundsSource)
+def reference_data_changed(sender, **kwargs):
+    # Before the commit, another worker would cache the old rows under the new version
+    transaction.on_commit(bump_version)
+
+
+@receiver(day_totals_changed)
+def drop_stale_calendar_months(sender, days, **kwargs):
+    invalidate_months(days)
+
+
+@receiver(day_totals_changed)
+def move_feed_stamps(sender, days, **kwargs):
+    feed.touch_users(days)
+
+
+@receiver(post_save, sender=ClosureDay)
+@receiver(post_delete, sender=ClosureDay)
+def closure_days_changed(sender, **kwargs):
+    # Before the commit, another request would cache the old year under the new version
+    transaction.on_commit(workcalendar.bump_version)
+    # Every cached calendar month may show the changed day
+    invalidate_months(None)
+
+
+@receiver(post_delete, sender=TimesheetImage)
+def drop_image_files(sender, instance, **kwargs):
+    if instance.image:
+        transaction.on_commit(partial(delete_renditions, instance.pk))
+        # Kept while another image shares the same content
+        TimesheetImage.release_file(instance.image.name)
@@ -0,0 +1,107 @@
+"""
+Content-addressed file storage for timesheet photos.
+
+A file is named after the SHA-256 of its bytes and sharded by the first two
+pairs of hex digits, e.g. timesheet_images/3f/a2/3fa2...e9.jpg, so no directory
+grows past a few thousand entries. Saving bytes that are already stored writes
+nothing and returns the existing name, so a photo attached to several entries
+is kept once. The references are the TimesheetImage rows naming the file:
+TimesheetImage.release_file() deletes it when the last one is gone, after the
+deleting transaction commits.
+
+A save that found its name already stored wrote nothing, so a release racing
+with it may delete the file before the new row commits. Both sides therefore run
+under lock(): the release re-checks the references, and the saving row calls
+keep() once committed, which writes the bytes again if they were deleted.
+"""
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """The name under the directory of `name`: <dir>/<ab>/<cd>/<digest><ext>"""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return '/'.join(part for part in (directory, digest[:2], digest[2:4], f"{digest}{extension}") if part)
+
+
+def is_hashed(name):
+    return bool(name and HASHED_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content (_save); equal names hold equal bytes
+        return name
+
+    def _save(self, name, content):
+        name = hashed_name(name, content_digest(content))
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        # Written aside and renamed into place: concurrent saves of the same bytes are harmless
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock, across processes of this host, between releases and keep()"""
+        os.makedirs(self.location, exist_ok=True)
+        with open(self.path('.lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def keep(self, name, content):
+        """Writes content under its stored name again if a release deleted it meanwhile"""
+        with self.lock():
+            if not self.exists(name):
+                self._write(name, content)
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,27 @@
+from django import template
+from django.utils.html import format_html
+
+from ..renditions import COMPRESS_MAX_WIDTH, COMPRESS_QUALITY, CONFORMING_MAX_BYTES
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(image, name):
+    """
+    URL of a TimesheetImage rendition, e.g. {% rendition img 'thumbnail' %};
+    the original's URL when the rendition cannot be made.
+    """
+    return image.rendition_url(name)
+
+
+@register.simple_tag
+def downscale_attrs():
+    """
+    Data attributes of a photo file input asking static/js/main.js to downscale
+    the chosen photos to the server's compression profile before upload.
+    """
+    return format_html(
+        'data-max-width="{}" data-quality="{}" data-max-bytes="{}"',
+        COMPRESS_MAX_WIDTH, COMPRESS_QUALITY, CONFORMING_MAX_BYTES,
+    )
@@ -1,3 +1,1136 @@
-from django.test import TestCase
+import csv
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django import forms
+from PIL import Image as PILImage
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from dashboard.models import Activity, LeaveCategory
+from .archive import CUTOFF_CACHE_KEY, archive_cutoff, span
+from .forms import TimesheetForm
+from .importers import ImportFileError, TimesheetImporter
+from .limits import save_within_daily_limit
+from .rollups import refresh_day_totals
+from .image_queue import LOCK_TIMEOUT, MAX_ATTEMPTS, claim, run_once
+from .models import (
+    ArchivedTimesheet, FundsSource, ImageStatus, ImageTask, Timesheet, TimesheetImage, UserDayTotal,
+    compute_duration_minutes,
+)
+from .month_calendar import get_month_matrix
+from .periods import month_bounds, month_filter
+from .reference import get_reference_data
+from .renditions import COMPRESS_PROFILE, compress_bytes, reduce_decoding, rendition_name
+from .storage import is_hashed
+from general.widgets import AutocompleteSelect
+from users.directory import search
+from users import roles
+from users.roles import VERSION_KEY
+
+User = get_user_model()
+
+
+class TimesheetTestMixin:
+    def setUp(self):
+        # The versioned caches are bumped on commit, which a TestCase never reaches
+        cache.clear()
+        self.user = User.objects.create_user(email='ranger@example.com', password='password', is_active=True)
+        self.activity = Activity.objects.create(group='G1', subgroup='S1', code='A1', name='Patrulare', responsible='SP')
+        self.funds = FundsSource.objects.create(name='RNP ROMSILVA', description='')
+
+    def make_timesheet(self, day=date(2025, 3, 3), start=time(8, 0), end=time(16, 30), **kwargs):
+        return Timesheet.objects.create(
+            user=kwargs.pop('user', self.user), date=day, start_time=start, end_time=end,
+            activity=kwargs.pop('activity', self.activity), fundssource=self.funds, **kwargs
+        )
+
+
+class DurationMinutesTests(TimesheetTestMixin, TestCase):
+    def test_compute_duration_minutes(self):
+        self.assertEqual(compute_duration_minutes(time(8, 0), time(16, 30)), 510)
+        self.assertEqual(compute_duration_minutes(time(22, 0), time(6, 0)), 480)
+        self.assertEqual(compute_duration_minutes(None, time(6, 0)), 0)
+
+    def test_save_stores_duration(self):
+        ts = self.make_timesheet()
+        self.assertEqual(ts.duration_minutes, 510)
+        self.assertEqual(ts.duration_display, "8h 30m")
+
+        ts.end_time = time(14, 0)
+        ts.save(update_fields=['end_time'])
+        ts.refresh_from_db()
+        self.assertEqual(ts.duration_minutes, 360)
+
+    def test_overnight_shift(self):
+        ts = self.make_timesheet(start=time(20, 0), end=time(2, 0))
+        self.assertEqual(ts.duration_minutes, 360)
+        self.assertEqual(ts.worked_hours(), 6.0)
+
+    def test_queryset_update_recomputes_duration(self):
+        ts = self.make_timesheet()
+        Timesheet.objects.filter(pk=ts.pk).update(end_time=time(10, 0))
+        ts.refresh_from_db()
+        self.assertEqual(ts.duration_minutes, 120)
+
+    def test_bulk_create_and_bulk_update(self):
+        objs = Timesheet.objects.bulk_create([
+            Timesheet(user=self.user, date=date(2025, 3, 4), start_time=time(8, 0), end_time=time(9, 0),
+                      activity=self.activity, fundssource=self.funds),
+        ])
+        self.assertEqual(Timesheet.objects.get().duration_minutes, 60)
+
+        obj = Timesheet.objects.get(pk=objs[0].pk)
+        obj.end_time = time(11, 0)
+        Timesheet.objects.bulk_update([obj], ['end_time'])
+        self.assertEqual(Timesheet.objects.get().duration_minutes, 180)
+
+    def test_total_minutes_and_backfill(self):
+        self.make_timesheet()
+        stale = self.make_timesheet(day=date(2025, 3, 4))
+        # Simulate a row written before the column existed
+        Timesheet.objects.filter(pk=stale.pk).update(duration_minutes=0)
+        self.assertEqual(Timesheet.objects.total_minutes(), 510)
+
+        call_command('backfill_durations', stdout=StringIO())
+        self.assertEqual(Timesheet.objects.total_minutes(), 1020)
+
+
+class PeriodFilterTests(TimesheetTestMixin, TestCase):
+    def test_month_bounds_roll_over_the_year(self):
+        self.assertEqual(month_bounds(2025, 12), (date(2025, 12, 1), date(2026, 1, 1)))
+        self.assertEqual(month_filter(2025, 2), {'date__gte': date(2025, 2, 1), 'date__lt': date(2025, 3, 1)})
+
+    def test_in_month_matches_calendar_month(self):
+        self.make_timesheet(day=date(2025, 2, 28))
+        self.make_timesheet(day=date(2025, 3, 1))
+        self.make_timesheet(day=date(2025, 3, 31))
+        self.make_timesheet(day=date(2025, 4, 1))
+        self.assertEqual(Timesheet.objects.in_month(2025, 3).count(), 2)
+        self.assertEqual(Timesheet.objects.in_year(2025).count(), 4)
+
+
+class UserDayTotalTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.leave = Activity.objects.create(group='G1', subgroup='S1', code='CO', name='CONCEDIU ANUAL', responsible='SP')
+
+    def day_total(self, day=date(2025, 3, 3)):
+        return UserDayTotal.objects.get(user=self.user, date=day)
+
+    def test_day_inserted_by_a_concurrent_refresh_is_updated(self):
+        self.make_timesheet(start=time(8, 0), end=time(12, 0))
+        # The refresh reads the day before the other one inserted it
+        with mock.patch.object(UserDayTotal.objects, 'filter', return_value=UserDayTotal.objects.none()):
+            refresh_day_totals({(self.user.pk, date(2025, 3, 3))})
+        self.assertEqual(self.day_total().worked_minutes, 240)
+
+    def test_save_and_delete_maintain_rollup(self):
+        first = self.make_timesheet(start=time(8, 0), end=time(12, 0))
+        self.make_timesheet(start=time(12, 0), end=time(14, 0))
+        total = self.day_total()
+        self.assertEqual((total.worked_minutes, total.entry_count), (360, 2))
+
+        first.delete()
+        self.assertEqual(self.day_total().worked_minutes, 120)
+
+        Timesheet.objects.all().delete()
+        self.assertFalse(UserDayTotal.objects.exists())
+
+    def test_moving_an_entry_refreshes_both_days(self):
+        ts = self.make_timesheet()
+        ts = Timesheet.objects.get(pk=ts.pk)
+        ts.date = date(2025, 3, 4)
+        ts.save()
+        self.assertFalse(UserDayTotal.objects.filter(date=date(2025, 3, 3)).exists())
+        self.assertEqual(self.day_total(date(2025, 3, 4)).worked_minutes, 510)
+
+    def test_leave_category_and_bulk_paths(self):
+        Timesheet.objects.bulk_create([
+            Timesheet(user=self.user, date=date(2025, 3, 5), start_time=time(8, 0), end_time=time(16, 30),
+                      activity=self.leave, fundssource=self.funds),
+        ])
+        total = self.day_total(date(2025, 3, 5))
+        self.assertEqual(total.leave_category, LeaveCategory.CO)
+        self.assertEqual((total.worked_minutes, total.leave_minutes), (0, 510))
+
+        Timesheet.objects.filter(date=date(2025, 3, 5)).update(activity=self.activity, end_time=time(10, 0))
+        total = self.day_total(date(2025, 3, 5))
+        self.assertEqual((total.leave_category, total.worked_minutes), (LeaveCategory.WORK, 120))
+
+    def test_rebuild_command(self):
+        self.make_timesheet()
+        self.make_timesheet(day=date(2025, 3, 4), activity=self.leave)
+        UserDayTotal.objects.all().delete()
+
+        call_command('rebuild_day_totals', stdout=StringIO())
+        self.assertEqual(self.day_total().worked_minutes, 510)
+        self.assertEqual(self.day_total(date(2025, 3, 4)).leave_category, LeaveCategory.CO)
+
+
+class DailyLimitFormTests(TimesheetTestMixin, TestCase):
+    def form_data(self, **overrides):
+        data = {
+            'date': '2025-03-03', 'start_time': '08:00', 'end_time': '12:00',
+            'activity': self.activity.pk, 'fundssource': self.funds.pk, 'description': '',
+        }
+        data.update(overrides)
+        return data
+
+    def test_limit_counts_existing_day_total(self):
+        self.make_timesheet(start=time(8, 0), end=time(14, 0))
+        form = TimesheetForm(data=self.form_data(start_time='14:00', end_time='17:00'), user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertIn('end_time', form.errors)
+
+    def test_editing_an_entry_does_not_count_it_twice(self):
+        ts = self.make_timesheet(start=time(8, 0), end=time(16, 0))
+        form = TimesheetForm(data=self.form_data(end_time='16:30'), instance=ts, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class LeaveCategoryTests(TimesheetTestMixin, TestCase):
+    def test_new_activities_are_classified(self):
+        sick = Activity.objects.create(group='G1', subgroup='S1', code='X9', name='Concediu medical', responsible='SP')
+        self.assertEqual(sick.leave_category, LeaveCategory.CM)
+        self.assertEqual(self.activity.leave_category, LeaveCategory.WORK)
+
+    def test_category_change_refreshes_day_totals(self):
+        self.make_timesheet()
+        activity = Activity.objects.get(pk=self.activity.pk)
+        activity.leave_category = LeaveCategory.EF
+        activity.save()
+        total = UserDayTotal.objects.get(user=self.user, date=date(2025, 3, 3))
+        self.assertEqual((total.leave_category, total.leave_minutes), (LeaveCategory.EF, 510))
+
+    def test_backfill_command(self):
+        self.make_timesheet()
+        Activity.objects.filter(pk=self.activity.pk).update(name='Concediu de odihna', leave_category=LeaveCategory.WORK)
+        call_command('backfill_leave_categories', stdout=StringIO())
+        self.assertEqual(Activity.objects.get(pk=self.activity.pk).leave_category, LeaveCategory.CO)
+        self.assertEqual(UserDayTotal.objects.get().leave_category, LeaveCategory.CO)
+
+    def test_form_picks_leave_activity_by_category(self):
+        leave = Activity.objects.create(group='G1', subgroup='S1', code='CO', name='Odihna', responsible='SP')
+        form = TimesheetForm(data={'date': '2025-03-03', 'is_annual_holiday': 'on', 'description': ''}, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['activity'], leave)
+
+
+class ReferenceDataTests(TimesheetTestMixin, TestCase):
+    def test_warm_registry_renders_without_queries(self):
+        get_reference_data()
+        with self.assertNumQueries(0):
+            form = TimesheetForm()
+            str(form['activity']), str(form['fundssource'])
+            self.assertEqual(form.fields['activity'].choices[1], (self.activity.pk, 'A1 - Patrulare'))
+
+    def test_leave_entry_takes_activity_and_funds_from_registry(self):
+        leave = Activity.objects.create(group='G1', subgroup='S1', code='CO', name='Odihna', responsible='SP')
+        form = TimesheetForm(data={'date': '2025-03-03', 'is_annual_holiday': 'on', 'description': ''}, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual((form.cleaned_data['activity'], form.cleaned_data['fundssource']), (leave, self.funds))
+
+    def test_save_and_delete_refresh_the_registry(self):
+        self.assertEqual([a.code for a in get_reference_data().activities], ['A1'])
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = Activity.objects.create(group='G1', subgroup='S1', code='A10', name='Inventar', responsible='SP')
+            Activity.objects.create(group='G1', subgroup='S1', code='A2', name='Monitorizare', responsible='SP')
+            # Not before the change commits
+            self.assertEqual([a.code for a in get_reference_data().activities], ['A1'])
+        self.assertEqual([a.code for a in get_reference_data().activities], ['A1', 'A2', 'A10'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            extra.delete()
+            self.funds.name = 'RNP ROMSILVA - Buget'
+            self.funds.save()
+        data = get_reference_data()
+        self.assertEqual([a.code for a in data.activities], ['A1', 'A2'])
+        self.assertEqual([f.name for f in data.funds], ['RNP ROMSILVA - Buget'])
+
+    def test_form_saves_registry_instances(self):
+        form = TimesheetForm(data={'date': '2025-03-03', 'start_time': '08:00', 'end_time': '12:00',
+                                   'activity': self.activity.pk, 'fundssource': self.funds.pk}, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.instance.user = self.user
+        ts = form.save()
+        self.assertEqual((ts.activity_id, ts.fundssource_id), (self.activity.pk, self.funds.pk))
+
+
+class EmployeeAutocompleteTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user(email='sef@example.com', password='password', is_active=True,
+                                                is_staff=True, first_name='Ana', last_name='Popescu')
+        self.other = User.objects.create_user(email='stefan.ionescu@example.com', password='password',
+                                              is_active=True, first_name='Ștefan', last_name='Ionescu')
+
+    def test_prefix_search_over_names_and_email(self):
+        self.assertEqual([e.id for e in search('ste')], [self.other.pk])
+        self.assertEqual([e.id for e in search('ionescu st')], [self.other.pk])
+        self.assertEqual([e.id for e in search('sef@')], [self.manager.pk])
+        self.assertEqual(search('ste pop'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.is_active = False
+            self.other.save()
+            # Not before the change commits
+            self.assertEqual([e.id for e in search('ste')], [self.other.pk])
+        self.assertEqual(search('ste'), [])
+
+    def test_endpoint_is_for_managers_only(self):
+        with translation.override('en'):
+            url = reverse('users:employee_autocomplete')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url, {'q': 'ana'}).status_code, 403)
+
+        self.client.force_login(self.manager)
+        response = self.client.get(url, {'q': 'ana'})
+        self.assertEqual(response.json(), {'results': [{'id': self.manager.pk, 'text': 'Ana Popescu'}]})
+
+    def test_form_renders_only_the_selected_employee(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        search('')
+        ts = self.make_timesheet(user=self.other)
+        with self.assertNumQueries(0):
+            html = str(TimesheetForm(instance=ts, user=admin)['user'])
+        self.assertIn('Ștefan Ionescu', html)
+        self.assertNotIn('Ana Popescu', html)
+        self.assertIn('data-autocomplete-url', html)
+
+
+class WeekEntryTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        with translation.override('en'):
+            self.url = reverse('week_timesheet')
+
+    def entry(self, day, start='08:00', end='12:00'):
+        return {'date': day, 'start_time': start, 'end_time': end,
+                'activity': self.activity.pk, 'fundssource': self.funds.pk}
+
+    def post_json(self, entries):
+        return self.client.post(self.url, {'week': '2025-03-03', 'entries': entries},
+                                content_type='application/json')
+
+    def test_rows_propose_each_day_limit(self):
+        response = self.client.get(self.url, {'week': '2025-03-03'})
+        ends = [form.initial['end_time'] for form in response.context['formset']]
+        self.assertEqual(ends, ['16:30'] * 4 + ['14:00'] + ['16:30'] * 2)
+
+    def test_payload_of_another_shape_is_refused(self):
+        for payload in ([], 'x', {'week': 5, 'entries': {}}, {'week': '2025-03-03', 'entries': ['row']}):
+            response = self.client.post(self.url, payload, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_rows_outside_the_week_are_refused(self):
+        response = self.post_json([self.entry('2025-03-03'), self.entry('2025-03-10')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1])
+        self.assertFalse(Timesheet.objects.exists())
+
+    def test_week_is_saved_in_one_insert(self):
+        entries = [self.entry('2025-03-03'), self.entry('2025-03-03', '12:00', '16:30'), self.entry('2025-03-07', end='14:00')]
+        response = self.post_json(entries)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 3)
+        self.assertEqual(UserDayTotal.objects.get(date=date(2025, 3, 3)).worked_minutes, 510)
+
+    def test_limits_count_existing_and_new_rows(self):
+        self.make_timesheet(day=date(2025, 3, 4), start=time(8, 0), end=time(14, 0))
+        entries = [
+            self.entry('2025-03-03'),
+            self.entry('2025-03-04', '14:00', '17:00'),
+            self.entry('2025-03-07', '08:00', '12:00'),
+            self.entry('2025-03-07', '12:00', '14:00'),
+            self.entry('2025-03-07', '13:00', '14:00'),
+        ]
+        response = self.post_json(entries)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row['row'] for row in response.json()['errors']], [1, 4])
+        self.assertEqual(Timesheet.objects.count(), 1)
+
+    def test_grid_page_and_form_post(self):
+        self.assertEqual(self.client.get(self.url, {'week': '2025-03-05'}).status_code, 200)
+        data = {'week': '2025-03-03', 'form-TOTAL_FORMS': '2', 'form-INITIAL_FORMS': '0',
+                'form-0-date': '2025-03-03', 'form-0-start_time': '08:00', 'form-0-end_time': '16:30',
+                'form-0-activity': self.activity.pk, 'form-0-fundssource': self.funds.pk,
+                'form-1-date': '2025-03-04', 'form-1-start_time': '08:00', 'form-1-end_time': '16:30'}
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Timesheet.objects.get().date, date(2025, 3, 3))
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_refuses_the_default_database_without_confirmation(self):
+        with self.assertRaisesMessage(CommandError, '--i-know-this-is-not-production'):
+            call_command('benchmark_timesheet_queries', seed=True, stdout=StringIO())
+        self.assertFalse(Timesheet.objects.exists())
+
+
+class TimesheetImportTests(TimesheetTestMixin, TestCase):
+    HEADER = ['user', 'date', 'start_time', 'end_time', 'activity', 'fundssource', 'description']
+
+    def rows(self):
+        return [
+            ['ranger@example.com', '2025-03-03', '08:00', '12:00', 'A1', 'rnp romsilva', 'Patrulare'],
+            ['ranger@example.com', '03.03.2025', '12:00', '16:30', 'A1', 'RNP ROMSILVA', ''],
+            ['ranger@example.com', '2025-03-03', '16:30', '17:00', 'A1', 'RNP ROMSILVA', 'over the limit'],
+            ['nobody@example.com', '2025-03-04', '08:00', '12:00', 'A1', 'RNP ROMSILVA', ''],
+            ['ranger@example.com', '2025-03-07', '08:00', '15:00', 'A1', 'RNP ROMSILVA', ''],
+        ]
+
+    def test_csv_import_reports_rejected_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as handle:
+            writer = csv.writer(handle)
+            writer.writerow(self.HEADER)
+            writer.writerows(self.rows())
+        self.addCleanup(os.remove, handle.name)
+
+        out = StringIO()
+        call_command('import_timesheets', handle.name, '--batch-size', '2', stdout=out)
+        self.assertIn('Imported 2 of 5 rows (3 rejected)', out.getvalue())
+        self.assertIn('Row 5: unknown user', out.getvalue())
+        self.assertEqual(UserDayTotal.objects.get(date=date(2025, 3, 3)).worked_minutes, 510)
+
+    def test_xlsx_import_with_existing_totals(self):
+        self.make_timesheet(start=time(8, 0), end=time(12, 0))
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(self.HEADER)
+        sheet.append(['ranger@example.com', date(2025, 3, 3), time(12, 0), time(16, 30), 'A1', 'RNP ROMSILVA', ''])
+        sheet.append(['ranger@example.com', date(2025, 3, 3), time(16, 30), time(17, 0), 'A1', 'RNP ROMSILVA', ''])
+        buffer = BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        result = TimesheetImporter().run(buffer, 'xlsx')
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(result.errors[0][0], 3)
+        self.assertEqual(UserDayTotal.objects.get().worked_minutes, 510)
+
+    def test_unreadable_files_are_refused(self):
+        latin1 = ','.join(self.HEADER).encode() + '\nranger@example.com,2025-03-03,08:00,12:00,A1,Pădure,\n'.encode('cp1250')
+        for content, file_format in ((latin1, 'csv'), (b'not a zip', 'xlsx')):
+            with self.assertRaises(ImportFileError):
+                TimesheetImporter().run(BytesIO(content), file_format)
+        self.assertFalse(Timesheet.objects.exists())
+
+
+class CalendarCacheTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_calendar(self):
+        with translation.override('en'):
+            return self.client.get(reverse('timesheet_calendar'), {'year': 2025, 'month': 3})
+
+    def cell(self, matrix, day):
+        return next(cell for week in matrix for cell in week if cell['day'] == day)
+
+    def test_warm_month_renders_without_timesheet_queries(self):
+        self.make_timesheet(start=time(8, 0), end=time(12, 0))
+        self.get_calendar()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_calendar()
+        self.assertFalse([q['sql'] for q in queries if 'timesheet_' in q['sql']])
+        cell = self.cell(response.context['calendar_matrix'], date(2025, 3, 3))
+        self.assertEqual((cell['status'], cell['total_hm'], cell['activities']), ('warning', '4h 0m', 1))
+
+    def test_writes_evict_only_their_month(self):
+        self.make_timesheet(start=time(8, 0), end=time(12, 0))
+        get_month_matrix(self.user.pk, 2025, 3)
+        get_month_matrix(self.user.pk, 2025, 4)
+
+        self.make_timesheet(start=time(12, 0), end=time(16, 30))
+        with self.assertNumQueries(1):
+            march = get_month_matrix(self.user.pk, 2025, 3)
+        self.assertEqual(self.cell(march, date(2025, 3, 3))['status'], 'success')
+        with self.assertNumQueries(0):
+            get_month_matrix(self.user.pk, 2025, 4)
+
+    def test_day_detail_lists_the_days_entries(self):
+        self.make_timesheet(description='Patrulare nocturna')
+        self.make_timesheet(day=date(2025, 3, 4), start=time(8, 0), end=time(9, 0), description='Alta zi')
+        with translation.override('en'):
+            response = self.client.get(reverse('timesheet_calendar_day', args=(2025, 3, 3)))
+        self.assertContains(response, 'Patrulare nocturna')
+        self.assertNotContains(response, 'Alta zi')
+
+
+class EventFeedTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_events(self, start='2025-02-24', end='2025-04-07', **headers):
+        with translation.override('en'):
+            return self.client.get(reverse('timesheet_events'), {'start': start, 'end': end}, headers=headers)
+
+    def test_feed_holds_only_the_window(self):
+        self.make_timesheet(start=time(8, 0), end=time(12, 0), description='Patrulare')
+        self.make_timesheet(day=date(2025, 6, 2))
+        response = self.get_events()
+        events = response.json()
+        self.assertEqual([e['start'] for e in events], ['2025-03-03'])
+        self.assertEqual(events[0]['title'], 'A1 - Patrulare (4.0h)')
+        self.assertEqual(events[0]['className'], 'timesheet-event-bar medium-hours')
+
+    def test_unchanged_window_answers_304_without_timesheet_queries(self):
+        self.make_timesheet()
+        etag = self.get_events()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_events(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q['sql'] for q in queries if 'timesheet_' in q['sql']])
+
+    def test_writes_change_the_etag(self):
+        timesheet = self.make_timesheet()
+        etag = self.get_events()['ETag']
+        timesheet.delete()
+        response = self.get_events(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_invalid_range_is_rejected(self):
+        self.assertEqual(self.get_events(start='2025-04-07').status_code, 400)
+        self.assertEqual(self.get_events(start='2020-01-01').status_code, 400)
+
+
+class TimesheetListPaginationTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user(email='boss@example.com', password='password', is_active=True, is_staff=True)
+        self.client.force_login(self.manager)
+        for day in range(1, 21):
+            self.make_timesheet(day=date(2025, 3, day), start=time(8, 0), end=time(10, 0))
+            self.make_timesheet(day=date(2025, 3, day), start=time(10, 0), end=time(12, 0))
+
+    def get_list(self, **params):
+        with translation.override('en'):
+            return self.client.get(reverse('timesheet_list'), params)
+
+    def test_pages_follow_the_cursor_both_ways(self):
+        first = self.get_list()
+        page = first.context['page_obj']
+        self.assertEqual(len(page), 25)
+        self.assertFalse(page.has_previous())
+        self.assertEqual(first.context['total_count'], 40)
+
+        second = self.get_list(after=page.next_cursor).context['page_obj']
+        self.assertEqual(len(second), 15)
+        self.assertFalse(second.has_next())
+        seen = [t.pk for t in page] + [t.pk for t in second]
+        expected = Timesheet.objects.order_by('-date', '-created_at', 'id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+
+        back = self.get_list(before=second.previous_cursor).context['page_obj']
+        self.assertEqual([t.pk for t in back], [t.pk for t in page])
+        self.assertFalse(back.has_previous())
+
+    def test_page_reads_images_without_prefetch(self):
+        TimesheetImage.objects.bulk_create([TimesheetImage(timesheet=Timesheet.objects.latest('date'), image='a.jpg')])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_list()
+        self.assertFalse([q['sql'] for q in queries if 'timesheet_timesheetimage' in q['sql'] and 'COUNT' not in q['sql']])
+        self.assertContains(response, 'fa-images')
+
+    def test_malformed_cursor_falls_back_to_the_first_page(self):
+        page = self.get_list(after='not-a-cursor').context['page_obj']
+        self.assertEqual(len(page), 25)
+        self.assertFalse(page.has_previous())
+
+
+class TimesheetSearchTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user.first_name, self.user.last_name = 'Ion', 'Popescu'
+        self.user.save()
+        self.manager = User.objects.create_user(email='boss@example.com', password='password',
+                                                is_active=True, is_staff=True)
+        self.client.force_login(self.manager)
+
+    def search(self, query, **params):
+        with translation.override('en'):
+            return self.client.get(reverse('timesheet_list'), {'q': query, **params})
+
+    def test_description_words_match_in_any_order(self):
+        hit = self.make_timesheet(description='Patrulare nocturna in zona Retezat')
+        self.make_timesheet(day=date(2025, 3, 4), description='Inventar birou')
+        response = self.search('retezat patrulare')
+        self.assertEqual([t.pk for t in response.context['timesheets']], [hit.pk])
+
+    def test_year_filter_limits_the_search(self):
+        self.make_timesheet(day=date(2024, 5, 6), description='Patrulare')
+        current = self.make_timesheet(description='Patrulare')
+        response = self.search('patrulare', year_filter=2025)
+        self.assertEqual([t.pk for t in response.context['timesheets']], [current.pk])
+
+    def test_reporter_matches_rank_after_description_matches(self):
+        by_reporter = self.make_timesheet(day=date(2025, 3, 5), description='Inventar')
+        by_description = self.make_timesheet(description='Discutie cu Popescu')
+        response = self.search('popescu')
+        self.assertEqual([t.pk for t in response.context['timesheets']], [by_description.pk, by_reporter.pk])
+        self.assertEqual(response.context['total_count'], 2)
+
+    def test_matches_are_paged_within_the_cap(self):
+        hits = [self.make_timesheet(day=date(2025, 1, 1) + timedelta(days=n), description='Patrulare').pk
+                for n in range(30)]
+        response = self.search('patrulare')
+        self.assertEqual((response.context['total_count'], response.context['search_capped']), (30, False))
+        seen = [t.pk for t in response.context['timesheets']]
+        seen += [t.pk for t in self.search('patrulare', page=2).context['timesheets']]
+        self.assertEqual(seen, hits[::-1])
+
+        with mock.patch('timesheet.views.MAX_HITS', 10):
+            response = self.search('patrulare')
+        self.assertEqual((response.context['total_count'], response.context['search_capped']), (10, True))
+        self.assertContains(response, '<strong>10+</strong>')
+
+    def test_short_words_are_ignored(self):
+        hit = self.make_timesheet(description='Patrulare nocturna')
+        response = self.search('patrulare in')
+        self.assertEqual([t.pk for t in response.context['timesheets']], [hit.pk])
+
+
+class AutocompleteSelectTests(TimesheetTestMixin, TestCase):
+    class Widget(AutocompleteSelect):
+        url_name = 'activity_autocomplete'
+
+    def test_default_label_reads_only_the_selected_row(self):
+        Activity.objects.create(group='G1', subgroup='S1', code='B2', name='Second', responsible='SP')
+        field = forms.ModelChoiceField(queryset=Activity.objects.all(), widget=self.Widget())
+        with self.assertNumQueries(1):
+            html = field.widget.render('activity', self.activity.pk)
+        self.assertIn(f'<option value="{self.activity.pk}" selected>{self.activity}</option>', html)
+        self.assertNotIn('Second', html)
+
+    def test_default_label_of_static_choices(self):
+        field = forms.ChoiceField(choices=[('a', 'Alpha'), ('Group', [('b', 'Beta')])], widget=self.Widget())
+        self.assertIn('<option value="b" selected>Beta</option>', field.widget.render('letter', 'b'))
+
+
+class RoleResolutionTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.managers = Group.objects.create(name='Managers')
+        self.lead = User.objects.create_user(email='lead@example.com', password='password', is_active=True)
+        self.lead.groups.add(self.managers)
+        self.make_timesheet()
+        self.client.force_login(self.lead)
+
+    def get_list(self):
+        with translation.override('en'):
+            return self.client.get(reverse('timesheet_list'))
+
+    def group_queries(self, queries):
+        return [q['sql'] for q in queries if 'auth_group' in q['sql']]
+
+    def test_membership_is_resolved_once_per_session(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_list()
+        self.assertEqual(len(self.group_queries(queries)), 1)
+        self.assertEqual(response.context['total_count'], 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_list()
+        self.assertFalse(self.group_queries(queries))
+
+    def test_membership_changes_invalidate_the_session_copy(self):
+        self.assertEqual(self.get_list().context['total_count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.groups.remove(self.managers)
+        self.assertEqual(self.get_list().context['total_count'], 0)
+
+    def test_membership_resolved_before_a_removal_is_not_kept(self):
+        request = RequestFactory().get('/')
+        request.user, request.session = User.objects.get(pk=self.lead.pk), {}
+        roles.restore(request)
+        self.assertTrue(request.user.in_manager_group)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.groups.remove(self.managers)
+        roles.remember(request)
+
+        later = RequestFactory().get('/')
+        later.user, later.session = User.objects.get(pk=self.lead.pk), request.session
+        roles.restore(later)
+        self.assertFalse(later.user.in_manager_group)
+
+    def test_evicted_version_does_not_revive_a_session_copy(self):
+        self.assertEqual(self.get_list().context['total_count'], 1)
+        cache.delete(VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.groups.remove(self.managers)
+        self.assertEqual(self.get_list().context['total_count'], 0)
+
+    def test_role_grants_access_without_group_query(self):
+        self.lead.role = User.Role.MANAGER
+        self.lead.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_list()
+        self.assertFalse(self.group_queries(queries))
+
+
+class ImageQueueTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.timesheet = self.make_timesheet()
+
+    def upload(self, content=None, name='photo.png'):
+        if content is None:
+            buffer = BytesIO()
+            PILImage.new('RGB', (2400, 1600), 'green').save(buffer, format='PNG')
+            content = buffer.getvalue()
+        return TimesheetImage.objects.create(timesheet=self.timesheet, image=SimpleUploadedFile(name, content))
+
+    def test_upload_is_stored_raw_and_queued(self):
+        image = self.upload()
+        self.assertEqual(image.status, ImageStatus.PENDING)
+        self.assertTrue(image.image.name.endswith('.png'))
+        self.assertEqual(ImageTask.objects.filter(image=image).count(), 1)
+
+    def test_photos_downscaled_in_the_browser_skip_the_queue(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (1200, 900), 'green').save(buffer, format='JPEG', quality=70)
+        image = self.upload(content=buffer.getvalue(), name='photo.jpg')
+        self.assertEqual((image.status, image.processed_with), (ImageStatus.READY, COMPRESS_PROFILE))
+        self.assertFalse(ImageTask.objects.exists())
+
+        with translation.override('en'):
+            self.client.force_login(self.user)
+            response = self.client.get(reverse('update_timesheet', args=(self.timesheet.pk,)))
+        self.assertContains(response, 'data-max-width="1200" data-quality="70"')
+
+    def test_conforming_photo_with_exif_is_queued(self):
+        exif = PILImage.Exif()
+        exif[0x010F] = 'Phone maker'
+        buffer = BytesIO()
+        PILImage.new('RGB', (1200, 900), 'green').save(buffer, format='JPEG', quality=70, exif=exif)
+        image = self.upload(content=buffer.getvalue(), name='photo.jpg')
+        self.assertEqual(image.status, ImageStatus.PENDING)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_once('test')
+        image.refresh_from_db()
+        with PILImage.open(image.image.path) as stored:
+            self.assertFalse(stored.info.get('exif'))
+
+    def test_worker_compresses_and_drops_the_original(self):
+        image = self.upload()
+        original = image.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_once('test'), (1, 0))
+
+        image.refresh_from_db()
+        self.assertEqual(image.status, ImageStatus.READY)
+        self.assertTrue(image.image.name.endswith('.jpg'))
+        with PILImage.open(image.image.path) as stored:
+            self.assertEqual(stored.size, (1200, 800))
+        self.assertFalse(os.path.exists(original))
+        self.assertFalse(ImageTask.objects.exists())
+
+    def test_failures_are_retried_later(self):
+        image = self.upload(content=b'not an image', name='broken.jpg')
+        self.assertEqual(run_once('test'), (0, 1))
+
+        task = ImageTask.objects.get(image=image)
+        self.assertEqual((task.attempts, task.locked_at), (1, None))
+        self.assertIn('UnidentifiedImageError', task.last_error)
+        image.refresh_from_db()
+        self.assertEqual(image.status, ImageStatus.PENDING)
+        # Backed off: not claimed again right away
+        self.assertEqual(run_once('test'), (0, 0))
+
+    def test_image_deleted_while_processed_drops_its_task_and_files(self):
+        image = self.upload()
+        compress_image = TimesheetImage.compress_image
+
+        def compress_then_delete(instance, source):
+            compressed = compress_image(instance, source)
+            TimesheetImage.objects.filter(pk=instance.pk).delete()
+            return compressed
+
+        with mock.patch.object(TimesheetImage, 'compress_image', compress_then_delete), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_once('test'), (0, 0))
+        self.assertFalse(ImageTask.objects.exists())
+        stored = [name for _, _, names in os.walk(os.path.dirname(os.path.dirname(os.path.dirname(image.image.path))))
+                  for name in names if name != '.lock']
+        self.assertEqual(stored, [])
+
+    def test_task_of_a_crashed_worker_is_given_up(self):
+        image = self.upload()
+        for _ in range(MAX_ATTEMPTS):
+            self.assertEqual(len(claim('crashing')), 1)
+            # The worker died: its lock expires
+            ImageTask.objects.update(locked_at=timezone.now() - LOCK_TIMEOUT * 2)
+        self.assertEqual(claim('test'), [])
+        self.assertEqual(ImageTask.objects.get().attempts, MAX_ATTEMPTS)
+        image.refresh_from_db()
+        self.assertEqual(image.status, ImageStatus.FAILED)
+
+    def test_upload_is_not_kept_without_its_task(self):
+        with mock.patch.object(ImageTask.objects, 'create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.upload()
+        self.assertFalse(TimesheetImage.objects.exists())
+
+    def test_worker_makes_the_renditions(self):
+        image = self.upload()
+        run_once('test')
+        with PILImage.open(image.image.storage.path(rendition_name(image.pk, 'thumbnail'))) as thumbnail:
+            self.assertEqual(thumbnail.size, (200, 133))
+        image.refresh_from_db()
+        self.assertTrue(image.rendition_url('print').endswith(f'/renditions/{image.pk}/print.jpg'))
+
+    def get_images_page(self):
+        with translation.override('en'):
+            self.client.force_login(self.user)
+            return self.client.get(reverse('timesheet_images_detail', args=(self.timesheet.pk,)))
+
+    def test_pending_upload_is_shown_without_decoding_it(self):
+        image = self.upload()
+        self.assertContains(self.get_images_page(), image.image.url)
+        self.assertFalse(os.path.exists(image.image.storage.path(rendition_name(image.pk, 'preview'))))
+
+    def test_missing_rendition_is_made_on_first_request(self):
+        image = self.upload()
+        run_once('test')
+        path = image.image.storage.path(rendition_name(image.pk, 'preview'))
+        os.remove(path)
+        self.assertContains(self.get_images_page(), f'renditions/{image.pk}/preview.jpg')
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_resize_images_is_incremental(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (2400, 1600), 'green').save(buffer, format='PNG')
+        legacy = TimesheetImage(timesheet=self.timesheet)
+        legacy.image.save('legacy.png', ContentFile(buffer.getvalue()), save=False)
+        TimesheetImage.objects.bulk_create([legacy])
+        legacy = TimesheetImage.objects.get()
+        original = legacy.image.path
+
+        out = StringIO()
+        call_command('resize_images', workers=2, dry_run=True, stdout=out)
+        self.assertIn('1 images would be compressed', out.getvalue())
+        self.assertTrue(os.path.exists(original))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('resize_images', workers=2, stdout=StringIO())
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.processed_with, COMPRESS_PROFILE)
+        self.assertTrue(is_hashed(legacy.image.name) and legacy.image.name.endswith('.jpg'))
+        self.assertFalse(os.path.exists(original))
+        # Nothing but the stored file is left in its shard directory
+        self.assertEqual(os.listdir(os.path.dirname(legacy.image.path)), [os.path.basename(legacy.image.name)])
+
+        out = StringIO()
+        call_command('resize_images', workers=2, stdout=out)
+        self.assertIn('0 images compressed, 0 already within the profile', out.getvalue())
+
+    def test_resize_images_skips_missing_files_on_reruns(self):
+        TimesheetImage.objects.bulk_create([TimesheetImage(timesheet=self.timesheet, image='timesheet_images/gone.jpg')])
+        for options, missing in (({}, 1), ({}, 0), ({'retry_skipped': True}, 1)):
+            out = StringIO()
+            call_command('resize_images', workers=1, stdout=out, **options)
+            self.assertIn(f'{missing} missing', out.getvalue())
+        self.assertEqual(TimesheetImage.objects.get().processed_with, 'missing')
+
+    def test_unreadable_image_falls_back_to_the_original(self):
+        image = self.upload(content=b'not an image', name='broken.jpg')
+        self.assertEqual(image.rendition_url('thumbnail'), image.image.url)
+
+
+class ImageStorageTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.timesheet = self.make_timesheet()
+
+    def upload(self, content=b'same bytes', name='photo.jpg'):
+        return TimesheetImage.objects.create(timesheet=self.timesheet, image=SimpleUploadedFile(name, content))
+
+    def test_files_are_named_by_content_and_sharded(self):
+        image = self.upload()
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(image.image.name, f'timesheet_images/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+
+    def test_identical_uploads_share_a_file_until_the_last_is_deleted(self):
+        first, second = self.upload(), self.upload(name='copy.JPG')
+        self.assertEqual(first.image.name, second.image.name)
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_rolled_back_delete_keeps_the_file(self):
+        image = self.upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    image.timesheet.delete()
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+        self.assertTrue(TimesheetImage.objects.filter(pk=image.pk).exists())
+        self.assertTrue(os.path.exists(image.image.path))
+
+    def test_deduplicated_save_rewrites_a_file_released_meanwhile(self):
+        first = self.upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.upload()
+            # A release of the first image ran between the save finding the name and its commit
+            os.remove(first.image.path)
+        self.assertTrue(os.path.exists(second.image.path))
+
+    def test_migrate_image_storage_moves_and_deduplicates(self):
+        storage = TimesheetImage._meta.get_field('image').storage
+        for name in ('a.jpg', 'b.jpg'):
+            FileSystemStorage(location=storage.location).save(f'timesheet_images/{name}', ContentFile(b'legacy'))
+        TimesheetImage.objects.bulk_create([
+            TimesheetImage(timesheet=self.timesheet, image='timesheet_images/a.jpg'),
+            TimesheetImage(timesheet=self.timesheet, image='timesheet_images/b.jpg'),
+        ])
+
+        out = StringIO()
+        call_command('migrate_image_storage', dry_run=True, stdout=out)
+        self.assertIn('2 files would be moved, 1 of them duplicates', out.getvalue())
+        self.assertTrue(storage.exists('timesheet_images/a.jpg'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('migrate_image_storage', stdout=StringIO())
+        names = set(TimesheetImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(is_hashed(names.pop()))
+        self.assertEqual(os.listdir(storage.path('timesheet_images')), [hashlib.sha256(b'legacy').hexdigest()[:2]])
+
+        out = StringIO()
+        call_command('migrate_image_storage', stdout=out)
+        self.assertIn('0 files moved', out.getvalue())
+
+
+class ProtectedMediaTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, MEDIA_SERVE_HEADER='')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.image = TimesheetImage.objects.create(
+            timesheet=self.make_timesheet(), image=SimpleUploadedFile('photo.jpg', b'0123456789'),
+        )
+        self.url = self.image.image.url
+        self.client.force_login(self.user)
+
+    def test_owner_gets_the_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=-3').status_code, 206)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+
+    def test_only_the_owner_and_managers_see_the_photo(self):
+        other = User.objects.create_user(email='other@example.com', password='password', is_active=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.groups.add(Group.objects.create(name='Managers'))
+        self.client.force_login(User.objects.get(pk=other.pk))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_transfer_is_handed_to_the_proxy(self):
+        with override_settings(MEDIA_SERVE_HEADER='X-Accel-Redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.image.image.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_are_refused(self):
+        self.assertEqual(self.client.get('/media/avatars/../../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/missing.jpg').status_code, 404)
+
+
+class UploadLimitTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_login(self.user)
+
+    def jpeg(self, size=(400, 300), name='photo.jpg'):
+        buffer = BytesIO()
+        PILImage.new('RGB', size, 'green').save(buffer, format='JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def post(self, images):
+        data = {
+            'date': '2025-03-03', 'start_time': '08:00', 'end_time': '12:00',
+            'activity': self.activity.pk, 'fundssource': self.funds.pk, 'description': '', 'images': images,
+        }
+        with translation.override('en'):
+            return self.client.post(reverse('create_timesheet'), data)
+
+    def test_accepted_photos_are_stored_with_their_size(self):
+        photo = self.jpeg()
+        response = self.post([photo])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TimesheetImage.objects.get().file_size, photo.size)
+
+    @override_settings(UPLOAD_LIMITS={'photos': {'max_files': 10, 'max_file_size': 1000, 'max_request_size': 10_000}})
+    def test_oversized_file_stops_the_upload(self):
+        response = self.post([self.jpeg()])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('photo.jpg is larger than', str(response.context['form'].non_field_errors()))
+        self.assertFalse(Timesheet.objects.exists())
+
+    @override_settings(UPLOAD_LIMITS={'imports': {'max_files': 1, 'max_file_size': 100, 'max_request_size': 1000}})
+    def test_admin_import_has_its_own_limits(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='password')
+        self.client.force_login(admin)
+        csv_file = SimpleUploadedFile('entries.csv', b'user,date\n' + b'x' * 200)
+        response = self.client.post(reverse('admin:timesheet_timesheet_import'), {'file': csv_file}, follow=True)
+        self.assertContains(response, 'ntries.csv is larger than 100')
+
+    @override_settings(UPLOAD_LIMITS={'photos': {'max_files': 2, 'max_file_size': 10**6, 'max_request_size': 10**7}})
+    def test_too_many_files_stop_the_upload(self):
+        response = self.post([self.jpeg(name=f'{n}.jpg') for n in range(3)])
+        self.assertIn('At most 2 files', str(response.context['form'].non_field_errors()))
+        self.assertFalse(TimesheetImage.objects.exists())
+
+    @override_settings(UPLOAD_MAX_IMAGE_PIXELS=1_000_000)
+    def test_images_are_refused_by_their_header(self):
+        response = self.post([self.jpeg(size=(1200, 1000)), SimpleUploadedFile('notes.jpg', b'not an image')])
+        errors = str(response.context['form'].non_field_errors())
+        self.assertIn('photo.jpg has more than 1 megapixels', errors)
+        self.assertIn('notes.jpg is not an image', errors)
+        self.assertFalse(Timesheet.objects.exists())
+
+    def test_jpegs_are_decoded_at_a_reduced_scale(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (4000, 3000), 'green').save(buffer, format='JPEG')
+        with PILImage.open(buffer) as img:
+            reduce_decoding(img, 1200)
+            self.assertEqual(img.size, (2000, 1500))
+        with PILImage.open(BytesIO(compress_bytes(buffer))) as compressed:
+            self.assertEqual(compressed.size, (1200, 900))
+
+
+class ArchiveTests(TimesheetTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.delete(CUTOFF_CACHE_KEY)
+        self.addCleanup(cache.delete, CUTOFF_CACHE_KEY)
+        self.old = self.make_timesheet(day=date(2023, 12, 28), start=time(8, 0), end=time(12, 0))
+        self.image = TimesheetImage.objects.bulk_create([TimesheetImage(timesheet=self.old, image='old.jpg')])[0]
+        self.current = self.make_timesheet(day=date(2024, 1, 3), start=time(8, 0), end=time(10, 0))
+        call_command('archive_timesheets', '--before-year', '2024', stdout=StringIO())
+
+    def test_archive_moves_rows_and_keeps_totals(self):
+        self.assertEqual(list(Timesheet.objects.values_list('pk', flat=True)), [self.current.pk])
+        self.assertEqual(ArchivedTimesheet.objects.get().pk, self.old.pk)
+        self.assertEqual(TimesheetImage.objects.get().archived_timesheet_id, self.old.pk)
+        self.assertEqual(UserDayTotal.objects.get(date=date(2023, 12, 28)).worked_minutes, 240)
+
+        call_command('rebuild_day_totals', stdout=StringIO())
+        self.assertEqual(UserDayTotal.objects.get(date=date(2023, 12, 28)).worked_minutes, 240)
+
+    def test_span_reads_archive_only_when_needed(self):
+        self.assertEqual(archive_cutoff(), date(2024, 1, 1))
+        self.assertIs(span(date(2024, 1, 1), date(2024, 2, 1)).model, Timesheet)
+        self.assertIs(span(date(2023, 12, 1), date(2024, 1, 1)).model, ArchivedTimesheet)
+        across = span(date(2023, 12, 1), date(2024, 2, 1), user=self.user).order_by('date')
+        self.assertEqual([ts.pk for ts in across], [self.old.pk, self.current.pk])
+
+    def test_archived_years_are_read_only(self):
+        form = TimesheetForm(data={'date': '2023-12-29', 'start_time': '08:00', 'end_time': '10:00',
+                                   'activity': self.activity.pk, 'fundssource': self.funds.pk}, user=self.user)
+        self.assertIn('date', form.errors)
+
+
+class ConcurrentDailyLimitTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='ranger@example.com', password='password', is_active=True)
+        self.activity = Activity.objects.create(group='G1', subgroup='S1', code='A1', name='Patrulare', responsible='SP')
+        self.funds = FundsSource.objects.create(name='RNP ROMSILVA', description='')
+
+    def test_parallel_submissions_cannot_exceed_the_limit(self):
+        # Friday: 6h allowed, eight parallel 2h entries
+        barrier = threading.Barrier(8)
+        outcomes = []
+
+        def submit():
+            try:
+                barrier.wait()
+                ts = Timesheet(user=self.user, date=date(2025, 3, 7), start_time=time(8, 0), end_time=time(10, 0),
+                               activity=self.activity, fundssource=self.funds)
+                try:
+                    save_within_daily_limit(ts)
+                    outcomes.append('saved')
+                except ValidationError:
+                    outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['rejected'] * 5 + ['saved'] * 3)
+        self.assertEqual(Timesheet.objects.total_minutes(), 360)
+        self.assertEqual(UserDayTotal.objects.get().worked_minutes, 360)
@@ -0,0 +1,46 @@
+"""
+Checks on the photos uploaded with a timesheet, made before anything decodes them.
+
+Byte and count limits are enforced while the request streams in
+(general.uploads). Each photo that arrived is then opened only far enough to
+read its header: the format and pixel count decide whether it is stored and
+queued for the process_images worker, so a decompression bomb or a
+mislabelled file is refused without being decoded.
+"""
+from django.conf import settings
+from django.utils.translation import gettext as _
+from PIL import Image
+
+from general.uploads import upload_error
+
+# Formats the worker can compress; MPO is the multi-picture JPEG of some phone cameras
+IMAGE_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP'}
+
+
+def check_image(upload):
+    """Why the uploaded file is refused, from its header alone; None when it is accepted"""
+    try:
+        # Image.open reads the header; pixels are only decoded on load()
+        with Image.open(upload) as img:
+            image_format, (width, height) = img.format, img.size
+    except (OSError, Image.DecompressionBombError):
+        return _('%(name)s is not an image.') % {'name': upload.name}
+    finally:
+        upload.seek(0)
+    if image_format not in IMAGE_FORMATS:
+        return _('%(name)s is not a JPEG, PNG or WebP image.') % {'name': upload.name}
+    if width * height > settings.UPLOAD_MAX_IMAGE_PIXELS:
+        return _('%(name)s has more than %(count)d megapixels.') % {
+            'name': upload.name, 'count': settings.UPLOAD_MAX_IMAGE_PIXELS // 1_000_000,
+        }
+    return None
+
+
+def uploaded_images(request, field_name='images'):
+    """(accepted files, error messages) of the photos uploaded under field_name"""
+    stopped = upload_error(request)
+    if stopped:
+        return [], [stopped]
+    files = request.FILES.getlist(field_name)
+    errors = [error for error in map(check_image, files) if error]
+    return (files, []) if not errors else ([], errors)
@@ -1,18 +1,20 @@
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import TimesheetCalendarView, TimesheetListView, CreateTimesheetView, UpdateTimesheetView, DeleteTimesheetView, TimesheetImageDetailView
+from .views import TimesheetCalendarView, TimesheetDayView, TimesheetListView, CreateTimesheetView, WeekTimesheetView, UpdateTimesheetView, DeleteTimesheetView, TimesheetImageDetailView, timesheet_events
 from django.utils.translation import gettext_lazy as _
 
 
 urlpatterns = [
     path('', TimesheetListView.as_view(), name="timesheet_list"),
     path('calendar/', TimesheetCalendarView.as_view(), name='timesheet_calendar'),
+    path('calendar/<int:year>/<int:month>/<int:day>/', TimesheetDayView.as_view(), name='timesheet_calendar_day'),
+    path('calendar/events/', timesheet_events, name='timesheet_events'),
     path('timesheets/create/', CreateTimesheetView.as_view(), name='create_timesheet'),
+    path('timesheets/week/', WeekTimesheetView.as_view(), name='week_timesheet'),
     path('timesheets/<int:pk>/edit', UpdateTimesheetView.as_view(), name='update_timesheet'),
     path('timesheets/<int:pk>/delete', DeleteTimesheetView.as_view(), name='delete_timesheet'),
     path('timesheets/<int:pk>/images/', TimesheetListView.as_view(), name='timesheet_images'),
     path('timesheet/<int:pk>/images/', TimesheetImageDetailView.as_view(), name='timesheet_images_detail'),
 ]
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
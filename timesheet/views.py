@@ -7,223 +7,202 @@ from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from datetime import timedelta, datetime
 from django.utils import timezone
 from django.forms import ValidationError
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views import generic
-from .forms import TimesheetForm
+from .forms import TimesheetForm, WeekEntryFormSet
+from general.pagination import keyset_page
+from general.uploads import UploadLimitMixin
+from users.directory import Employee, employee_label, search as search_employees
 from users.models import CustomUser
 # from django.contrib.auth import get_user_model
-from .models import Timesheet, TimesheetImage
+from .archive import archive_cutoff, span
+from .feed import calendar_events, events_etag, parse_range
+from .models import ArchivedTimesheet, Timesheet, TimesheetImage, UserDayTotal
+from .limits import DAY_START, daily_limit_minutes, existing_day_minutes, save_within_daily_limit, serialized_user_writes
+from .month_calendar import get_month_matrix, parse_month
+from .periods import month_bounds, month_filter, range_filter, year_bounds
+from .search import MAX_HITS, search_timesheets
+from .uploads import uploaded_images
 from django.db.models import Q, Count, Sum
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.http import condition
 from calendar import monthrange
 from django.utils.dateparse import parse_date
 import datetime
 
 User = CustomUser  # Assuming you have a custom user model defined in users.models
 
-def get_user_timesheets(user):
-    """Helper function to get timesheets for the given user."""
-    timesheets = Timesheet.objects.filter(user=user).select_related('activity')
-    calendar_events = []
-
-    for t in timesheets:
-        # Get activity name safely
-        activity_name = str(t.activity) if t.activity else "No Activity"
-        
-        # Calculate duration
-        duration = 0
-        try:
-            if callable(getattr(t, 'worked_hours', None)):
-                hours_result = t.worked_hours()
-                duration = float(hours_result) if hours_result else 0
-            elif hasattr(t, 'worked_hours') and t.worked_hours is not None:
-                duration = float(t.worked_hours) if t.worked_hours else 0
-        except (TypeError, ValueError):
-            duration = 0
-        
-        hours_display = f"{duration:.1f}h"
-        
-        # Determine color class based on hours
-        if duration >= 8:
-            className = 'timesheet-event-bar high-hours'
-        elif duration >= 4:
-            className = 'timesheet-event-bar medium-hours'
-        else:
-            className = 'timesheet-event-bar low-hours'
-        
-        timesheet_event = {
-            'id': f"timesheet_{t.id}",
-            'title': f"{activity_name} ({hours_display})",
-            'start': t.date.strftime("%Y-%m-%d"),
-            'className': className,
-            'extendedProps': {
-                'activity': activity_name,
-                'hours': duration,
-                'description': str(t.description) if hasattr(t, 'description') and t.description else ""
-            }
-        }
-        calendar_events.append(timesheet_event)
-
-    return calendar_events
-
-import calendar
 from datetime import date, datetime, timedelta
 from django.utils.safestring import mark_safe
-import holidays
 
 class TimesheetCalendarView(LoginRequiredMixin, TemplateView):
     template_name = 'timesheet/calendar.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
-        # Get year and month from URL or use current
-        today = date.today()
-        year = int(self.request.GET.get('year', today.year))
-        month = int(self.request.GET.get('month', today.month))
-        
-        ro_holidays = holidays.Romania(years=year)
-
-        # Generate calendar days
-        cal = calendar.Calendar(firstweekday=0) # Monday start
-        month_days = cal.monthdatescalendar(year, month)
-        
-        # Fetch all timesheets for this user in this month at once
-        timesheets = Timesheet.objects.filter(
-            user=user, 
-            date__year=year, 
-            date__month=month
-        ).order_by('-date', '-start_time')
-        
-        # Build a dictionary of {date: total_hours}
-        daily_totals = {}
-        count_activities = {}
-        for ts in timesheets:
-            daily_totals[ts.date] = daily_totals.get(ts.date, 0) + ts.duration_decimal
-            count_activities[ts.date] = count_activities.get(ts.date, 0) + 1
-
-        # Format calendar data with status colors
-        calendar_data = []
-        for week in month_days:
-            week_data = []
-            for day in week:
-                # 1. Flag out-of-bounds padding days
-                if day.month != month:
-                    status = "muted"
-                    total_decimal = 0
-                    total_hm = ""
-                    is_holiday = False
-                    holiday_name = ""
-                else:
-                    total_decimal = daily_totals.get(day, 0)
-
-                    is_holiday = day in ro_holidays
-                    holiday_name = ro_holidays.get(day, "") if is_holiday else ""
-
-                    hours = int(total_decimal)
-                    minutes = int(round((total_decimal - hours) * 60))
-                    total_hm = f"{hours}h {minutes}m" if total_decimal > 0 else "0h"
-
-                    # Determine status color based on hours and holiday status
-                    target = 6.0 if day.weekday() == 4 else 8.5
-                    
-                    if total_decimal >= target:
-                        status = "success" # Green (worked full target hours)
-                    elif total_decimal > 0:
-                        status = "warning" # Yellow (worked partial hours)
-                    elif is_holiday:
-                        status = "info"    # Blue (legal holiday, no hours recorded)
-                    else:
-                        status = "danger"  # Red (missing working hours on regular day)
-
-                week_data.append({
-                    'day': day, 
-                    'status': status, 
-                    'total_decimal': total_decimal, 
-                    'total_hm': total_hm, 
-                    'activities': count_activities.get(day, 0),
-                    'is_holiday': is_holiday,       # Added for template matching
-                    'holiday_name': holiday_name     # Added for template matching
-                })
-            calendar_data.append(week_data)
+        year, month = parse_month(self.request.GET)
 
+        # Served from the cache until one of the month's days changes; entries load per day
         context.update({
-            'calendar_matrix': calendar_data,
+            'calendar_matrix': get_month_matrix(self.request.user.pk, year, month),
             'current_month': date(year, month, 1),
-            'timesheets': timesheets,
             'prev_month': date(year, month, 1) - timedelta(days=1),
             'next_month': date(year, month, 1) + timedelta(days=32),
         })
         return context
 
 
+class TimesheetDayView(LoginRequiredMixin, TemplateView):
+    """Entries of one calendar day, fetched when its detail panel is opened"""
+    template_name = 'timesheet/calendar_day.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            day = date(kwargs['year'], kwargs['month'], kwargs['day'])
+        except ValueError:
+            raise Http404
+        context['day'] = day
+        context['timesheets'] = span(day, day + timedelta(days=1), user=self.request.user)\
+            .select_related('user', 'activity', 'fundssource').order_by('start_time')
+        return context
+
+
+def _events_etag(request):
+    period = parse_range(request.GET)
+    if period is None or not request.user.is_authenticated:
+        return None
+    return events_etag(request.user.pk, *period)
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_events_etag)
+def timesheet_events(request):
+    """FullCalendar event source: the user's entries within ?start=&end=, 304 while unchanged"""
+    period = parse_range(request.GET)
+    if period is None:
+        return JsonResponse({'error': _('Invalid start/end range.')}, status=400)
+    return JsonResponse(calendar_events(request.user.pk, *period), safe=False)
+
+
 class TimesheetListView(LoginRequiredMixin, ListView):
     model = Timesheet
     template_name = "timesheet/timesheets_list.html"
     context_object_name = "timesheets"
     paginate_by = 25  # Increased for easier scrolling
-
-    def get_queryset(self):
+    ordering = ('-date', '-created_at', 'id')
+    list_fields = (
+        'date', 'created_at', 'duration_minutes', 'description',
+        'user__username', 'user__first_name', 'user__last_name',
+        'activity__code', 'activity__name', 'fundssource__name',
+    )
+
+    def get_period(self):
+        """[start, end) selected by the day or month filter, or None for the live entries"""
+        try:
+            date_query = parse_date(self.request.GET.get('date_filter') or '')
+            if date_query:
+                return date_query, date_query + timedelta(days=1)
+            month_date = parse_date((self.request.GET.get('month_filter') or '') + "-01")
+            if month_date:
+                return month_bounds(month_date.year, month_date.month)
+            year = self.request.GET.get('year_filter')
+            if year:
+                return year_bounds(int(year))
+        except ValueError:
+            pass  # Invalid date format, ignore the filter
+        return None
+
+    def get_user_filter(self):
+        """Who may be listed, as a condition valid on timesheets and on their day totals"""
         user = self.request.user
-        
+        condition = Q()
+
         # 1. Base Permissions: Managers see all, Reporters see only theirs
-        if user.is_staff or user.groups.filter(name='Managers').exists():
-            queryset = Timesheet.objects.all()
-        else:
-            queryset = Timesheet.objects.filter(user=user)
+        if not user.has_manager_access:
+            condition &= Q(user=user)
 
         # 2. Filter by Reporter Name (Search)
         employee_id = self.request.GET.get('reporter_id')
         if employee_id:
-            queryset = queryset.filter(user_id=employee_id)
+            condition &= Q(user_id=employee_id)
 
+        # Matched in the employee directory instead of joining the user table
         reporter_query = self.request.GET.get('reporter_name')
         if reporter_query:
-            queryset = queryset.filter(
-                Q(user__first_name__icontains=reporter_query) |
-                Q(user__last_name__icontains=reporter_query) |
-                Q(user__username__icontains=reporter_query)
-            )
-        # Allows admin to look at a specific day or month
-        date_query = self.request.GET.get('date_filter')
-
-        month_query = self.request.GET.get('month_filter')
-        if month_query:
-            try:
-                month_date = parse_date(month_query + "-01")
-                if month_date:
-                    queryset = queryset.filter(date__year=month_date.year, date__month=month_date.month)
-            except ValueError:
-                pass  # Invalid month format, ignore the filter
-        if date_query:
-            queryset = queryset.filter(date=date_query)
+            condition &= Q(user_id__in=[employee.id for employee in search_employees(reporter_query, MAX_HITS)])
+        return condition
 
-        return queryset.select_related('user', 'activity', 'fundssource')\
-                       .prefetch_related('timesheet_images')\
-                       .order_by('-date', '-created_at')
+    def get_queryset(self):
+        # Without a period only the live table is listed; a period in a closed year reads the archive
+        period = self.get_period()
+        queryset = span(*period) if period else Timesheet.objects.all()
+
+        # Only the displayed columns, and the image count instead of prefetching every image row
+        return queryset.filter(self.get_user_filter())\
+                       .select_related('user', 'activity', 'fundssource')\
+                       .only(*self.list_fields)\
+                       .annotate(image_count=Count('timesheet_images'))
+
+    def get_total_count(self):
+        """Number of listed entries, summed from the day totals instead of counting timesheet rows"""
+        period = self.get_period()
+        if period:
+            days = UserDayTotal.objects.filter(**range_filter(*period))
+        else:
+            # The day totals also cover archived days, which the unfiltered list does not show
+            cutoff = archive_cutoff()
+            days = UserDayTotal.objects.filter(date__gte=cutoff) if cutoff else UserDayTotal.objects.all()
+        return days.filter(self.get_user_filter()).aggregate(total=Sum('entry_count'))['total'] or 0
+
+    def paginate_queryset(self, queryset, page_size):
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            # Ranked search: page over the matching keys, then load only the page's rows
+            paginator = Paginator(search_timesheets(queryset, query, MAX_HITS), page_size)
+            page = paginator.get_page(self.request.GET.get('page'))
+            rows = queryset.in_bulk(page.object_list)
+            page.object_list = [rows[pk] for pk in page.object_list if pk in rows]
+            return paginator, page, page.object_list, page.has_other_pages()
+
+        # Keyset pagination: every page costs the same, however deep
+        page = keyset_page(
+            queryset, self.ordering, page_size,
+            after=self.request.GET.get('after'), before=self.request.GET.get('before'),
+        )
+        return None, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         """Passes search dropdown data and retains filter selections inside form fields"""
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        # Fill dropdown options depending on who is browsing
-        if user.is_staff or user.groups.filter(name='Managers').exists():
-            context['available_employees'] = User.objects.filter(is_active=True).order_by('first_name')
+        # Managers search employees through the autocomplete; only the selected one is rendered
+        selected_id = self.request.GET.get('reporter_id', '')
+        if user.has_manager_access:
+            context['employee_autocomplete_url'] = reverse('users:employee_autocomplete')
+            label = employee_label(selected_id)
+            context['available_employees'] = [Employee(int(selected_id), label)] if label else []
         else:
-            context['available_employees'] = User.objects.filter(id=user.id)
+            context['available_employees'] = [Employee(user.id, user.get_full_name())]
 
         # Retain filter states so values don't clear out when hitting "Apply"
         context['selected_reporter_id'] = self.request.GET.get('reporter_id', '')
         context['date_filter'] = self.request.GET.get('date_filter', '')
         context['month_filter'] = self.request.GET.get('month_filter', '')
-        
+        context['year_filter'] = self.request.GET.get('year_filter', '')
+        context['search_query'] = self.request.GET.get('q', '').strip()
+        if context['paginator']:
+            context['total_count'] = context['paginator'].count
+            context['search_capped'] = context['paginator'].count >= MAX_HITS
+        else:
+            context['total_count'] = self.get_total_count()
         return context
 
 class TimesheetImageDetailView(LoginRequiredMixin, DetailView):
@@ -234,13 +213,47 @@ class TimesheetImageDetailView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         # Security: Users can only see their own images unless they are staff/managers
         user = self.request.user
-        if user.is_staff or user.groups.filter(name='Managers').exists():
+        if user.has_manager_access:
             return Timesheet.objects.all()
         return Timesheet.objects.filter(user=user)
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Entries of closed years keep their id in the archive
+            archived = ArchivedTimesheet.objects.all()
+            if not self.request.user.has_manager_access:
+                archived = archived.filter(user=self.request.user)
+            return super().get_object(archived)
+
+
+class DailyLimitSaveMixin(UploadLimitMixin):
+    """Save path shared by the create and update views"""
+    upload_limits = 'photos'
+    images = ()
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        if self.request.method == 'POST':
+            # Refused uploads invalidate the form before anything is saved
+            self.images, errors = uploaded_images(self.request)
+            for error in errors:
+                form.add_error(None, error)
+        return form
+
+    def save_timesheet(self, form):
+        """Saves self.object within the daily limit; on a lost race adds the error to the form"""
+        try:
+            save_within_daily_limit(self.object)
+        except ValidationError as exc:
+            form.add_error('end_time', exc)
+            return False
+        return True
+
 
 # new timesheet
-class CreateTimesheetView(generic.CreateView):
+class CreateTimesheetView(DailyLimitSaveMixin, generic.CreateView):
     template_name = "timesheet/create_timesheets.html"
     form_class = TimesheetForm
 
@@ -260,7 +273,7 @@ class CreateTimesheetView(generic.CreateView):
 
     def form_valid(self, form):
         user = self.request.user
-        is_manager = user.is_staff or user.groups.filter(name='Managers').exists()
+        is_manager = user.has_manager_access
         
         if not form.cleaned_data.get('activity'):
             form.add_error('activity', _('O activitate validă este obligatorie.'))
@@ -276,12 +289,12 @@ class CreateTimesheetView(generic.CreateView):
             self.object.user = user
 
 
-        # Save the object
-        self.object.save()
+        # Save the object, re-checking the daily limit under the user's write lock
+        if not self.save_timesheet(form):
+            return self.form_invalid(form)
 
-        # Handle multiple image uploads
-        files = self.request.FILES.getlist('images')
-        for f in files:
+        # Handle multiple image uploads, checked in get_form
+        for f in self.images:
             TimesheetImage.objects.create(timesheet=self.object, image=f)
 
         messages.success(self.request, _('Timesheet created successfully!'))
@@ -301,7 +314,117 @@ class CreateTimesheetView(generic.CreateView):
         return super().form_invalid(form)
 
 
-class UpdateTimesheetView(LoginRequiredMixin, generic.UpdateView):
+class WeekTimesheetView(LoginRequiredMixin, TemplateView):
+    """
+    Weekly grid: many entries validated against one UserDayTotal query and
+    inserted with a single bulk_create. Also accepts a JSON body
+    {"week": "YYYY-MM-DD", "entries": [{"date": ..., "start_time": ..., ...}]}.
+    """
+    template_name = 'timesheet/week_entry.html'
+    row_fields = ('date', 'start_time', 'end_time', 'activity', 'fundssource', 'description')
+
+    def get_week_start(self, value=None):
+        try:
+            day = parse_date(value or self.request.GET.get('week') or '') or date.today()
+        except (TypeError, ValueError):
+            day = date.today()
+        return day - timedelta(days=day.weekday())
+
+    def wants_json(self):
+        return (self.request.content_type == 'application/json'
+                or 'application/json' in self.request.headers.get('Accept', ''))
+
+    def initial_rows(self, week_start):
+        rows = []
+        for offset in range(7):
+            day = week_start + timedelta(days=offset)
+            # The day's whole limit from the usual start: 16:30, or 14:00 on Fridays
+            start = datetime.combine(day, DAY_START)
+            rows.append({
+                'date': day,
+                'start_time': start.strftime('%H:%M'),
+                'end_time': (start + timedelta(minutes=daily_limit_minutes(day))).strftime('%H:%M'),
+            })
+        return rows
+
+    def get_context_data(self, formset=None, week_start=None, **kwargs):
+        context = super().get_context_data(**kwargs)
+        week_start = week_start or self.get_week_start()
+        days = [week_start + timedelta(days=offset) for offset in range(7)]
+        if formset is None:
+            formset = WeekEntryFormSet(initial=self.initial_rows(week_start), user=self.request.user)
+        booked = existing_day_minutes(self.request.user, days)
+        context.update({
+            'formset': formset,
+            'week_start': week_start,
+            'week_end': days[-1],
+            'prev_week': week_start - timedelta(days=7),
+            'next_week': week_start + timedelta(days=7),
+            'week_days': [
+                {'day': day, 'booked': booked.get(day, 0), 'limit': daily_limit_minutes(day)} for day in days
+            ],
+        })
+        return context
+
+    def json_to_formset_data(self, payload):
+        """Formset data of a {"week", "entries": [{...}]} payload; None when it has another shape"""
+        if not isinstance(payload, dict):
+            return None
+        entries = payload.get('entries') or []
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            return None
+        data = {
+            'form-TOTAL_FORMS': str(len(entries)),
+            'form-INITIAL_FORMS': '0',
+        }
+        for index, entry in enumerate(entries):
+            for field in self.row_fields:
+                value = entry.get(field)
+                if value is not None:
+                    data[f'form-{index}-{field}'] = value
+        return data
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type == 'application/json':
+            try:
+                payload = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'error': _('JSON invalid.')}, status=400)
+            data = self.json_to_formset_data(payload)
+            if data is None:
+                return JsonResponse({'error': _('JSON invalid.')}, status=400)
+            week_start = self.get_week_start(payload.get('week'))
+        else:
+            data = request.POST
+            week_start = self.get_week_start(request.POST.get('week'))
+
+        formset = WeekEntryFormSet(data, user=request.user, week_start=week_start)
+        # Validated and inserted under the user's write lock, so a concurrent save cannot slip in between
+        with serialized_user_writes(request.user.pk):
+            if formset.is_valid():
+                created = Timesheet.objects.bulk_create(formset.build_timesheets())
+
+        if not formset.is_valid():
+            if self.wants_json():
+                return JsonResponse({
+                    'errors': [
+                        {'row': index, 'errors': form.errors.get_json_data()}
+                        for index, form in enumerate(formset.forms) if form.errors
+                    ],
+                    'non_field_errors': formset.non_form_errors().get_json_data(),
+                }, status=400)
+            messages.error(request, _('Please correct the errors below.'))
+            return self.render_to_response(self.get_context_data(formset=formset, week_start=week_start))
+
+        if self.wants_json():
+            return JsonResponse({'created': len(created)}, status=201)
+        messages.success(request, _('%(count)d timesheets created successfully!') % {'count': len(created)})
+        return HttpResponseRedirect(
+            f"{reverse('timesheet_calendar')}?month={week_start.month}&year={week_start.year}"
+        )
+
+
+class UpdateTimesheetView(LoginRequiredMixin, DailyLimitSaveMixin, generic.UpdateView):
     model = Timesheet
     form_class = TimesheetForm
     template_name = 'timesheet/update_timesheets.html'
@@ -321,13 +444,13 @@ class UpdateTimesheetView(LoginRequiredMixin, generic.UpdateView):
 
         if not form.cleaned_data.get('user'):
             self.object.user = self.get_object().user
-        
-        self.object.save()
+
+        if not self.save_timesheet(form):
+            return self.form_invalid(form)
         form.save_m2m()
 
-        # Handle image uploads
-        images = self.request.FILES.getlist('images')
-        for image in images:
+        # Handle image uploads, checked in get_form
+        for image in self.images:
             TimesheetImage.objects.create(timesheet=self.object, image=image)
 
         messages.success(self.request, 'Timesheet updated successfully!')
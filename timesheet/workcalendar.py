@@ -0,0 +1,160 @@
+"""
+Working-day calendar: what kind of day every date is and how many minutes it allows.
+
+Each year is computed once into a WorkYear: one byte per day for the DayType
+(working, weekend, legal holiday, organisation closure), an array of daily
+minute limits (8h30, 6h on Fridays) and the names of the holidays and closures.
+Years are memoized per process and shared through the cache under a version
+number bumped once a ClosureDay save or delete commits, and started again from
+the clock when the cache lost it. A process re-checks that
+version at most every VERSION_CHECK_SECONDS, so hot loops (imports, limit
+checks) do not pay a cache round trip per day.
+"""
+import time
+from array import array
+from datetime import date, timedelta
+from enum import IntEnum
+
+import holidays
+from django.core.cache import cache
+
+from dashboard.models import ClosureDay
+
+VERSION_KEY = 'workcalendar:version'
+YEAR_KEY = 'workcalendar:{version}:{year}'
+VERSION_CHECK_SECONDS = 30
+
+WEEKDAY_LIMIT_MINUTES = 510
+FRIDAY_LIMIT_MINUTES = 360
+
+
+class DayType(IntEnum):
+    WORKING = 0
+    WEEKEND = 1
+    HOLIDAY = 2
+    CLOSURE = 3
+
+
+class WorkYear:
+    """Precomputed day types and limits of one calendar year"""
+    __slots__ = ('year', 'first_ordinal', 'types', 'limits', 'names')
+
+    def __init__(self, year, closures=()):
+        self.year = year
+        self.first_ordinal = date(year, 1, 1).toordinal()
+        legal = holidays.Romania(years=year)
+        closures = dict(closures)
+
+        types = bytearray()
+        limits = array('H')
+        self.names = {}
+        day = date(year, 1, 1)
+        while day.year == year:
+            index = len(types)
+            if day in legal:
+                types.append(DayType.HOLIDAY)
+                self.names[index] = legal.get(day)
+            elif day in closures:
+                types.append(DayType.CLOSURE)
+                self.names[index] = closures[day]
+            elif day.weekday() >= 5:
+                types.append(DayType.WEEKEND)
+            else:
+                types.append(DayType.WORKING)
+            # The weekend falls back to the weekday limit
+            limits.append(FRIDAY_LIMIT_MINUTES if day.weekday() == 4 else WEEKDAY_LIMIT_MINUTES)
+            day += timedelta(days=1)
+        self.types = bytes(types)
+        self.limits = limits
+
+    def _index(self, day):
+        return day.toordinal() - self.first_ordinal
+
+    def day_type(self, day):
+        return DayType(self.types[self._index(day)])
+
+    def is_working_day(self, day):
+        return self.types[self._index(day)] == DayType.WORKING
+
+    def is_day_off(self, day):
+        """Legal holiday or organisation closure"""
+        return self.types[self._index(day)] in (DayType.HOLIDAY, DayType.CLOSURE)
+
+    def day_name(self, day):
+        return self.names.get(self._index(day), "")
+
+    def limit_minutes(self, day):
+        return self.limits[self._index(day)]
+
+    def target_hours(self, day):
+        """Hours expected on the day for the calendar colours"""
+        return self.limit_minutes(day) / 60
+
+    def month_slice(self, month):
+        start = self._index(date(self.year, month, 1))
+        end = self._index(date(self.year + 1, 1, 1) if month == 12 else date(self.year, month + 1, 1))
+        return start, end
+
+    def working_days(self, month):
+        start, end = self.month_slice(month)
+        return self.types[start:end].count(DayType.WORKING)
+
+
+_years = {}
+_version = {'value': None, 'checked': 0.0}
+
+
+def current_version():
+    now = time.monotonic()
+    if _version['value'] is None or now - _version['checked'] > VERSION_CHECK_SECONDS:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            seed = time.time_ns()
+            cache.add(VERSION_KEY, seed, None)
+            version = cache.get(VERSION_KEY, seed)
+        if version != _version['value']:
+            _years.clear()
+        _version.update(value=version, checked=now)
+    return _version['value']
+
+
+def bump_version():
+    """Called once a closure day change commits"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    _version['value'] = None
+    _years.clear()
+
+
+def work_year(year):
+    version = current_version()
+    cached = _years.get(year)
+    if cached is not None:
+        return cached
+
+    key = YEAR_KEY.format(version=version, year=year)
+    cached = cache.get(key)
+    if cached is None:
+        closures = ClosureDay.objects.filter(date__year=year).values_list('date', 'name')
+        cached = WorkYear(year, closures)
+        cache.set(key, cached, 30 * 24 * 3600)
+    _years[year] = cached
+    return cached
+
+
+def working_days(year, month):
+    return work_year(year).working_days(month)
+
+
+def standard_day_hours(start, end):
+    """Hours of the average working day between two dates (inclusive), from the daily limits"""
+    limits = []
+    day = start
+    while day <= end:
+        year = work_year(day.year)
+        if year.is_working_day(day):
+            limits.append(year.limit_minutes(day))
+        day += timedelta(days=1)
+    return (sum(limits) / len(limits) if limits else WEEKDAY_LIMIT_MINUTES) / 60
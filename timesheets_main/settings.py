@@ -96,6 +96,7 @@ MIDDLEWARE = [
     # --------caching middleware-------------------
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.RoleCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # -----------authentication---------------------
     'axes.middleware.AxesMiddleware',
@@ -188,6 +189,22 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
 MEDIA_URL = '/media/'
+# Media is permission-checked by general.media; the front-end server then sends the file when
+# this names its header: 'X-Accel-Redirect' (nginx: internal location MEDIA_ACCEL_PREFIX aliased
+# to MEDIA_ROOT) or 'X-Sendfile' (Apache, lighttpd). Empty: Django streams the file itself.
+MEDIA_SERVE_HEADER = os.environ.get("MEDIA_SERVE_HEADER", "")
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/protected-media/")
+# Uploads above 1 MB are spooled to temporary files. Views wrapped in general.uploads.limit_uploads
+# stop a request at the first of their UPLOAD_LIMITS it breaks; other forms have no such limits.
+# timesheet.uploads also refuses photos above UPLOAD_MAX_IMAGE_PIXELS by their header, before decoding.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+UPLOAD_LIMITS = {
+    # Photos of the timesheet create and update views
+    'photos': {'max_files': 10, 'max_file_size': 15 * 1024 * 1024, 'max_request_size': 60 * 1024 * 1024},
+    # The admin timesheet import: one spreadsheet, possibly a year of entries
+    'imports': {'max_files': 1, 'max_file_size': 100 * 1024 * 1024, 'max_request_size': 100 * 1024 * 1024},
+}
+UPLOAD_MAX_IMAGE_PIXELS = 40_000_000
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 SESSION_SAVE_EVERY_REQUEST = True
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.views.static import serve
+from general.media import protected_media
 from django.conf.urls.i18n import i18n_patterns
 from django.conf import settings
 from django.conf.urls.static import static
@@ -22,14 +22,8 @@ urlpatterns += i18n_patterns(
     path('documents/', include('registries.urls')),
 )
 
-# ------------add custom media path for production mode-----------
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-
-# Option B: For production with custom view
-else:
-    urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-    ]
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+# ------------media is permission-checked in every mode-----------
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.*)$', protected_media, name='protected_media'),
+]
+urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
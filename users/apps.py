@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'users'
\ No newline at end of file
+    name = 'users'
+
+    def ready(self):
+        from . import directory, roles  # noqa: F401
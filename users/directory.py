@@ -0,0 +1,137 @@
+"""
+In-memory employee directory behind the employee autocomplete.
+
+Active users are kept per process as (id, label) tuples in display order plus a
+sorted list of (search token, position) pairs, so a prefix search is a bisect
+instead of a LIKE scan. The index is shared through the cache under a version
+number that user saves and deletes bump once committed; logins (last_login
+only) do not. A version lost from the cache starts again from the clock.
+"""
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+VERSION_KEY = 'employees:version'
+DATA_KEY = 'employees:index:{}'
+# Saves limited to other fields leave the index untouched
+INDEXED_FIELDS = {'first_name', 'last_name', 'email', 'username', 'is_active'}
+MAX_RESULTS = 50
+
+Employee = namedtuple('Employee', 'id label')
+EmployeeIndex = namedtuple('EmployeeIndex', 'employees positions tokens')
+
+_local = {'version': None, 'index': None}
+
+
+def normalize(text):
+    """Lowercase without diacritics, so 'stefan' finds 'Ștefan'"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def search_tokens(first_name, last_name, email, username):
+    tokens = set(normalize(f"{first_name} {last_name}").split())
+    email = normalize(email)
+    tokens.add(email)
+    tokens.update(part for part in email.split('@')[0].replace('_', '.').replace('-', '.').split('.') if part)
+    if username:
+        tokens.add(normalize(username))
+    return tokens
+
+
+def build_index():
+    users = get_user_model().objects.filter(is_active=True).order_by('last_name', 'first_name', 'email')
+    employees, tokens = [], []
+    for pk, first_name, last_name, email, username in users.values_list(
+        'pk', 'first_name', 'last_name', 'email', 'username'
+    ):
+        position = len(employees)
+        employees.append(Employee(pk, f"{first_name} {last_name}".strip() or email))
+        tokens.extend((token, position) for token in search_tokens(first_name, last_name, email, username))
+    tokens.sort()
+    return EmployeeIndex(tuple(employees), {e.id: i for i, e in enumerate(employees)}, tuple(tokens))
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        seed = time.time_ns()
+        cache.add(VERSION_KEY, seed, None)
+        version = cache.get(VERSION_KEY, seed)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    _local['version'] = None
+
+
+def get_index():
+    version = current_version()
+    if _local['version'] == version:
+        return _local['index']
+
+    index = cache.get(DATA_KEY.format(version))
+    if index is None:
+        index = build_index()
+        cache.set(DATA_KEY.format(version), index, 24 * 3600)
+    _local.update(version=version, index=index)
+    return index
+
+
+def _prefix_positions(tokens, prefix):
+    positions = set()
+    start = bisect_left(tokens, (prefix,))
+    for token, position in tokens[start:]:
+        if not token.startswith(prefix):
+            break
+        positions.add(position)
+    return positions
+
+
+def search(query, limit=20):
+    """Active employees whose name/email words start with every word of the query"""
+    index = get_index()
+    words = normalize(query).split()
+    if not words:
+        return list(index.employees[:limit])
+
+    matches = None
+    for word in words:
+        found = _prefix_positions(index.tokens, word)
+        matches = found if matches is None else matches & found
+        if not matches:
+            return []
+    return [index.employees[position] for position in sorted(matches)[:limit]]
+
+
+def employee_label(pk):
+    """Display label of an active employee, '' when unknown"""
+    index = get_index()
+    try:
+        position = index.positions.get(int(pk))
+    except (TypeError, ValueError):
+        return ''
+    return index.employees[position].label if position is not None else ''
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or INDEXED_FIELDS & set(update_fields):
+        # Before the commit, another process would cache the old rows under the new version
+        transaction.on_commit(bump_version)
+
+
+@receiver(post_delete, sender=get_user_model())
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(bump_version)
@@ -7,6 +7,8 @@ from timesheets_main import settings
 from .models import CustomUser
 from django.contrib.auth import get_user_model  # why this here?
 from django.utils.translation import gettext_lazy as _
+from general.widgets import AutocompleteSelect
+from .directory import employee_label
 
 User = get_user_model()  # why this?
 
@@ -240,4 +242,20 @@ class AdminUserForm(forms.ModelForm):
             'placeholder': _('...'),
         })
 
-UserManagementForm = AdminUserForm
\ No newline at end of file
+UserManagementForm = AdminUserForm
+
+
+class EmployeeAutocompleteSelect(AutocompleteSelect):
+    """Employee picker filled from the employee autocomplete endpoint"""
+    url_name = 'users:employee_autocomplete'
+
+    def label_for(self, value):
+        return employee_label(value)
+
+
+class EmployeeChoiceField(forms.ModelChoiceField):
+    """Active employee picked through the autocomplete; only the submitted id is validated"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('widget', EmployeeAutocompleteSelect(attrs={'class': 'form-control'}))
+        super().__init__(queryset=CustomUser.objects.filter(is_active=True), **kwargs)
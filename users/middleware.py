@@ -0,0 +1,22 @@
+from . import roles
+
+
+class RoleCacheMiddleware:
+    """
+    Restores the user's manager-group membership from the session before the
+    view runs and saves a freshly resolved one afterwards. Goes after
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        authenticated = request.user.is_authenticated
+        if authenticated:
+            roles.restore(request)
+        response = self.get_response(request)
+        # The view may have logged the user in or out
+        if authenticated and request.user.is_authenticated:
+            roles.remember(request)
+        return response
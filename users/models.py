@@ -8,6 +8,10 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Groups granting manager access: the legacy 'Managers' group and the groups
+# assign_role_permissions() creates from the roles
+MANAGER_GROUPS = ('Managers', 'MANAGER', 'ADMIN')
+
 class CustomUserManager(BaseUserManager):
     """
     Custom manager where email is the unique identifier
@@ -68,6 +72,9 @@ class CustomUser(AbstractUser):
         default=Role.REPORTER
     )
 
+    # Set by in_manager_group on first use, or restored by users.roles
+    _in_manager_group = None
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
@@ -117,6 +124,21 @@ class CustomUser(AbstractUser):
     def is_reporter(self):
         return self.role == self.Role.REPORTER and not self.is_superuser
 
+    @property
+    def in_manager_group(self):
+        """
+        Membership of one of MANAGER_GROUPS. Queried at most once per instance (so
+        once per request); users.roles restores it from the session between requests.
+        """
+        if self._in_manager_group is None:
+            self._in_manager_group = self.groups.filter(name__in=MANAGER_GROUPS).exists()
+        return self._in_manager_group
+
+    @property
+    def has_manager_access(self):
+        """Sees and manages everyone's timesheets: staff, admins and managers by role or group"""
+        return self.is_staff or self.is_admin or self.is_manager or self.in_manager_group
+
     def assign_initial_group(self):
         """Assign user to REPORTER group by default"""
         try:
@@ -0,0 +1,76 @@
+"""
+Session cache of the role resolution behind CustomUser.has_manager_access.
+
+role, is_staff and is_superuser come with the user row every request loads
+anyway; only the group membership (CustomUser.in_manager_group) costs a query.
+Its result is kept in the session next to a version number from the shared
+cache, so it is resolved once per session rather than once per check. Group
+membership changes and group renames or deletions bump the version once they
+commit. A resolution is stored under the version read when the request started,
+so one made before a change never passes for current after it. A version lost
+from the cache is started again from the clock, never from a number an older
+session may still hold.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+VERSION_KEY = 'roles:version'
+SESSION_KEY = '_manager_group'
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        seed = time.time_ns()
+        cache.add(VERSION_KEY, seed, None)
+        version = cache.get(VERSION_KEY, seed)
+    return version
+
+
+def bump_version():
+    """Invalidates every session's cached membership"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def restore(request):
+    """Seeds request.user with the membership cached in the session, if still current"""
+    # Read before anything is resolved: remember() stores the resolution under it
+    request._role_version = current_version()
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached[0] == request.user.pk and cached[1] == request._role_version:
+        request.user._in_manager_group = cached[2]
+
+
+def remember(request):
+    """Stores the membership resolved during the request, when it changed"""
+    resolved = getattr(request.user, '_in_manager_group', None)
+    version = getattr(request, '_role_version', None)
+    if resolved is None or version is None:
+        return
+    entry = [request.user.pk, version, resolved]
+    if request.session.get(SESSION_KEY) != entry:
+        request.session[SESSION_KEY] = entry
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def memberships_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # Once committed, or requests in between would resolve the old rows again
+        transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, created=False, **kwargs):
+    # A new group has no members yet
+    if not created:
+        transaction.on_commit(bump_version)
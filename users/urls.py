@@ -1,9 +1,8 @@
-from django.urls import path, include, re_path
+from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
-from django.views.static import serve
-from .views import CredentialsEditView, CustomLogoutView, UserUpdateView, UserDeleteView, CustomSignupView, CustomLoginView, CustomPasswordChangeView, ProfileView, ProfileEditView, UserListView
+from .views import CredentialsEditView, CustomLogoutView, UserUpdateView, UserDeleteView, CustomSignupView, CustomLoginView, CustomPasswordChangeView, ProfileView, ProfileEditView, UserListView, EmployeeAutocompleteView
 from django.utils.translation import gettext_lazy as _
 
 app_name = 'users'
@@ -18,6 +17,7 @@ urlpatterns = [
     path('user_management/', UserListView.as_view(), name='user_management'),
     path('user/<int:pk>/update/', UserUpdateView.as_view(), name='user_update'),
     path('user/<int:pk>/delete/', UserDeleteView.as_view(), name='user_delete'),
+    path('employees/autocomplete/', EmployeeAutocompleteView.as_view(), name='employee_autocomplete'),
     # path('password/<pk:id>/change_password/', CustomPasswordChangeView.as_view(), name='password_change'),
 #     path('profile/<int:pk>/delete/', ProfileEditView.as_view(), name='user_delete'),
     # password reset urls
@@ -35,13 +35,4 @@ urlpatterns = [
          name='password_reset_complete'),
 
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-
-# Option B: For production with custom view
-else:
-    urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-    ]
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
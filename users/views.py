@@ -12,6 +12,8 @@ from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.contrib import messages
 from .models import *
+from .directory import MAX_RESULTS, search
+from django.http import JsonResponse
 from axes.decorators import axes_dispatch
 
 
@@ -251,3 +253,21 @@ class UserDeleteView(LoginRequiredMixin, UserPassesTestMixin, generic.DeleteView
         return response
 
 
+# ==============employee autocomplete============
+class EmployeeAutocompleteView(LoginRequiredMixin, UserPassesTestMixin, generic.View):
+    """
+    JSON prefix search over active employees' names and emails, served from the
+    in-memory directory: ?q=<words>&limit=<n> -> {"results": [{"id", "text"}]}
+    """
+
+    def test_func(self):
+        user = self.request.user
+        return user.has_manager_access
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), MAX_RESULTS)
+        except ValueError:
+            limit = 20
+        employees = search(request.GET.get('q', ''), limit=limit)
+        return JsonResponse({'results': [{'id': e.id, 'text': e.label} for e in employees]})